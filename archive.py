@@ -0,0 +1,276 @@
+import base64
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+
+import atomic
+import evtx_parser
+
+# Deduplicated archive of .evtx snapshots. Consecutive `wevtutil epl` exports
+# of a channel share all but their last few 64 KB chunks, so each snapshot is
+# split into its file header and chunks; every distinct chunk is stored once
+# under its SHA-256 and a snapshot becomes a small JSON manifest. Snapshots
+# can be reassembled byte for byte, or rebuilt from a record range with the
+# file header fixed up to match the chunks it now holds.
+
+ZERO_CHUNK = bytes(evtx_parser.CHUNK_SIZE)
+
+
+class SnapshotStore:
+    """Content-addressed chunk store plus one manifest per snapshot."""
+
+    def __init__(self, root, compress=True):
+        self.root = root
+        self.compress = compress
+        self.chunk_dir = os.path.join(root, 'chunks')
+        self.manifest_dir = os.path.join(root, 'manifests')
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        os.makedirs(self.manifest_dir, exist_ok=True)
+
+    # -- chunks -------------------------------------------------------------
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunk_dir, digest[:2], digest)
+
+    def has_chunk(self, digest):
+        return os.path.exists(self._chunk_path(digest))
+
+    def put_chunk(self, data):
+        """Store `data` unless it is already present; returns (digest, bytes written).
+
+        The chunk is fsynced before this returns.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        try:
+            if os.path.getsize(path) > 0:
+                return digest, 0
+            # Emptied by a crash before chunks were fsynced; write it again
+        except FileNotFoundError:
+            pass
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+            atomic.sync_folder(self.chunk_dir)
+        blob = zlib.compress(data, 1 if self.compress else 0)
+        atomic.write(path, blob)
+        return digest, len(blob)
+
+    def get_chunk(self, digest):
+        with open(self._chunk_path(digest), 'rb') as f:
+            blob = f.read()
+        data = zlib.decompress(blob)
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise evtx_parser.EvtxFormatError(f"Archived chunk {digest} is corrupt")
+        return data
+
+    def chunk_digests(self):
+        for folder in os.listdir(self.chunk_dir):
+            path = os.path.join(self.chunk_dir, folder)
+            if os.path.isdir(path):
+                for name in os.listdir(path):
+                    if not name.startswith('.'):
+                        yield name
+
+    # -- snapshots ----------------------------------------------------------
+
+    def _manifest_path(self, name):
+        return os.path.join(self.manifest_dir, f"{name}.json")
+
+    def add(self, path, name=None):
+        """Archive the .evtx at `path`; returns its manifest with write statistics.
+
+        Every chunk and the manifest are on disk when this returns, so the
+        caller may delete `path`.
+        """
+        name = name or os.path.splitext(os.path.basename(path))[0]
+        whole = hashlib.sha256()
+        slots = []
+        new_chunks = written = 0
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < evtx_parser.FILE_HEADER_SIZE:
+                raise evtx_parser.EvtxFormatError(f"{path} is too small to be an EVTX file")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                header = view[:evtx_parser.FILE_HEADER_SIZE]
+                evtx_parser.parse_file_header(header)
+                whole.update(header)
+                offset = evtx_parser.FILE_HEADER_SIZE
+                while offset + evtx_parser.CHUNK_SIZE <= size:
+                    chunk = view[offset:offset + evtx_parser.CHUNK_SIZE]
+                    whole.update(chunk)
+                    offset += evtx_parser.CHUNK_SIZE
+                    if chunk == ZERO_CHUNK:
+                        # Unused slot at the end of a preallocated log
+                        slots.append(None)
+                        continue
+                    first, last = struct.unpack_from('<QQ', chunk, 8)
+                    digest, stored = self.put_chunk(chunk)
+                    new_chunks += stored > 0
+                    written += stored
+                    slots.append([digest, first, last])
+                tail = view[offset:size]
+                whole.update(tail)
+        manifest = {
+            'name': name,
+            'size': size,
+            'sha256': whole.hexdigest(),
+            'header': base64.b64encode(zlib.compress(header, 9)).decode('ascii'),
+            'chunks': slots,
+            'tail': base64.b64encode(tail).decode('ascii'),
+        }
+        atomic.write(self._manifest_path(name), json.dumps(manifest).encode('utf-8'))
+        manifest['new_chunks'] = new_chunks
+        manifest['bytes_written'] = written
+        logging.info(f"Archived {name}: {sum(1 for s in slots if s)} chunks, {new_chunks} new, {written} bytes written")
+        return manifest
+
+    def manifest(self, name):
+        with open(self._manifest_path(name), 'r') as f:
+            return json.load(f)
+
+    def names(self):
+        return sorted(n[:-5] for n in os.listdir(self.manifest_dir) if n.endswith('.json') and not n.startswith('.'))
+
+    def remove(self, name):
+        os.remove(self._manifest_path(name))
+
+    def iter_bytes(self, name):
+        """Yield the original file contents piece by piece."""
+        manifest = self.manifest(name)
+        yield zlib.decompress(base64.b64decode(manifest['header']))
+        for slot in manifest['chunks']:
+            yield self.get_chunk(slot[0]) if slot else ZERO_CHUNK
+        yield base64.b64decode(manifest['tail'])
+
+    def restore(self, name, path):
+        """Write a byte-identical copy of the snapshot to `path`."""
+        manifest = self.manifest(name)
+        whole = hashlib.sha256()
+        with open(path, 'wb') as f:
+            for piece in self.iter_bytes(name):
+                whole.update(piece)
+                f.write(piece)
+        if whole.hexdigest() != manifest['sha256']:
+            raise evtx_parser.EvtxFormatError(f"Restored {name} does not match its recorded hash")
+        return manifest['size']
+
+    def extract(self, name, path, first_record=None, last_record=None):
+        """Write a valid .evtx holding only the chunks overlapping a record-ID range.
+
+        The file header is rewritten (chunk count, last chunk, next record ID and
+        checksum) so the result opens like any other export.
+        """
+        manifest = self.manifest(name)
+        header = bytearray(zlib.decompress(base64.b64decode(manifest['header'])))
+        selected = [slot for slot in manifest['chunks'] if slot
+                    and (first_record is None or slot[2] >= first_record)
+                    and (last_record is None or slot[1] <= last_record)]
+        with open(path, 'wb') as f:
+            f.write(bytes(evtx_parser.FILE_HEADER_SIZE))
+            for digest, _, _ in selected:
+                f.write(self.get_chunk(digest))
+            next_record = max((slot[2] for slot in selected), default=0) + 1
+            struct.pack_into('<QQQ', header, 8, 0, max(len(selected) - 1, 0), next_record)
+            struct.pack_into('<H', header, 42, len(selected))
+            # A rebuilt file was closed cleanly
+            flags, = struct.unpack_from('<I', header, 120)
+            struct.pack_into('<I', header, 120, flags & ~0x1)
+            struct.pack_into('<I', header, 124, evtx_parser.file_header_checksum(header))
+            f.seek(0)
+            f.write(header)
+        return len(selected)
+
+    # -- maintenance --------------------------------------------------------
+
+    def gc(self):
+        """Delete chunks no manifest references; returns (chunks removed, bytes freed)."""
+        referenced = set()
+        for name in self.names():
+            referenced.update(slot[0] for slot in self.manifest(name)['chunks'] if slot)
+        removed = freed = 0
+        for digest in list(self.chunk_digests()):
+            if digest not in referenced:
+                path = self._chunk_path(digest)
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+        return removed, freed
+
+    def stats(self):
+        logical = 0
+        references = 0
+        for name in self.names():
+            manifest = self.manifest(name)
+            logical += manifest['size']
+            references += sum(1 for slot in manifest['chunks'] if slot)
+        chunks = 0
+        physical = 0
+        for digest in self.chunk_digests():
+            chunks += 1
+            physical += os.path.getsize(self._chunk_path(digest))
+        for entry in os.scandir(self.manifest_dir):
+            physical += entry.stat().st_size
+        return {
+            'snapshots': len(self.names()),
+            'chunk_references': references,
+            'unique_chunks': chunks,
+            'logical_bytes': logical,
+            'stored_bytes': physical,
+            'dedup_ratio': references / chunks if chunks else 0.0,
+            'space_saving': logical / physical if physical else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Deduplicated .evtx snapshot archive")
+    parser.add_argument("--store", default="evtx/store", help="Archive directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Archive .evtx files")
+    add.add_argument("files", nargs="+")
+    add.add_argument("--remove", action="store_true", help="Delete each file once archived")
+    commands.add_parser("list", help="List archived snapshots")
+    restore = commands.add_parser("restore", help="Reassemble a snapshot byte for byte")
+    restore.add_argument("name")
+    restore.add_argument("output")
+    extract = commands.add_parser("extract", help="Rebuild a snapshot limited to a record-ID range")
+    extract.add_argument("name")
+    extract.add_argument("output")
+    extract.add_argument("--first", type=int)
+    extract.add_argument("--last", type=int)
+    remove = commands.add_parser("remove", help="Drop snapshots (run gc afterwards)")
+    remove.add_argument("names", nargs="+")
+    commands.add_parser("gc", help="Delete unreferenced chunks")
+    commands.add_parser("stats", help="Show dedup statistics")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = SnapshotStore(args.store)
+    if args.command == "add":
+        for path in args.files:
+            store.add(path)
+            if args.remove:
+                os.remove(path)
+    elif args.command == "list":
+        for name in store.names():
+            manifest = store.manifest(name)
+            print(f"{name}\t{manifest['size']}\t{sum(1 for s in manifest['chunks'] if s)} chunks")
+    elif args.command == "restore":
+        store.restore(args.name, args.output)
+    elif args.command == "extract":
+        count = store.extract(args.name, args.output, args.first, args.last)
+        print(f"Wrote {count} chunks to {args.output}")
+    elif args.command == "remove":
+        for name in args.names:
+            store.remove(name)
+    elif args.command == "gc":
+        removed, freed = store.gc()
+        print(f"Removed {removed} unreferenced chunks, freed {freed} bytes")
+    elif args.command == "stats":
+        print(json.dumps(store.stats(), indent=2))
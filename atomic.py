@@ -0,0 +1,51 @@
+import contextlib
+import os
+import tempfile
+
+# Atomic file replacement. New content is written to a temporary file in the
+# target's folder, flushed and fsynced, and only then renamed over the target,
+# so a crash leaves either the old file or the complete new one, never a torn
+# or empty file. Where the platform allows it the folder is fsynced as well,
+# making the rename itself durable.
+
+
+def sync_folder(folder):
+    """Make the entries of `folder` (new files, renames) durable."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        # Windows cannot open a directory; NTFS journals the rename
+        return
+    fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def replacing(path, mode='w', prefix='.tmp-'):
+    """Yield a file that atomically replaces `path` once the block completes.
+
+        with atomic.replacing('state.json') as f:
+            json.dump(state, f)
+
+    If the block raises, `path` is left untouched and the temporary file removed.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=prefix, dir=folder)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    sync_folder(folder)
+
+
+def write(path, data, prefix='.tmp-'):
+    """Atomically replace `path` with `data` (bytes or str)."""
+    with replacing(path, 'wb' if isinstance(data, (bytes, bytearray, memoryview)) else 'w', prefix) as f:
+        f.write(data)
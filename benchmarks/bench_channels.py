@@ -0,0 +1,112 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import channels
+import collection
+
+# Per-channel collection workers over fake channels, off Windows. Each fake
+# channel produces records at its own rate and answers reads after its own
+# latency; one stalls on every read (a hung provider or a huge backlog), one
+# does not exist, and Security's export takes as long as a wevtutil run. The
+# same channels are collected with one thread (every channel waits its turn,
+# like the old sequential loop) and with a pool. For each channel it prints
+# runs, events, the longest a due run waited for a thread, and how old events
+# were when collected.
+#
+#   python -m benchmarks.bench_channels --seconds 10 --threads 4
+
+FAKES = {
+    # name: (records per second, read latency, export latency, min interval)
+    'Security': (2000, 0.005, 0.3, 0.5),
+    'Microsoft-Windows-Sysmon/Operational': (500, 0.002, 0.0, 0.25),
+    'System': (20, 0.002, 0.0, 0.5),
+    'Application': (20, 1.5, 0.0, 0.5),
+    'Microsoft-Windows-PowerShell/Operational': None,
+}
+
+
+class FakeChannel(collection.EventSource):
+    """Records appear at `rate` per second from creation on; every read takes `latency`."""
+
+    def __init__(self, channel, rate, latency):
+        self.channel = channel
+        self.rate = rate
+        self.latency = latency
+        self.started = time.monotonic() - 1.0
+
+    def bounds(self):
+        newest = int((time.monotonic() - self.started) * self.rate)
+        return (1, newest) if newest else (None, None)
+
+    def read_forward(self, start, limit):
+        time.sleep(self.latency)
+        _, newest = self.bounds()
+        return list(range(start, min(newest, start + limit - 1) + 1))
+
+    def record_number(self, record):
+        return record
+
+    def format(self, record):
+        return {'EventID': 1, 'RecordNumber': record, 'arrived': self.started + record / self.rate}
+
+
+def open_fake(channel):
+    fake = FAKES[channel]
+    if fake is None:
+        raise OSError(f"The specified channel could not be found: {channel}")
+    return FakeChannel(channel, fake[0], fake[1])
+
+
+class Export:
+    def __init__(self, latency):
+        self.latency = latency
+        self.ages = []
+
+    def __call__(self, worker, logs):
+        count = 0
+        for log in logs:
+            self.ages.append(time.monotonic() - log['arrived'])
+            count += 1
+        time.sleep(self.latency)
+        return count
+
+
+def run(threads, seconds, batch_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        cursors = collection.CursorStore(os.path.join(tmp, 'cursors.json'))
+        workers = []
+        exports = {}
+        for name, fake in FAKES.items():
+            settings = channels.ChannelSettings(name, batch_size=batch_size, min_interval=fake[3] if fake else 0.5,
+                                                max_interval=2.0, target_events=1, start_at='oldest')
+            exports[name] = Export(fake[2] if fake else 0.0)
+            workers.append(channels.ChannelWorker(settings, open_fake, cursors, exports[name]))
+        collector = channels.ChannelCollector(workers, threads)
+        stop = threading.Event()
+        threading.Timer(seconds, stop.set).start()
+        collector.run(stop)
+        print(f"{threads} thread{'s' if threads > 1 else ''}, {seconds:g} s")
+        print(f"  {'channel':<42}{'runs':>6}{'events':>9}{'errors':>8}{'max wait s':>12}{'age p50 s':>11}{'age max s':>11}")
+        for worker in workers:
+            ages = sorted(exports[worker.name].ages)
+            p50 = f"{ages[len(ages) // 2]:.2f}" if ages else '-'
+            oldest = f"{ages[-1]:.2f}" if ages else '-'
+            print(f"  {worker.name:<42}{worker.stats['runs']:>6}{worker.stats['events']:>9}{worker.stats['errors']:>8}"
+                  f"{worker.stats['lateness']:>12.2f}{p50:>11}{oldest:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent per-channel collection over fake channels")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    run(1, args.seconds, args.batch_size)
+    run(args.threads, args.seconds, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import logging
+import random
+import time
+
+import evtx
+
+# Per-event cost of the correlation layer as the number of active group keys
+# grows. Feeds synthetic 4625 failed logons straight into the correlator so
+# only window maintenance is measured, not single-event matching.
+#
+#   python -m benchmarks.bench_correlation --events 200000
+
+
+def failed_logon(user, ip, second, record_id):
+    minute, second = divmod(second, 60)
+    hour, minute = divmod(minute, 60)
+    return {
+        'Event': {
+            'System': {
+                'EventID': 4625,
+                'EventRecordID': record_id,
+                'Channel': 'Security',
+                'Provider_attributes': {'Name': 'Microsoft-Windows-Security-Auditing'},
+                'TimeCreated_attributes': {'SystemTime': f"2025-02-01T{hour % 24:02d}:{minute:02d}:{second:02d}.000Z"},
+            },
+            'EventData': {'TargetUserName': user, 'IpAddress': ip, 'LogonType': 3},
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark correlation window maintenance")
+    parser.add_argument("--events", type=int, default=100000, help="Events per run")
+    parser.add_argument("--keys", type=int, nargs="+", default=[100, 10000, 100000], help="Distinct accounts per run")
+    parser.add_argument("--rate", type=int, default=50, help="Events per second of event time")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    engine = evtx.load_sigma_engine()
+    correlator = engine.correlator
+    failed = [rule for rule in engine.rules if rule.name == 'failed_logon']
+
+    for keys in args.keys:
+        for c in correlator.correlations:
+            c.groups.clear()
+        rng = random.Random(keys)
+        documents = [failed_logon(f"user{rng.randrange(keys)}", f"10.0.{rng.randrange(16)}.{rng.randrange(256)}",
+                                  i // args.rate, i) for i in range(args.events)]
+        timestamps = [engine.timestamp(document) for document in documents]
+        hits = 0
+        start = time.perf_counter()
+        for document, timestamp in zip(documents, timestamps):
+            hits += len(correlator.observe(document, failed, 'bench.evtx', timestamp))
+        elapsed = time.perf_counter() - start
+        print(f"keys={keys:<8} active groups={correlator.active_groups():<8} "
+              f"{elapsed / args.events * 1e6:6.2f} us/event  {args.events / elapsed:10.0f} ev/s  {hits} hits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import itertools
+import re
+import time
+
+import eventdata
+from benchmarks.bench_eventstore import ATTACKER, spray_message
+from benchmarks.replay import service_noise
+
+# Throughput of EventData extraction from rendered Security messages. "regex"
+# is the naive approach: every line matched against a "label: value" pattern
+# with the section tracked by hand. "parse" is eventdata.learn() on every
+# message, i.e. no layout cache. "compiled" is FieldExtractor with its cached
+# per-EventID layouts. Compiled output is checked against "parse" for every
+# event.
+#
+#   python -m benchmarks.bench_eventdata --events 200000
+
+NAIVE_LINE = re.compile(r'^(\s*)([^:]+):\s*(.*)$')
+
+
+def naive(message):
+    fields = {}
+    section = None
+    for line in message.split('\n'):
+        line = line.rstrip('\r')
+        match = NAIVE_LINE.match(line)
+        if not match:
+            if not line.strip():
+                section = None
+            continue
+        indent, label, value = match.groups()
+        if not value and not indent:
+            section = label
+        elif indent and section:
+            fields[f"{section}.{label}"] = value.strip()
+        else:
+            fields[label] = value.strip()
+    return fields
+
+
+def corpus(count):
+    events = [flat for flat, _ in itertools.islice(service_noise(count), count)]
+    # Failed logons carry a different layout into the mix
+    for position in range(0, len(events), 50):
+        events[position] = dict(events[position], EventID=4625,
+                                Message=spray_message(f"user{position % 300}", ATTACKER))
+    return [(event['SourceName'], event['EventID'], event['Message']) for event in events]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark EventData extraction from rendered messages")
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs")
+    args = parser.parse_args()
+
+    messages = corpus(args.events)
+    extractor = eventdata.FieldExtractor()
+    methods = {
+        'regex': lambda source, event_id, message: naive(message),
+        'parse': lambda source, event_id, message: eventdata.learn(source, event_id, message.splitlines())[0],
+        'compiled': extractor.extract,
+    }
+    print(f"{len(messages)} messages, {len({(s, e) for s, e, _ in messages})} (SourceName, EventID) keys")
+    print(f"{'method':<10}{'seconds':>9}{'us/event':>10}{'events/s':>12}{'fields':>9}")
+    for name, method in methods.items():
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            fields = sum(len(method(*item)) for item in messages)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:<10}{best:>9.2f}{best / len(messages) * 1e6:>10.2f}{len(messages) / best:>12.0f}{fields:>9}")
+
+    mismatched = sum(1 for source, event_id, message in messages
+                     if extractor.extract(source, event_id, message)
+                     != eventdata.learn(source, event_id, message.splitlines())[0])
+    print(f"layout cache: {extractor.stats()}")
+    if mismatched:
+        print(f"  {mismatched} events differ between compiled layouts and the line parser")
+
+
+if __name__ == "__main__":
+    main()
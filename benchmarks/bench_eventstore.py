@@ -0,0 +1,114 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+
+import eventstore
+from benchmarks.replay import service_noise
+
+# Triage queries over weeks of domain-controller Security events: the hourly
+# JSON files main.py leaves in json/ (every file opened and filtered) against
+# the same events in the hour-partitioned event store. The background is the
+# service-noise profile spread evenly over --days, with a password spray from
+# one outside address hidden in a single hour of the last day.
+#
+#   python -m benchmarks.bench_eventstore --days 14 --per-hour 2000
+
+ATTACKER = '203.0.113.7'
+
+
+def spray_message(user, address):
+    return ("An account failed to log on.\r\n\r\nSubject:\r\n\tSecurity ID:\t\tS-1-0-0\r\n\tAccount Name:\t\t-\r\n"
+            "\tAccount Domain:\t\t-\r\n\tLogon ID:\t\t0x0\r\n\r\nLogon Type:\t\t\t3\r\n\r\n"
+            f"Account For Which Logon Failed:\r\n\tSecurity ID:\t\tS-1-0-0\r\n\tAccount Name:\t\t{user}\r\n"
+            "\tAccount Domain:\t\tCORP\r\n\r\nNetwork Information:\r\n\tWorkstation Name:\t-\r\n"
+            f"\tSource Network Address:\t{address}\r\n\tSource Port:\t\t0")
+
+
+def generate(days, per_hour, seed=0):
+    """Hourly lists of flat events, oldest hour first."""
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 2, 1)
+    background = service_noise(days * 24 * per_hour, seed)
+    spray_hour = (days - 1) * 24 + 3
+    for hour in range(days * 24):
+        base = start + datetime.timedelta(hours=hour)
+        events = []
+        for second in sorted(rng.randrange(3600) for _ in range(per_hour)):
+            flat, _ = next(background)
+            flat['TimeGenerated'] = str(base + datetime.timedelta(seconds=second))
+            events.append(flat)
+        if hour == spray_hour:
+            for n in range(200):
+                events.append({'EventID': 4625, 'TimeGenerated': str(base + datetime.timedelta(seconds=600 + n)),
+                               'SourceName': 'Microsoft-Windows-Security-Auditing', 'EventType': 'Audit Failure',
+                               'EventCategory': 12544, 'Message': spray_message(f"user{n}", ATTACKER)})
+        yield base, events
+
+
+def scan_files(folder, predicate):
+    matched = 0
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), 'r', encoding='utf-8') as f:
+            matched += sum(1 for log in json.load(f) if predicate(log))
+    return matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark event store queries against scanning hourly JSON files")
+    parser.add_argument("--days", type=int, default=14, help="Days of collected events")
+    parser.add_argument("--per-hour", type=int, default=2000, help="Background events per hour")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = os.path.join(tmp, 'json')
+        os.makedirs(files)
+        store = eventstore.EventStore(os.path.join(tmp, 'events'))
+        store_seconds = 0.0
+        total = 0
+        for base, events in generate(args.days, args.per_hour):
+            with open(os.path.join(files, f"Security_{base:%Y%m%d_%H%M%S}.json"), 'w') as f:
+                json.dump(events, f, indent=4)
+            started = time.perf_counter()
+            store.append(events, 'Security')
+            store.flush()
+            store_seconds += time.perf_counter() - started
+            total += len(events)
+        json_bytes = sum(os.path.getsize(os.path.join(files, name)) for name in os.listdir(files))
+        summary = store.summary()['Security']
+        print(f"{total} events over {args.days} days: JSON files {json_bytes / 1e6:.1f} MB, "
+              f"store {summary['bytes'] / 1e6:.1f} MB in {summary['blocks']} blocks; "
+              f"stored at {store_seconds / total * 1e6:.1f} us/event")
+
+        last_day = datetime.datetime(2025, 2, 1) + datetime.timedelta(days=args.days - 1)
+        window = (str(last_day), str(last_day + datetime.timedelta(days=1)))
+        queries = [
+            ('address, all time', {'address': ATTACKER},
+             lambda log: f"Source Network Address:\t{ATTACKER}" in log['Message']),
+            ('4625, last day', {'start': window[0], 'end': window[1], 'event_ids': [4625]},
+             lambda log: log['EventID'] == 4625 and window[0] <= log['TimeGenerated'] < window[1]),
+            ('account, all time', {'account': 'user17'},
+             lambda log: "Account Name:\t\tuser17\r" in log['Message']),
+            ('one hour, all events', {'start': window[0], 'end': str(last_day + datetime.timedelta(hours=1))},
+             lambda log: window[0] <= log['TimeGenerated'] < str(last_day + datetime.timedelta(hours=1))),
+        ]
+        print(f"{'query':<22}{'matches':>9}{'scan s':>9}{'store ms':>10}{'blocks read':>14}{'speedup':>9}")
+        for label, where, predicate in queries:
+            started = time.perf_counter()
+            expected = scan_files(files, predicate)
+            scan_seconds = time.perf_counter() - started
+            stats = eventstore.QueryStats()
+            for _ in store.query(stats=stats, **where):
+                pass
+            blocks = f"{stats.blocks_read}/{stats.blocks_total}"
+            print(f"{label:<22}{stats.matched:>9}{scan_seconds:>9.2f}{stats.seconds * 1000:>10.1f}{blocks:>14}"
+                  f"{scan_seconds / max(stats.seconds, 1e-6):>8.0f}x")
+            if stats.matched != expected:
+                print(f"  mismatch: the file scan found {expected}")
+
+
+if __name__ == "__main__":
+    main()
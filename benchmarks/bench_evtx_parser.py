@@ -0,0 +1,45 @@
+import argparse
+import os
+import tempfile
+import time
+
+import evtx_parser
+from benchmarks.synthetic_evtx import write_synthetic_evtx
+
+# Records/sec of the pure-Python EVTX reader, single process vs a process pool.
+#
+#   python -m benchmarks.bench_evtx_parser --records 200000 --workers 4
+
+
+def measure(path, workers):
+    start = time.perf_counter()
+    count = sum(1 for _ in evtx_parser.iter_records(path, workers=workers))
+    elapsed = time.perf_counter() - start
+    return count, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the EVTX parser on a synthetic file")
+    parser.add_argument("--records", type=int, default=100000, help="Number of synthetic records")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for the parallel run")
+    parser.add_argument("--file", help="Benchmark an existing .evtx instead of a synthetic one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file
+        if not path:
+            path = os.path.join(tmp, "synthetic.evtx")
+            chunks = write_synthetic_evtx(path, args.records)
+            print(f"Wrote {args.records} records in {chunks} chunks ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+        runs = [1] if args.workers <= 1 else [1, args.workers]
+        baseline = None
+        for workers in runs:
+            count, elapsed = measure(path, workers)
+            rate = count / elapsed if elapsed else 0
+            baseline = baseline or rate
+            print(f"workers={workers:<3} records={count:<9} {elapsed:8.2f}s {rate:12.0f} rec/s  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
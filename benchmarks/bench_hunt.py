@@ -0,0 +1,44 @@
+import argparse
+import logging
+import os
+import tempfile
+
+import hunt
+from benchmarks.synthetic_evtx import write_synthetic_evtx
+
+# Core scaling of the offline bulk hunt. Writes a directory of synthetic
+# exports, then sweeps it with increasing worker counts and reports events/s
+# and parallel efficiency against the single-worker run.
+#
+#   python -m benchmarks.bench_hunt --files 16 --records 50000 --workers 1 2 4 8
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline bulk hunting across worker counts")
+    parser.add_argument("--files", type=int, default=8, help="Synthetic .evtx files to sweep")
+    parser.add_argument("--records", type=int, default=20000, help="Records per file")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to compare")
+    parser.add_argument("--chunks-per-shard", type=int, default=hunt.CHUNKS_PER_SHARD)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    print(f"{os.cpu_count()} cores")
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = os.path.join(tmp, 'exports')
+        os.makedirs(inputs)
+        for i in range(args.files):
+            write_synthetic_evtx(os.path.join(inputs, f"host{i:03d}.evtx"), args.records, seed=i)
+        pack_path = os.path.join(tmp, 'rulepack.bin')
+        baseline = None
+        for workers in args.workers:
+            output = os.path.join(tmp, f"hits_{workers}.ndjson")
+            summary = hunt.run([inputs], output, 'needed', os.path.join('mappings', 'sigma-event-logs-all.yml'),
+                               'correlations', pack_path, workers, args.chunks_per_shard)
+            rate = summary['events'] / summary['seconds']
+            baseline = baseline or rate / workers
+            print(f"workers={workers:<3} {summary['events']} events  {summary['hits']} hits  "
+                  f"{summary['seconds']:7.2f} s  {rate:9.0f} ev/s  efficiency {rate / (baseline * workers):5.0%}")
+
+
+if __name__ == "__main__":
+    main()
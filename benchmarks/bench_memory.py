@@ -0,0 +1,174 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import messages
+import records
+import serializer
+
+# Peak memory of one collection window as it goes to the JSON export, the XML
+# export and the upload serializer. "window" is the former path: every event
+# becomes a dict in one list, dumped with json.dump(indent=4), built into an
+# ElementTree and then serialized for upload. "stream" is the current one:
+# EventRecords come from a generator in ReadEventLog-sized batches and each is
+# written to both exports and the upload body in a single pass. Each run is a
+# fresh process so its peak RSS is its own.
+#
+#   python -m benchmarks.bench_memory --events 100000 1000000
+
+READ_BATCH = 64
+TEMPLATES = [
+    {'channel': 'Security', 'source': 'Microsoft-Windows-Security-Auditing', 'event_id': 4624,
+     'template': "An account was successfully logged on.%n%nSubject:%n%tSecurity ID:%t%t%1%n%tAccount Name:%t%t%2%n"
+                 "%tAccount Domain:%t%t%3%n%nLogon Type:%t%t%t%4%n%nNew Logon:%n%tAccount Name:%t%t%5%n"
+                 "%tAccount Domain:%t%t%6%n%nNetwork Information:%n%tWorkstation Name:%t%7%n"
+                 "%tSource Network Address:%t%8%n%tSource Port:%t%t%9"},
+    {'channel': 'Security', 'source': 'Microsoft-Windows-Security-Auditing', 'event_id': 4672,
+     'template': "Special privileges assigned to new logon.%n%nSubject:%n%tSecurity ID:%t%t%1%n%tAccount Name:%t%t%2%n"
+                 "%tAccount Domain:%t%t%3%n%tLogon ID:%t%t%4%n%nPrivileges:%t%t%5"},
+]
+
+
+class SyntheticEvent:
+    """The attributes format_event reads from a pywin32 event record."""
+
+    __slots__ = ('EventID', 'TimeGenerated', 'SourceName', 'EventType', 'EventCategory', 'StringInserts')
+
+    def __init__(self, number, moment):
+        self.EventID = 4624 if number % 3 else 4672
+        self.TimeGenerated = moment
+        # A fresh string per event, as pywin32 returns it
+        self.SourceName = ''.join(['Microsoft-Windows-', 'Security-Auditing'])
+        self.EventType = 8
+        self.EventCategory = 12544
+        user = f"user{number % 5000}"
+        if self.EventID == 4624:
+            self.StringInserts = ('S-1-5-18', 'DC01$', 'CORP', '3', user, 'CORP', f"WS{number % 900:03d}",
+                                  f"10.0.{number % 250}.{number % 200}", str(49152 + number % 16000))
+        else:
+            self.StringInserts = ('S-1-5-21-1004', user, 'CORP', hex(0x3e7 + number), 'SeSecurityPrivilege')
+
+
+def read_batches(count):
+    # Stands in for ReadEventLog: a bounded batch of raw records per call
+    start = datetime.datetime(2025, 2, 1)
+    for first in range(0, count, READ_BATCH):
+        yield [SyntheticEvent(n, start + datetime.timedelta(seconds=n // 50))
+               for n in range(first, min(count, first + READ_BATCH))]
+
+
+def as_dict(event, cache):
+    return {
+        'EventID': event.EventID,
+        'TimeGenerated': str(event.TimeGenerated),
+        'SourceName': event.SourceName,
+        'EventType': 'Audit Success',
+        'EventCategory': event.EventCategory,
+        'Message': cache.message('Security', event.SourceName, event.EventID, event.StringInserts),
+    }
+
+
+def as_record(event, cache):
+    return records.EventRecord(event.EventID, event.TimeGenerated, event.SourceName, 'Audit Success',
+                               event.EventCategory,
+                               cache.message('Security', event.SourceName, event.EventID, event.StringInserts))
+
+
+def upload(logs):
+    sent = 0
+    for body in serializer.upload_bodies(logs, {'accessKey': 'bench'}):
+        for chunk in body:
+            sent += len(chunk)
+    return sent
+
+
+def run_window(count, folder, cache):
+    logs = [as_dict(event, cache) for batch in read_batches(count) for event in batch]
+    with open(os.path.join(folder, 'events.json'), 'w') as f:
+        json.dump(logs, f, indent=4, default=messages.json_default)
+    root = ET.Element("Events")
+    for log in logs:
+        event = ET.SubElement(root, "Event")
+        for key, value in log.items():
+            ET.SubElement(event, key).text = str(value)
+    ET.ElementTree(root).write(os.path.join(folder, 'events.xml'))
+    del root
+    upload(logs)
+    return len(logs)
+
+
+def run_stream(count, folder, cache):
+    def collect():
+        for batch in read_batches(count):
+            for event in batch:
+                yield as_record(event, cache)
+
+    with serializer.JsonExport(os.path.join(folder, 'events.json')) as json_out, \
+            serializer.XmlExport(os.path.join(folder, 'events.xml')) as xml_out:
+        upload(serializer.exporting(collect(), json_out, xml_out))
+    return json_out.count
+
+
+MODES = {'window': run_window, 'stream': run_stream}
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def child(mode, count):
+    cache = messages.MessageTemplateCache(messages.RecordedMessageLoader(templates=TEMPLATES))
+    baseline = peak_rss_mb()
+    with tempfile.TemporaryDirectory() as folder:
+        started = time.perf_counter()
+        events = MODES[mode](count, folder, cache)
+        elapsed = time.perf_counter() - started
+        sizes = {name: os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)}
+    print(json.dumps({'mode': mode, 'events': events, 'seconds': elapsed, 'baseline_mb': baseline,
+                      'peak_mb': peak_rss_mb(), 'files': sizes}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of window-sized lists vs. the streaming collection path")
+    parser.add_argument("--events", type=int, nargs='+', default=[100000, 1000000], help="Window sizes to run")
+    parser.add_argument("--modes", nargs='+', choices=sorted(MODES), default=['window', 'stream'])
+    parser.add_argument("--child", nargs=2, metavar=('MODE', 'EVENTS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if resource is None:
+        raise SystemExit("Peak RSS needs the resource module (not available on Windows)")
+    if args.child:
+        child(args.child[0], int(args.child[1]))
+        return
+
+    print(f"{'mode':<8}{'events':>10}{'seconds':>9}{'peak MB':>9}{'growth MB':>11}{'B/event':>9}")
+    for count in args.events:
+        outputs = {}
+        for mode in args.modes:
+            command = [sys.executable, '-m', 'benchmarks.bench_memory', '--child', mode, str(count)]
+            result = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+            growth = result['peak_mb'] - result['baseline_mb']
+            print(f"{mode:<8}{result['events']:>10}{result['seconds']:>9.1f}{result['peak_mb']:>9.0f}{growth:>11.0f}"
+                  f"{growth * 1024 * 1024 / result['events']:>9.0f}")
+            outputs[mode] = result['files']
+        if len(outputs) > 1 and len({json.dumps(files, sort_keys=True) for files in outputs.values()}) > 1:
+            print(f"  export sizes differ between modes: {outputs}")
+
+
+if __name__ == "__main__":
+    main()
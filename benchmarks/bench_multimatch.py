@@ -0,0 +1,159 @@
+import argparse
+import logging
+import random
+import time
+
+import multimatch
+import sigma
+
+# Shared multi-pattern matching against the per-rule loop it replaced. For the
+# largest contains/startswith/endswith sets in the rule directory, every rule
+# clause on that field is evaluated over realistic field values twice: once as
+# independent predicates (one `in`/endswith test per needle per rule) and once
+# through the field's shared pattern set (one scan, then an ID check per rule).
+# A second table finds the needle count at which the Aho-Corasick automaton
+# overtakes the `in` loop for substring sets.
+#
+#   python -m benchmarks.bench_multimatch --values 2000
+
+SAMPLES = {
+    'ServiceFileName': [
+        r'C:\Windows\system32\svchost.exe -k netsvcs -p',
+        r'"C:\Program Files\Common Files\Microsoft Shared\ClickToRun\OfficeClickToRun.exe" /service',
+        r'C:\Windows\System32\drivers\{name}.sys',
+        r'%SystemRoot%\system32\{name}.exe',
+        r'cmd.exe /c echo {name} > \\.\pipe\{name}',
+        r'powershell -nop -w hidden -enc {blob}',
+        r'"C:\ProgramData\{name}\{name}.exe" --run',
+    ],
+    'Application': [
+        r'\device\harddiskvolume3\windows\system32\{name}.exe',
+        r'\device\harddiskvolume2\program files\{name}\bin\{name}.exe',
+        r'\device\harddiskvolume3\users\{name}\appdata\local\temp\{name}.exe',
+        r'System',
+    ],
+    'ProcessName': [
+        r'C:\Windows\System32\{name}.exe',
+        r'C:\Program Files\{name}\{name}.exe',
+        r'C:\Windows\Temp\{name}.exe',
+        r'C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe',
+    ],
+    'TaskContent': [
+        '<Task><Actions><Exec><Command>C:\\Windows\\System32\\{name}.exe</Command>'
+        '<Arguments>/c {name}</Arguments></Exec></Actions></Task>',
+        '<Task><Triggers><LogonTrigger /></Triggers><Actions><Exec><Command>powershell.exe</Command>'
+        '<Arguments>-enc {blob}</Arguments></Exec></Actions></Task>',
+    ],
+}
+WORDS = ['update', 'agent', 'svc', 'helper', 'vmtools', 'defender', 'backup', 'sync', 'rundll32', 'wmic', 'psexesvc',
+         'mimikatz', 'certutil', 'bitsadmin', 'msiexec', 'regsvr32', 'taskhost', 'edge', 'chrome', 'teams']
+
+
+def sample_values(field, count, rng):
+    values = []
+    for _ in range(count):
+        template = rng.choice(SAMPLES[field])
+        blob = ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789') for _ in range(48))
+        values.append(template.replace('{name}', rng.choice(WORDS)).replace('{blob}', blob))
+    return values
+
+
+def rule_clauses(documents, mapping, field):
+    # (key, values) of every clause on `field` with a shareable modifier set
+    clauses = []
+    for _, rule in documents:
+        for name, selection in rule['detection'].items():
+            if name == 'condition':
+                continue
+            for item in (selection if isinstance(selection, list) else [selection]):
+                if not isinstance(item, dict):
+                    continue
+                for key, values in item.items():
+                    parts = key.split('|')
+                    if parts[0] == field and sigma.shared_position(set(parts[1:])):
+                        clauses.append((key, values))
+    return clauses
+
+
+def event(path, value):
+    document = node = {}
+    for key in path[:-1]:
+        node[key] = {}
+        node = node[key]
+    node[path[-1]] = value
+    return document
+
+
+def per_value(checks, documents, rounds):
+    start = time.perf_counter()
+    hits = 0
+    for _ in range(rounds):
+        for document in documents:
+            for check in checks:
+                hits += check(document)
+    return (time.perf_counter() - start) / rounds / len(documents) * 1e6, hits
+
+
+def bench_rules(args, rng):
+    mapping = sigma.load_mapping(args.mapping)
+    documents = sigma.load_rules(args.rules)
+    print(f"{'field':<18}{'clauses':>8}{'needles':>9}{'naive us':>11}{'cold us':>10}{'warm us':>10}{'speed-up':>10}")
+    for field in SAMPLES:
+        clauses = rule_clauses(documents, mapping, field)
+        if not clauses:
+            continue
+        path = sigma.field_path(mapping, field)
+        events = [event(path, value) for value in sample_values(field, args.values, rng)]
+        naive = [sigma.compile_field(mapping, key, values) for key, values in clauses]
+        table = multimatch.PatternTable()
+        shared = [sigma.compile_field(mapping, key, values, table) for key, values in clauses]
+        table.build()
+        naive_us, naive_hits = per_value(naive, events, args.rounds)
+        warm_us, shared_hits = per_value(shared, events, args.rounds)
+        if naive_hits != shared_hits:
+            raise SystemExit(f"{field}: shared matching disagrees ({shared_hits} != {naive_hits} hits)")
+        # Cold: every value scanned, nothing answered from the per-set cache
+        cache_size, multimatch.CACHE_SIZE = multimatch.CACHE_SIZE, 0
+        for patterns in table.sets.values():
+            patterns.cache.clear()
+        cold_us, _ = per_value(shared, events, 1)
+        multimatch.CACHE_SIZE = cache_size
+        needles = sum(len(p.needles) for p in table.sets.values())
+        print(f"{field:<18}{len(clauses):>8}{needles:>9}{naive_us:>11.2f}{cold_us:>10.2f}{warm_us:>10.2f}"
+              f"{naive_us / cold_us:>9.1f}x")
+
+
+def bench_crossover(args, rng):
+    print(f"\n{'needles':>8}{'in loop us':>12}{'automaton us':>14}")
+    alphabet = 'abcdefghijklmnopqrstuvwxyz0123456789\\.-_ '
+    texts = [''.join(rng.choice(alphabet) for _ in range(args.length)) for _ in range(200)]
+    for count in args.needles:
+        needles = list({''.join(rng.choice(alphabet) for _ in range(rng.randint(4, 14))) for _ in range(count)})
+        timings = []
+        for matcher in (multimatch.NeedleLoop(needles), multimatch.AhoCorasick(needles)):
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                for text in texts:
+                    matcher.scan(text)
+            timings.append((time.perf_counter() - start) / args.rounds / len(texts) * 1e6)
+        print(f"{count:>8}{timings[0]:>12.2f}{timings[1]:>14.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark shared multi-pattern matching")
+    parser.add_argument("--rules", default="needed", help="Sigma rule directory")
+    parser.add_argument("--mapping", default="mappings/sigma-event-logs-all.yml")
+    parser.add_argument("--values", type=int, default=1000, help="Field values per set")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--length", type=int, default=120, help="Characters per value in the crossover table")
+    parser.add_argument("--needles", type=int, nargs="+", default=[20, 80, 160, 320, 1000])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = random.Random(12)
+    bench_rules(args, rng)
+    bench_crossover(args, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import evtx
+import results
+from benchmarks import replay
+from benchmarks.stub_server import StubServer
+
+# End-to-end throughput of collect -> serialize/upload -> detect -> results
+# upload, driven through the real evtx.py functions against a local stub
+# backend. Results can be saved as a JSON baseline and compared later.
+#
+#   python -m benchmarks.bench_pipeline --profile logon-storm --events 50000 --save baseline.json
+#   python -m benchmarks.bench_pipeline --profile logon-storm --events 50000 --compare baseline.json
+
+DEFAULT_SOURCES = ['security_logs_*.json', 'output/chainsaw_results_*.json']
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.events = 0
+
+    def record(self, elapsed, events):
+        self.latencies.append(elapsed)
+        self.events += events
+
+    def summary(self):
+        total = sum(self.latencies)
+        ordered = sorted(self.latencies)
+        return {
+            'batches': len(ordered),
+            'events': self.events,
+            'seconds': round(total, 4),
+            'events_per_sec': round(self.events / total, 1) if total else None,
+            'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+            'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        }
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+async def run(args, stub):
+    evtx.API_ENDPOINT = stub.url('/api/logs')
+    evtx.CHAINSAW_ENDPOINT = stub.url('/api/chainsaw_logs')
+    evtx.SENDEMAIL_ENDPOINT = stub.url('/api/sendemail')
+
+    if args.profile:
+        events = replay.PROFILES[args.profile](args.events)
+    else:
+        events = replay.load_events(args.source or DEFAULT_SOURCES)
+        if not events:
+            raise SystemExit("No events found in the replay sources")
+    replayer = replay.Replayer(events, multiplier=args.multiplier, rate=args.rate,
+                               batch_size=args.batch_size, limit=args.events)
+
+    evtx.EDGE_FILTER = not args.no_edge_filter
+    engine = evtx.load_sigma_engine()
+    client = evtx.get_uploader()
+    client.backoff = args.backoff
+    stages = {name: Stage(name) for name in ('collect', 'upload', 'detect', 'results')}
+    detections = 0
+    wall_start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Suppression and digest state stay out of the working tree
+        evtx.result_store = results.ResultStore(os.path.join(tmp, 'results'))
+        batches = replayer.batches()
+        while True:
+            started = time.perf_counter()
+            batch = next(batches, None)
+            if batch is None:
+                break
+            stages['collect'].record(time.perf_counter() - started, len(batch))
+            flat = [event for event, _ in batch]
+            documents = [document for _, document in batch]
+
+            started = time.perf_counter()
+            # The edge filter decides what is uploaded; detection below still sees every event
+            await evtx.upload_to_api(list(evtx.filter_for_upload(flat)), args.access_key)
+            stages['upload'].record(time.perf_counter() - started, len(batch))
+
+            started = time.perf_counter()
+            hits = engine.hunt(documents, 'replay.evtx')
+            stages['detect'].record(time.perf_counter() - started, len(batch))
+            detections += len(hits)
+
+            if hits:
+                started = time.perf_counter()
+                results_file = os.path.join(tmp, 'chainsaw_results.json')
+                with open(results_file, 'w') as f:
+                    json.dump(hits, f)
+                await evtx.upload_chainsaw_results(results_file, args.access_key, '127.0.0.1', 'bench', 'bench@example.com')
+                stages['results'].record(time.perf_counter() - started, len(hits))
+
+    await client.close()
+    evtx.upload_client = None
+    evtx.result_store = None
+    edge = evtx.get_edge_filter().stats()
+    evtx.edge_filter = None
+    wall = time.perf_counter() - wall_start
+    events = stages['collect'].events
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'profile': args.profile or 'recorded',
+            'events': events,
+            'batch_size': args.batch_size,
+            'rate': args.rate,
+            'multiplier': args.multiplier,
+            'stub_latency_ms': args.latency * 1000,
+            'stub_error_rate': args.error_rate,
+        },
+        'stages': {name: stage.summary() for name, stage in stages.items()},
+        'end_to_end': {
+            'seconds': round(wall, 3),
+            'events_per_sec': round(events / wall, 1) if wall else None,
+            'detections': detections,
+            'keeps_up': (events / wall >= args.rate * 0.95) if args.rate and wall else None,
+        },
+        'peak_rss_mb': peak_rss_mb(),
+        'backend': stub.stats,
+        'edge_filter': edge,
+        'uploader': client.stats,
+    }
+
+
+def print_report(report):
+    print(f"{'stage':<10}{'batches':>9}{'events':>10}{'ev/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, stage in report['stages'].items():
+        rate = stage['events_per_sec'] or 0
+        print(f"{name:<10}{stage['batches']:>9}{stage['events']:>10}{rate:>12.0f}{stage['p50_ms']:>10.2f}{stage['p99_ms']:>10.2f}")
+    e2e = report['end_to_end']
+    print(f"end-to-end: {e2e['events_per_sec']} ev/s over {e2e['seconds']}s, {e2e['detections']} detections")
+    if e2e['keeps_up'] is not None:
+        print(f"keeps up with target rate: {e2e['keeps_up']}")
+    print(f"peak RSS: {report['peak_rss_mb']} MB")
+    uploads = report['uploader']
+    print(f"uploader: {uploads['requests']} requests, {uploads['retries']} retries, {uploads['failures']} failures")
+    edge = report.get('edge_filter')
+    if edge and edge['seen']:
+        print(f"edge filter: {edge['kept']} of {edge['seen']} events uploaded ({1 - edge['kept'] / edge['seen']:.0%} filtered)")
+
+
+def compare(report, baseline, threshold):
+    regressions = []
+    for name, stage in report['stages'].items():
+        old = baseline.get('stages', {}).get(name)
+        if not old or not old.get('events_per_sec') or not stage.get('events_per_sec'):
+            continue
+        change = (stage['events_per_sec'] - old['events_per_sec']) / old['events_per_sec'] * 100
+        p99_change = (stage['p99_ms'] - old['p99_ms']) / old['p99_ms'] * 100 if old['p99_ms'] else 0
+        flag = ''
+        if change < -threshold or p99_change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:<10} throughput {change:+7.1f}%   p99 {p99_change:+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay events through the agent pipeline against a stub backend")
+    parser.add_argument("--source", action="append", help="Recorded JSON files/globs (security_logs_*.json, Chainsaw output)")
+    parser.add_argument("--profile", choices=sorted(replay.PROFILES), help="Synthetic burst profile instead of recorded events")
+    parser.add_argument("--events", type=int, default=20000, help="Total events to replay")
+    parser.add_argument("--multiplier", type=int, default=1000, help="Times each recorded event is replayed")
+    parser.add_argument("--rate", type=float, default=0, help="Target events/sec (0 = as fast as possible)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Events per collection cycle")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub backend latency per request, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub requests answered with 503")
+    parser.add_argument("--backoff", type=float, default=0.05, help="Base retry backoff, seconds")
+    parser.add_argument("--no-edge-filter", action="store_true", help="Upload every event instead of applying filters/edge.yml")
+    parser.add_argument("--access-key", default="bench", help="Access key sent with uploads")
+    parser.add_argument("--save", help="Write the report as a JSON baseline")
+    parser.add_argument("--compare", help="Compare against a saved JSON baseline")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with StubServer(latency=args.latency, error_rate=args.error_rate) as stub:
+        report = asyncio.run(run(args, stub))
+
+    print_report(report)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import datetime
+import glob
+import itertools
+import json
+import random
+import time
+
+# Replay load generator: recorded security_logs_*.json exports and Chainsaw
+# output documents, plus synthetic burst profiles, replayed at a target rate.
+# Every event is produced in both shapes the pipeline uses: the flat dict
+# uploaded by upload_to_api() and the Chainsaw document the Sigma engine reads.
+
+PROVIDER = 'Microsoft-Windows-Security-Auditing'
+AUDIT_SUCCESS = '0x8020000000000000'
+AUDIT_FAILURE = '0x8010000000000000'
+DCSYNC_GUIDS = ['1131f6aa-9c07-11d1-f79f-00c04fc2dcd2', '1131f6ad-9c07-11d1-f79f-00c04fc2dcd2',
+                '89e95b76-444d-4c62-991a-0facbeda640c']
+
+
+def flat_to_document(event, record_id=0):
+    moment = datetime.datetime.strptime(event['TimeGenerated'], '%Y-%m-%d %H:%M:%S')
+    failure = event.get('EventType') == 'Audit Failure'
+    return {
+        'Event': {
+            'System': {
+                'Provider_attributes': {'Name': event.get('SourceName', PROVIDER)},
+                'EventID': event['EventID'],
+                'Task': event.get('EventCategory'),
+                'Keywords': AUDIT_FAILURE if failure else AUDIT_SUCCESS,
+                'TimeCreated_attributes': {'SystemTime': moment.strftime('%Y-%m-%dT%H:%M:%S.000000Z')},
+                'EventRecordID': record_id,
+                'Channel': 'Security',
+            },
+            'EventData': {},
+        },
+    }
+
+
+def document_to_flat(document):
+    system = document['Event']['System']
+    data = document['Event'].get('EventData') or {}
+    moment = system.get('TimeCreated_attributes', {}).get('SystemTime', '1970-01-01T00:00:00')
+    message = ''.join(f"\r\n\t{key}:\t\t{value}" for key, value in data.items())
+    return {
+        'EventID': system['EventID'],
+        'TimeGenerated': moment[:19].replace('T', ' '),
+        'SourceName': system.get('Provider_attributes', {}).get('Name', PROVIDER),
+        'EventType': 'Audit Failure' if system.get('Keywords') == AUDIT_FAILURE else 'Audit Success',
+        'EventCategory': system.get('Task'),
+        'Message': message,
+    }
+
+
+def load_events(paths):
+    """Load (flat, document) pairs from security_logs_*.json or Chainsaw output files."""
+    events = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, 'r') as f:
+                text = f.read()
+            if not text.strip():
+                continue
+            for item in json.loads(text):
+                if 'document' in item:
+                    document = item['document']['data']
+                    events.append((document_to_flat(document), document))
+                elif 'Event' in item:
+                    events.append((document_to_flat(item), item))
+                else:
+                    events.append((item, flat_to_document(item, len(events) + 1)))
+    return events
+
+
+def _event(event_id, moment, data, failure=False, task=12544):
+    document = {
+        'Event': {
+            'System': {
+                'Provider_attributes': {'Name': PROVIDER},
+                'EventID': event_id,
+                'Task': task,
+                'Keywords': AUDIT_FAILURE if failure else AUDIT_SUCCESS,
+                'TimeCreated_attributes': {'SystemTime': moment.strftime('%Y-%m-%dT%H:%M:%S.%fZ')},
+                'Channel': 'Security',
+                'Computer': 'DC01.corp.local',
+            },
+            'EventData': data,
+        },
+    }
+    return document_to_flat(document), document
+
+
+def logon_storm(count, seed=0):
+    """Brute force and spraying: 4625 failures from a few IPs over many accounts, some 4624s."""
+    rng = random.Random(seed)
+    moment = datetime.datetime(2025, 2, 1, 5, 0, 0)
+    attackers = [f"203.0.113.{rng.randint(1, 254)}" for _ in range(5)]
+    for i in range(count):
+        moment += datetime.timedelta(microseconds=rng.randint(100, 5000))
+        failure = rng.random() < 0.8
+        data = {
+            'SubjectUserSid': 'S-1-0-0', 'SubjectUserName': '-', 'SubjectDomainName': '-',
+            'TargetUserName': f"user{rng.randint(1, 2000)}", 'TargetDomainName': 'CORP',
+            'LogonType': rng.choice([3, 3, 10]), 'LogonProcessName': 'NtLmSsp ',
+            'AuthenticationPackageName': 'NTLM', 'WorkstationName': '-',
+            'IpAddress': rng.choice(attackers) if failure else f"10.0.0.{rng.randint(1, 254)}",
+            'IpPort': str(rng.randint(1024, 65535)), 'ProcessName': '-',
+        }
+        if failure:
+            data.update({'Status': '0xc000006d', 'SubStatus': '0xc000006a', 'FailureReason': '%%2313'})
+        yield _event(4625 if failure else 4624, moment, data, failure=failure)
+
+
+def flood_4662(count, seed=0):
+    """Directory service access flood on a DC, with occasional replication rights (DCSync)."""
+    rng = random.Random(seed)
+    moment = datetime.datetime(2025, 2, 1, 5, 0, 0)
+    for i in range(count):
+        moment += datetime.timedelta(microseconds=rng.randint(50, 2000))
+        properties = '%%7688\r\n\t\t{' + rng.choice(DCSYNC_GUIDS if rng.random() < 0.01 else [
+            'bf967aba-0de6-11d0-a285-00aa003049e2', '19195a5b-6da0-11d0-afd3-00c04fd930c9']) + '}'
+        data = {
+            'SubjectUserSid': 'S-1-5-21-1-2-3-1105', 'SubjectUserName': rng.choice(['alice', 'DC02$', 'svc_sync']),
+            'SubjectDomainName': 'CORP', 'SubjectLogonId': '0x3e7', 'ObjectServer': 'DS',
+            'ObjectType': '%{19195a5b-6da0-11d0-afd3-00c04fd930c9}', 'ObjectName': '%{8f5c3c5a-0000-0000-0000-000000000000}',
+            'OperationType': 'Object Access', 'HandleId': '0x0', 'AccessList': '%%7688',
+            'AccessMask': '0x100', 'Properties': properties, 'AdditionalInfo': '-', 'AdditionalInfo2': '',
+        }
+        yield _event(4662, moment, data, task=14080)
+
+
+SERVICE_ACCOUNTS = [('S-1-5-18', 'SYSTEM', 'NT AUTHORITY'), ('S-1-5-19', 'LOCAL SERVICE', 'NT AUTHORITY'),
+                    ('S-1-5-20', 'NETWORK SERVICE', 'NT AUTHORITY')]
+PRIVILEGES = ['SeAssignPrimaryTokenPrivilege', 'SeTcbPrivilege', 'SeSecurityPrivilege', 'SeTakeOwnershipPrivilege',
+              'SeLoadDriverPrivilege', 'SeBackupPrivilege', 'SeRestorePrivilege', 'SeDebugPrivilege',
+              'SeAuditPrivilege', 'SeSystemEnvironmentPrivilege', 'SeImpersonatePrivilege']
+
+
+def _logon_message(subject, target, logon_type, workstation, address, process):
+    # The layout SafeFormatMessage renders for 4624
+    return ("An account was successfully logged on.\r\n\r\nSubject:\r\n"
+            f"\tSecurity ID:\t\t{subject[0]}\r\n\tAccount Name:\t\t{subject[1]}\r\n\tAccount Domain:\t\t{subject[2]}\r\n"
+            f"\tLogon ID:\t\t0x3e7\r\n\r\nLogon Information:\r\n\tLogon Type:\t\t{logon_type}\r\n"
+            "\tRestricted Admin Mode:\t-\r\n\tVirtual Account:\t\t%%1843\r\n\tElevated Token:\t\t%%1842\r\n\r\n"
+            "Impersonation Level:\t\t%%1833\r\n\r\nNew Logon:\r\n"
+            f"\tSecurity ID:\t\t{target[0]}\r\n\tAccount Name:\t\t{target[1]}\r\n\tAccount Domain:\t\t{target[2]}\r\n"
+            "\tLogon ID:\t\t0x3e7\r\n\tLinked Logon ID:\t\t0x0\r\n\r\nProcess Information:\r\n"
+            f"\tProcess ID:\t\t0x470\r\n\tProcess Name:\t\t{process}\r\n\r\nNetwork Information:\r\n"
+            f"\tWorkstation Name:\t{workstation}\r\n\tSource Network Address:\t{address}\r\n\tSource Port:\t\t-\r\n\r\n"
+            "This event is generated when a logon session is created. It is generated on the computer that was accessed.")
+
+
+def service_noise(count, seed=0):
+    """Steady host background: service-account 4672/4624/4634 with a minority of user logons."""
+    rng = random.Random(seed)
+    moment = datetime.datetime(2025, 2, 1, 5, 0, 0)
+    for i in range(count):
+        moment += datetime.timedelta(microseconds=rng.randint(1000, 20000))
+        roll = rng.random()
+        sid, name, domain = rng.choice(SERVICE_ACCOUNTS)
+        if roll < 0.4:
+            data = {'SubjectUserSid': sid, 'SubjectUserName': name, 'SubjectDomainName': domain,
+                    'SubjectLogonId': '0x3e7', 'PrivilegeList': '\r\n\t\t\t'.join(PRIVILEGES)}
+            flat, document = _event(4672, moment, data, task=12548)
+            flat['Message'] = ("Special privileges assigned to new logon.\r\n\r\nSubject:\r\n"
+                               f"\tSecurity ID:\t\t{sid}\r\n\tAccount Name:\t\t{name}\r\n\tAccount Domain:\t\t{domain}\r\n"
+                               f"\tLogon ID:\t\t0x3e7\r\n\r\nPrivileges:\t\t{data['PrivilegeList']}\r\n")
+        elif roll < 0.75:
+            data = {'SubjectUserSid': 'S-1-5-18', 'SubjectUserName': 'DC01$', 'TargetUserSid': sid,
+                    'TargetUserName': name, 'TargetDomainName': domain, 'LogonType': 5,
+                    'ProcessName': 'C:\\Windows\\System32\\services.exe', 'IpAddress': '-', 'WorkstationName': '-'}
+            flat, document = _event(4624, moment, data)
+            flat['Message'] = _logon_message(('S-1-5-18', 'DC01$', 'CORP'), (sid, name, domain), 5, '-', '-',
+                                             data['ProcessName'])
+        elif roll < 0.85:
+            machine = f"WS{rng.randint(1, 400):03d}$"
+            data = {'TargetUserSid': 'S-1-5-21-1-2-3-2101', 'TargetUserName': machine, 'TargetDomainName': 'CORP',
+                    'TargetLogonId': hex(rng.randint(1, 1 << 32)), 'LogonType': 3}
+            flat, document = _event(4634, moment, data, task=12545)
+            flat['Message'] = ("An account was logged off.\r\n\r\nSubject:\r\n\tSecurity ID:\t\tS-1-5-21-1-2-3-2101\r\n"
+                               f"\tAccount Name:\t\t{machine}\r\n\tAccount Domain:\t\tCORP\r\n"
+                               f"\tLogon ID:\t\t{data['TargetLogonId']}\r\n\r\nLogon Type:\t\t\t3\r\n\r\n"
+                               "This event is generated when a logon session is destroyed.")
+        else:
+            user = f"user{rng.randint(1, 300)}"
+            address = f"10.0.{rng.randint(0, 9)}.{rng.randint(1, 254)}"
+            data = {'SubjectUserSid': 'S-1-0-0', 'TargetUserSid': f"S-1-5-21-1-2-3-{1000 + rng.randint(1, 300)}",
+                    'TargetUserName': user, 'TargetDomainName': 'CORP', 'LogonType': 3,
+                    'ProcessName': '-', 'IpAddress': address, 'WorkstationName': f"WS{rng.randint(1, 400):03d}"}
+            flat, document = _event(4624, moment, data)
+            flat['Message'] = _logon_message(('S-1-0-0', '-', '-'), (data['TargetUserSid'], user, 'CORP'), 3,
+                                             data['WorkstationName'], address, '-')
+        yield flat, document
+
+
+PROFILES = {
+    'logon-storm': logon_storm,
+    '4662-flood': flood_4662,
+    'service-noise': service_noise,
+}
+
+
+class Replayer:
+    """Yields batches of (flat, document) pairs, paced to `rate` events/sec (0 = unthrottled)."""
+
+    def __init__(self, events, multiplier=1, rate=0, batch_size=500, limit=None):
+        self.events = events
+        self.multiplier = multiplier
+        self.rate = rate
+        self.batch_size = batch_size
+        self.limit = limit
+
+    def _stream(self):
+        if isinstance(self.events, list):
+            stream = itertools.chain.from_iterable(itertools.repeat(self.events, self.multiplier))
+        else:
+            stream = self.events
+        return itertools.islice(stream, self.limit) if self.limit else stream
+
+    def batches(self):
+        stream = self._stream()
+        started = time.perf_counter()
+        sent = 0
+        while True:
+            batch = list(itertools.islice(stream, self.batch_size))
+            if not batch:
+                return
+            sent += len(batch)
+            if self.rate:
+                # Pace against the schedule, not the previous batch, so delays do not accumulate
+                delay = started + sent / self.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield batch
@@ -0,0 +1,138 @@
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import random
+import signal
+import tempfile
+import time
+
+import spool
+
+# Crash-recovery check and append throughput for the upload spool. Each round
+# starts a process that appends to and drains the spool and SIGKILLs it
+# mid-stream; the next round reopens the spool and a final pass drains it.
+# Every fsynced record must be delivered, each round's delivered records must
+# form a gap-free prefix of what it wrote, and each kill may redeliver at most
+# the one batch that was sent but not yet acknowledged.
+#
+#   python -m benchmarks.spool_crash --rounds 20
+#   python -m benchmarks.spool_crash --throughput 200000
+
+
+def agent(directory, out_path, round_id, sync_records, batch, segment_bytes, durable, seed):
+    # Producer and consumer in one process, like the agent's collect and drain
+    rng = random.Random(seed)
+    target = spool.Spool(directory, segment_bytes=segment_bytes, sync_records=sync_records, sync_interval=3600)
+    n = 0
+    with open(out_path, 'a') as out:
+        while True:
+            for _ in range(rng.randint(1, 3 * batch)):
+                target.append_json({'round': round_id, 'n': n, 'pad': 'x' * 200})
+                n += 1
+                if not target.unsynced:
+                    durable.value = n
+            records = target.read_json(max_records=batch)
+            if records:
+                out.write(''.join(f"{r['round']} {r['n']}\n" for r, _ in records))
+                out.flush()
+                os.fsync(out.fileno())
+                target.ack(records[-1][1])
+
+
+def drain(directory, out_path, segment_bytes):
+    source = spool.Spool(directory, segment_bytes=segment_bytes)
+    with open(out_path, 'a') as out:
+        while True:
+            records = source.read_json(max_records=1000)
+            if not records:
+                break
+            out.write(''.join(f"{r['round']} {r['n']}\n" for r, _ in records))
+            source.ack(records[-1][1])
+    source.close()
+    return source.stats
+
+
+def check(out_path, durables, batch, rounds):
+    delivered = collections.defaultdict(collections.Counter)
+    with open(out_path) as f:
+        for line in f:
+            round_id, n = map(int, line.split())
+            delivered[round_id][n] += 1
+    failures = []
+    duplicates = 0
+    for round_id in range(rounds):
+        counts = delivered[round_id]
+        top = max(counts) + 1 if counts else 0
+        if top < durables[round_id]:
+            failures.append(f"round {round_id}: lost fsynced records ({top} < {durables[round_id]})")
+        missing = [n for n in range(top) if n not in counts]
+        if missing:
+            failures.append(f"round {round_id}: gap at {missing[:5]}")
+        duplicates += sum(c - 1 for c in counts.values())
+    if duplicates > batch * rounds:
+        failures.append(f"{duplicates} duplicates exceed one batch per kill ({batch} x {rounds})")
+    return failures, duplicates
+
+
+def crash_rounds(args):
+    rng = random.Random(args.seed)
+    context = multiprocessing.get_context('fork')
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.join(tmp, 'spool')
+        out_path = os.path.join(tmp, 'delivered.txt')
+        durables = []
+        for round_id in range(args.rounds):
+            durable = context.Value('q', 0)
+            process = context.Process(target=agent, args=(directory, out_path, round_id, args.sync_records,
+                                                          args.batch, args.segment_bytes, durable, rng.random()))
+            process.start()
+            time.sleep(rng.uniform(0.05, 0.4))
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+            durables.append(durable.value)
+        stats = drain(directory, out_path, args.segment_bytes)
+        failures, duplicates = check(out_path, durables, args.batch, args.rounds)
+    print(f"{args.rounds} crash rounds, {sum(durables)} fsynced records, {duplicates} redelivered, "
+          f"{stats['acked']} acknowledged batches in the final drain")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else f"{len(failures)} failures")
+    return not failures
+
+
+def throughput(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        payload = json.dumps({'EventID': 4624, 'Message': 'x' * 1500})
+        for sync_records in (1, args.sync_records):
+            target = spool.Spool(os.path.join(tmp, f"s{sync_records}"), sync_records=sync_records)
+            count = args.throughput if sync_records > 1 else min(args.throughput, 2000)
+            start = time.perf_counter()
+            for _ in range(count):
+                target.append(payload.encode('utf-8'))
+            target.flush()
+            elapsed = time.perf_counter() - start
+            print(f"sync every {sync_records:<6} {count:>8} records {elapsed:8.2f}s {count / elapsed:12.0f} rec/s "
+                  f"({target.stats['syncs']} fsyncs)")
+            target.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kill-mid-write recovery check and throughput of the upload spool")
+    parser.add_argument("--rounds", type=int, default=10, help="Crash rounds to run")
+    parser.add_argument("--batch", type=int, default=200, help="Consumer batch size")
+    parser.add_argument("--sync-records", type=int, default=512, help="Records per fsync")
+    parser.add_argument("--segment-bytes", type=int, default=256 * 1024, help="Segment size (small to exercise rotation)")
+    parser.add_argument("--throughput", type=int, default=0, help="Measure append throughput with this many records instead")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.throughput:
+        throughput(args)
+    elif not crash_rounds(args):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the backend on localhost:3001. It accepts the agent's
+# three endpoints, counts requests and bytes, and can inject latency and
+# 5xx responses to exercise retry and backpressure paths.
+
+ENDPOINTS = ('/api/logs', '/api/chainsaw_logs', '/api/sendemail')
+
+
+class StubServer:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {path: {'requests': 0, 'errors': 0, 'bytes': 0} for path in ENDPOINTS}
+        self.bodies = []
+        self.keep_bodies = False
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path):
+        return self.base_url + path
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _read_body(self):
+                if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                    body = bytearray()
+                    while True:
+                        size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            return bytes(body)
+                        body += self.rfile.read(size)
+                        self.rfile.readline()
+                return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+            def do_POST(self):
+                body = self._read_body()
+                path = self.path.split('?')[0]
+                if server.latency:
+                    time.sleep(server.latency)
+                with server.lock:
+                    failed = server.random.random() < server.error_rate
+                    stats = server.stats.get(path)
+                    if stats is not None:
+                        stats['requests'] += 1
+                        stats['bytes'] += len(body)
+                        stats['errors'] += failed
+                    if server.keep_bodies:
+                        server.bodies.append((path, dict(self.headers), body))
+                if stats is None:
+                    status, payload = 404, {'error': 'not found'}
+                elif failed:
+                    status, payload = 503, {'error': 'injected failure'}
+                else:
+                    status, payload = 200, {'status': 'ok'}
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
@@ -0,0 +1,267 @@
+import datetime
+import random
+import struct
+import uuid
+
+import evtx_parser
+
+# Writes small but structurally valid EVTX files (file header, 64 KB chunks,
+# per-chunk templates and BinXML records) for benchmarks on machines with no
+# real Windows exports.
+
+PROVIDER = 'Microsoft-Windows-Security-Auditing'
+PROVIDER_GUID = uuid.UUID('54849625-5478-4994-a5ba-3e3b0328c30d').bytes_le
+TEMPLATE_GUID = uuid.UUID('0c3ad5b4-0a1c-4e5f-9f2b-5e3a1b2c4d6e').bytes_le
+EVENT_NS = 'http://schemas.microsoft.com/win/2004/08/events/event'
+
+# BinXML value types used by the template below
+WSTRING, UINT8, UINT16, UINT32, UINT64, GUID, FILETIME, SID, HEXINT64 = (
+    0x01, 0x04, 0x06, 0x08, 0x0a, 0x0f, 0x11, 0x13, 0x15)
+
+SYSTEM_FIELDS = [
+    ('EventID', UINT16), ('Version', UINT8), ('Level', UINT8), ('Task', UINT16),
+    ('Opcode', UINT8), ('Keywords', HEXINT64), ('EventRecordID', UINT64),
+    ('Channel', WSTRING), ('Computer', WSTRING),
+]
+DATA_FIELDS = [
+    ('SubjectUserSid', SID), ('SubjectUserName', WSTRING), ('SubjectDomainName', WSTRING),
+    ('TargetUserName', WSTRING), ('TargetDomainName', WSTRING), ('LogonType', UINT32),
+    ('IpAddress', WSTRING), ('IpPort', WSTRING), ('ProcessName', WSTRING),
+]
+
+USERS = ['SYSTEM', 'alice', 'bob', 'svc_backup', 'DC01$', 'administrator']
+PROCESSES = [r'C:\Windows\System32\services.exe', r'C:\Windows\System32\lsass.exe',
+             r'C:\Windows\System32\winlogon.exe', '-']
+
+
+class _BinXmlWriter:
+    def __init__(self, base, names):
+        self.base = base
+        self.names = names
+        self.buf = bytearray()
+        self.sizes = []
+
+    def position(self):
+        return self.base + len(self.buf)
+
+    def name(self, name):
+        if name in self.names:
+            self.buf += struct.pack('<I', self.names[name])
+            return
+        offset = self.position() + 4
+        self.names[name] = offset
+        encoded = name.encode('utf-16-le')
+        name_hash = sum(encoded) & 0xffff
+        self.buf += struct.pack('<IIHH', offset, 0, name_hash, len(name)) + encoded + b'\x00\x00'
+
+    def open(self, name, attributes=()):
+        self.buf += bytes([0x41 if attributes else 0x01]) + struct.pack('<H', 0xffff)
+        self.sizes.append(len(self.buf))
+        self.buf += b'\x00\x00\x00\x00'
+        self.name(name)
+        if attributes:
+            start = len(self.buf)
+            self.buf += b'\x00\x00\x00\x00'
+            for i, (attribute, value) in enumerate(attributes):
+                self.buf.append(0x06 if i == len(attributes) - 1 else 0x46)
+                self.name(attribute)
+                self.value(value)
+            struct.pack_into('<I', self.buf, start, len(self.buf) - start - 4)
+
+    def value(self, value):
+        if isinstance(value, tuple):
+            self.buf += struct.pack('<BHB', 0x0d, value[0], value[1])
+        else:
+            self.buf += struct.pack('<BBH', 0x05, WSTRING, len(value)) + value.encode('utf-16-le')
+
+    def close_empty(self):
+        self.buf.append(0x03)
+        self._finish()
+
+    def close_start(self):
+        self.buf.append(0x02)
+
+    def end(self):
+        self.buf.append(0x04)
+        self._finish()
+
+    def _finish(self):
+        start = self.sizes.pop()
+        struct.pack_into('<I', self.buf, start, len(self.buf) - start - 4)
+
+
+def _template(writer):
+    index = 0
+
+    def sub(value_type):
+        nonlocal index
+        index += 1
+        return (index - 1, value_type)
+
+    writer.buf += b'\x0f\x01\x01\x00'
+    writer.open('Event', [('xmlns', EVENT_NS)])
+    writer.close_start()
+    writer.open('System')
+    writer.close_start()
+    writer.open('Provider', [('Name', sub(WSTRING)), ('Guid', sub(GUID))])
+    writer.close_empty()
+    for name, value_type in SYSTEM_FIELDS[:6]:
+        writer.open(name)
+        writer.close_start()
+        writer.value(sub(value_type))
+        writer.end()
+    writer.open('TimeCreated', [('SystemTime', sub(FILETIME))])
+    writer.close_empty()
+    for name, value_type in SYSTEM_FIELDS[6:7]:
+        writer.open(name)
+        writer.close_start()
+        writer.value(sub(value_type))
+        writer.end()
+    writer.open('Correlation')
+    writer.close_empty()
+    writer.open('Execution', [('ProcessID', sub(UINT32)), ('ThreadID', sub(UINT32))])
+    writer.close_empty()
+    for name, value_type in SYSTEM_FIELDS[7:]:
+        writer.open(name)
+        writer.close_start()
+        writer.value(sub(value_type))
+        writer.end()
+    writer.open('Security')
+    writer.close_empty()
+    writer.end()
+    writer.open('EventData')
+    writer.close_start()
+    for name, value_type in DATA_FIELDS:
+        writer.open('Data', [('Name', name)])
+        writer.close_start()
+        writer.value(sub(value_type))
+        writer.end()
+    writer.end()
+    writer.end()
+    writer.buf.append(0x00)
+
+
+def _encode(value_type, value):
+    if value_type == WSTRING:
+        return value.encode('utf-16-le')
+    if value_type == SID:
+        parts = value.split('-')
+        authorities = [int(p) for p in parts[3:]]
+        return (bytes([int(parts[1]), len(authorities)]) + int(parts[2]).to_bytes(6, 'big')
+                + struct.pack(f'<{len(authorities)}I', *authorities))
+    if value_type == GUID:
+        return value
+    return struct.pack({UINT8: '<B', UINT16: '<H', UINT32: '<I', UINT64: '<Q',
+                        FILETIME: '<Q', HEXINT64: '<Q'}[value_type], value)
+
+
+def _filetime(moment):
+    delta = moment - evtx_parser.FILETIME_EPOCH
+    return ((delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds) * 10
+
+
+def synthetic_values(record_id, moment, rng):
+    user = rng.choice(USERS)
+    event_id = rng.choice([4624, 4624, 4624, 4672, 4625])
+    values = [
+        (WSTRING, PROVIDER), (GUID, PROVIDER_GUID),
+        (UINT16, event_id), (UINT8, 0), (UINT8, 0), (UINT16, 12544), (UINT8, 0),
+        (HEXINT64, 0x8020000000000000 if event_id != 4625 else 0x8010000000000000),
+        (FILETIME, _filetime(moment)),
+        (UINT64, record_id),
+        (UINT32, 1264), (UINT32, rng.randint(1000, 99999)),
+        (WSTRING, 'Security'), (WSTRING, 'DC01.corp.local'),
+        (SID, 'S-1-5-18'), (WSTRING, 'DC01$'), (WSTRING, 'CORP'),
+        (WSTRING, user), (WSTRING, 'CORP'), (UINT32, rng.choice([2, 3, 3, 5, 7, 10])),
+        (WSTRING, f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}"),
+        (WSTRING, str(rng.randint(1024, 65535))), (WSTRING, rng.choice(PROCESSES)),
+    ]
+    return values
+
+
+def _record(offset, record_id, moment, values, names, templates):
+    writer = _BinXmlWriter(offset + 24, names)
+    writer.buf += b'\x0f\x01\x01\x00\x0c\x01'
+    template_offset = templates.get('security')
+    inline = template_offset is None
+    if inline:
+        template_offset = writer.position() + 8
+        templates['security'] = template_offset
+    writer.buf += struct.pack('<II', 1, template_offset)
+    if inline:
+        header = len(writer.buf)
+        writer.buf += struct.pack('<I', 0) + TEMPLATE_GUID + struct.pack('<I', 0)
+        body = len(writer.buf)
+        _template(writer)
+        struct.pack_into('<I', writer.buf, header + 20, len(writer.buf) - body)
+    encoded = [_encode(value_type, value) for value_type, value in values]
+    writer.buf += struct.pack('<I', len(encoded))
+    for (value_type, _), data in zip(values, encoded):
+        writer.buf += struct.pack('<HBx', len(data), value_type)
+    for data in encoded:
+        writer.buf += data
+    writer.buf.append(0x00)
+    size = 24 + len(writer.buf) + 4
+    size += -size % 8
+    record = bytearray(RECORD_HEADER.pack(evtx_parser.RECORD_MAGIC, size, record_id, _filetime(moment)))
+    record += writer.buf
+    record += b'\x00' * (size - len(record) - 4)
+    record += struct.pack('<I', size)
+    return bytes(record)
+
+
+RECORD_HEADER = struct.Struct('<4sIQQ')
+
+
+def build_chunk(records):
+    """records: list of (record_id, moment, values); returns (chunk bytes, records used)."""
+    chunk = bytearray(evtx_parser.CHUNK_SIZE)
+    names = {}
+    templates = {}
+    offset = evtx_parser.CHUNK_HEADER_SIZE
+    last_offset = offset
+    used = 0
+    for record_id, moment, values in records:
+        data = _record(offset, record_id, moment, values, names, templates)
+        if offset + len(data) > evtx_parser.CHUNK_SIZE:
+            break
+        chunk[offset:offset + len(data)] = data
+        last_offset = offset
+        offset += len(data)
+        used += 1
+    first_id = records[0][0]
+    last_id = records[used - 1][0]
+    chunk[:8] = evtx_parser.CHUNK_MAGIC
+    struct.pack_into('<QQQQIII', chunk, 8, first_id, last_id, first_id, last_id, 128, last_offset, offset)
+    struct.pack_into('<I', chunk, 52, evtx_parser.chunk_data_checksum(chunk))
+    struct.pack_into('<I', chunk, 124, evtx_parser.chunk_header_checksum(chunk))
+    return bytes(chunk), used
+
+
+def build_file_header(chunk_count, next_record_id):
+    header = bytearray(evtx_parser.FILE_HEADER_SIZE)
+    struct.pack_into('<8sQQQIHHHH', header, 0, evtx_parser.FILE_MAGIC, 0, max(chunk_count - 1, 0),
+                     next_record_id, 128, 1, 3, evtx_parser.FILE_HEADER_SIZE, chunk_count)
+    struct.pack_into('<I', header, 124, evtx_parser.file_header_checksum(header))
+    return bytes(header)
+
+
+def write_synthetic_evtx(path, record_count, seed=0, start=None, first_record_id=1):
+    rng = random.Random(seed)
+    moment = start or datetime.datetime(2025, 2, 1, 5, 0, 0)
+    pending = []
+    chunks = []
+    record_id = first_record_id
+    while record_id < first_record_id + record_count or pending:
+        while len(pending) < 400 and record_id < first_record_id + record_count:
+            moment += datetime.timedelta(milliseconds=rng.randint(1, 900))
+            pending.append((record_id, moment, synthetic_values(record_id, moment, rng)))
+            record_id += 1
+        chunk, used = build_chunk(pending)
+        chunks.append(chunk)
+        pending = pending[used:]
+    with open(path, 'wb') as f:
+        f.write(build_file_header(len(chunks), record_id))
+        for chunk in chunks:
+            f.write(chunk)
+    return len(chunks)
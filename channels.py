@@ -0,0 +1,226 @@
+import concurrent.futures
+import logging
+import os
+import threading
+
+import collection
+import metrics
+import scheduler
+import sigma
+
+# Concurrent per-channel collection for main.py. Every configured channel has
+# its own worker: a record cursor (collection.IncrementalCollector), a batch
+# size and an adaptive cadence between its own interval bounds. Due workers run
+# on a bounded thread pool, never two runs of one channel at a time, so a slow
+# channel or a long wevtutil export holds one pool thread instead of delaying
+# every other channel. A worker that fails is retried at its longest interval
+# and reopens its source. Sources are collection.EventSource objects, so off
+# Windows the workers run over fakes (benchmarks/bench_channels.py).
+
+DEFAULTS = {
+    'batch_size': 1000,
+    'min_interval': 60,
+    'max_interval': 600,
+    'target_events': 5000,
+    # First run of a channel: 'end' collects only what arrives from now on, 'oldest' backfills the log
+    'start_at': 'end',
+    # Also export the collected record range as .evtx
+    'evtx': True,
+}
+DEFAULT_CHANNELS = ('System', 'Security', 'Application')
+
+CHANNEL_EVENTS = metrics.counter('collector_channel_events_total', 'Events collected per channel', ('channel',))
+CHANNEL_ERRORS = metrics.counter('collector_channel_errors_total', 'Failed collection runs per channel', ('channel',))
+CHANNEL_SECONDS = metrics.histogram('collector_channel_run_seconds', 'Duration of one collection run per channel', ('channel',))
+CHANNEL_LATENESS = metrics.histogram('collector_channel_lateness_seconds', 'Time a due channel waited for a pool thread', ('channel',))
+
+
+def file_name(channel):
+    """The channel as it appears in file names, as in winevt\\Logs (Microsoft-Windows-Sysmon%4Operational)."""
+    return channel.replace('/', '%4')
+
+
+class ChannelSettings:
+    def __init__(self, name, **options):
+        unknown = set(options) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"Channel {name}: unknown settings {', '.join(sorted(unknown))}")
+        self.name = name
+        values = dict(DEFAULTS, **options)
+        self.batch_size = int(values['batch_size'])
+        self.min_interval = float(values['min_interval'])
+        self.max_interval = float(values['max_interval'])
+        self.target_events = int(values['target_events'])
+        self.start_at = values['start_at']
+        self.evtx = bool(values['evtx'])
+        if self.batch_size <= 0 or self.target_events <= 0:
+            raise ValueError(f"Channel {name}: batch_size and target_events must be positive")
+        if not 0 < self.min_interval <= self.max_interval:
+            raise ValueError(f"Channel {name}: need 0 < min_interval <= max_interval")
+        if self.start_at not in ('end', 'oldest'):
+            raise ValueError(f"Channel {name}: start_at must be 'end' or 'oldest'")
+
+    def __repr__(self):
+        return f"ChannelSettings({self.name!r}, every {self.min_interval:g}-{self.max_interval:g}s)"
+
+
+def load_channels(path=None):
+    """Channel settings from a YAML file (`defaults:` plus a `channels:` list), or the classic three."""
+    if not path or not os.path.exists(path):
+        return [ChannelSettings(name) for name in DEFAULT_CHANNELS]
+    config = sigma.load_yaml(path) or {}
+    defaults = config.get('defaults') or {}
+    settings = []
+    for entry in config.get('channels') or []:
+        if isinstance(entry, str):
+            entry = {'name': entry}
+        entry = dict(entry)
+        if not entry.get('name'):
+            raise ValueError(f"{path}: every channel needs a name")
+        if entry.pop('enabled', True):
+            settings.append(ChannelSettings(entry.pop('name'), **dict(defaults, **entry)))
+    names = [channel.name for channel in settings]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{path}: a channel is listed twice")
+    return settings
+
+
+class ChannelWorker:
+    """Collects one channel from its cursor, on its own cadence.
+
+    `open_source(channel)` returns a collection.EventSource. `handle(worker,
+    logs)` consumes the stream of new events and returns how many it took;
+    the cursor is committed only after it returns, so a failed run is read
+    again next time.
+    """
+
+    def __init__(self, settings, open_source, cursors, handle, clock=None):
+        self.settings = settings
+        self.name = settings.name
+        self.open_source = open_source
+        self.cursors = cursors
+        self.handle = handle
+        self.clock = clock or scheduler.SystemClock()
+        self.policy = scheduler.AdaptiveInterval(settings.min_interval, settings.max_interval,
+                                                 settings.target_events, initial=settings.min_interval)
+        self.source = None
+        self.collector = None
+        self.deadline = self.clock.monotonic()
+        self.last_run = None
+        self.stats = {'runs': 0, 'events': 0, 'errors': 0, 'seconds': 0.0, 'lateness': 0.0}
+
+    def _open(self):
+        if self.collector is None:
+            self.source = self.open_source(self.name)
+            self.collector = collection.IncrementalCollector(self.source, self.cursors, self.settings.batch_size,
+                                                             self.settings.start_at)
+        return self.collector
+
+    def _close(self):
+        source, self.source, self.collector = self.source, None, None
+        if source is not None:
+            try:
+                source.close()
+            except Exception as e:
+                logging.error(f"Error closing {self.name} log: {str(e)}")
+
+    def run(self):
+        """One collection run; returns the number of events taken."""
+        started = self.clock.monotonic()
+        lateness = max(0.0, started - self.deadline)
+        CHANNEL_LATENESS.labels(channel=self.name).observe(lateness)
+        self.stats['lateness'] = max(self.stats['lateness'], lateness)
+        count = 0
+        try:
+            collector = self._open()
+            count = self.handle(self, (log for batch in collector.batches() for log in batch))
+            collector.commit()
+            covered = started - self.last_run if self.last_run is not None else self.policy.interval
+            interval = self.policy.update(count, covered)
+        except Exception as e:
+            self.stats['errors'] += 1
+            CHANNEL_ERRORS.labels(channel=self.name).inc()
+            logging.error(f"Error collecting {self.name} log: {str(e)}")
+            self._close()
+            interval = self.settings.max_interval
+        self.last_run = started
+        finished = self.clock.monotonic()
+        self.stats['runs'] += 1
+        self.stats['events'] += count
+        self.stats['seconds'] += finished - started
+        CHANNEL_EVENTS.labels(channel=self.name).inc(count)
+        CHANNEL_SECONDS.labels(channel=self.name).observe(finished - started)
+        # Drift-free while on time; an overrun starts the next interval from now
+        self.deadline = max(self.deadline + interval, finished)
+        if count:
+            logging.info(f"Collected {count} events from {self.name} log; next run in {self.deadline - finished:.0f}s")
+        return count
+
+    def close(self):
+        self._close()
+
+
+class ChannelCollector:
+    """Runs due channel workers on a bounded thread pool.
+
+    Typical use:
+
+        collector = ChannelCollector(workers, threads=4)
+        collector.run(stop)            # until stop (a threading.Event) is set
+    """
+
+    def __init__(self, workers, threads=4, clock=None, after_run=None):
+        self.workers = list(workers)
+        self.threads = max(1, min(threads, len(self.workers) or 1))
+        self.clock = clock or scheduler.SystemClock()
+        # Called on the coordinating thread after each finished run
+        self.after_run = after_run
+        self.running = {}
+
+    def _submit_due(self, pool):
+        now = self.clock.monotonic()
+        busy = set(self.running.values())
+        # Most overdue first, so a pool that is short of threads stays fair
+        for worker in sorted(self.workers, key=lambda w: w.deadline):
+            if worker.deadline > now or worker in busy:
+                continue
+            self.running[pool.submit(worker.run)] = worker
+
+    def _next_deadline(self):
+        busy = set(self.running.values())
+        idle = [worker.deadline for worker in self.workers if worker not in busy]
+        return min(idle) if idle else None
+
+    def run(self, stop=None, rounds=None):
+        """Collect until `stop` is set (or each worker has run `rounds` times)."""
+        stop = stop or threading.Event()
+        with concurrent.futures.ThreadPoolExecutor(self.threads, thread_name_prefix='channel') as pool:
+            try:
+                while not stop.is_set():
+                    if rounds is not None and all(w.stats['runs'] >= rounds for w in self.workers):
+                        break
+                    self._submit_due(pool)
+                    deadline = self._next_deadline()
+                    timeout = None if deadline is None else max(0.0, deadline - self.clock.monotonic())
+                    if rounds is not None and not self.running and timeout is None:
+                        break
+                    if not self.running:
+                        stop.wait(timeout)
+                        continue
+                    done, _ = concurrent.futures.wait(list(self.running), timeout=timeout,
+                                                      return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        worker = self.running.pop(future)
+                        if self.after_run:
+                            try:
+                                self.after_run(worker)
+                            except Exception as e:
+                                logging.error(f"Error after collecting {worker.name} log: {str(e)}")
+            finally:
+                # Runs in progress finish and commit; queued ones are dropped
+                pool.shutdown(wait=True, cancel_futures=True)
+                for worker in self.workers:
+                    worker.close()
+
+    def stats(self):
+        return {worker.name: dict(worker.stats, interval=worker.policy.interval) for worker in self.workers}
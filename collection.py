@@ -0,0 +1,280 @@
+import datetime
+import json
+import logging
+import os
+import threading
+
+import atomic
+
+# Incremental, gap-free collection. Each channel keeps the last processed
+# record number in a small state file; every cycle reads forward from that
+# cursor in bounded batches until it has caught up with the log. Classic
+# logs (System, Security, Application) are read with ReadEventLog; operational
+# channels (Microsoft-Windows-Sysmon/Operational, ...) only through EvtQuery.
+
+
+class CursorStore:
+    """Per-channel record cursors persisted atomically to a JSON state file.
+
+    Channels collected on different threads can share one store.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.cursors = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.cursors = json.load(f)
+            except Exception as e:
+                logging.error(f"Error reading cursor state {path}: {str(e)}")
+
+    def get(self, channel):
+        cursor = self.cursors.get(channel)
+        return cursor['record'] if cursor else None
+
+    def set(self, channel, record):
+        with self.lock:
+            self.cursors[channel] = {
+                'record': record,
+                'updated': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }
+            self._save()
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        with atomic.replacing(self.path, prefix='.cursor-') as f:
+            json.dump(self.cursors, f, indent=2)
+
+
+class EventSource:
+    """A channel whose records can be read forward by record number."""
+
+    channel = None
+
+    def bounds(self):
+        """Return (oldest, newest) record numbers, or (None, None) for an empty log."""
+        raise NotImplementedError
+
+    def read_forward(self, start, limit):
+        """Return up to `limit` raw records with record number >= start, in order."""
+        raise NotImplementedError
+
+    def record_number(self, record):
+        raise NotImplementedError
+
+    def format(self, record):
+        return record
+
+    def close(self):
+        pass
+
+
+class WindowsEventSource(EventSource):
+    def __init__(self, channel, format_record=None):
+        import win32evtlog
+        self._api = win32evtlog
+        self.channel = channel
+        self._format = format_record
+        self._handle = win32evtlog.OpenEventLog(None, channel)
+
+    def bounds(self):
+        count = self._api.GetNumberOfEventLogRecords(self._handle)
+        if not count:
+            return None, None
+        oldest = self._api.GetOldestEventLogRecord(self._handle)
+        return oldest, oldest + count - 1
+
+    def read_forward(self, start, limit):
+        records = []
+        flags = self._api.EVENTLOG_SEEK_READ | self._api.EVENTLOG_FORWARDS_READ
+        while len(records) < limit:
+            events = self._api.ReadEventLog(self._handle, flags, start)
+            if not events:
+                break
+            records.extend(events)
+            # Continue from where the seek left off
+            flags = self._api.EVENTLOG_SEQUENTIAL_READ | self._api.EVENTLOG_FORWARDS_READ
+        return records[:limit]
+
+    def record_number(self, record):
+        return record.RecordNumber
+
+    def format(self, record):
+        return self._format(record) if self._format else record
+
+    def close(self):
+        self._api.CloseEventLog(self._handle)
+
+
+class WindowsChannelSource(EventSource):
+    """Any channel by name, including operational ones, through the EvtQuery API.
+
+    Records are rendered to event XML; `format_record(channel, xml, handle)`
+    turns them into events, with the live handle for EvtFormatMessage.
+    """
+
+    def __init__(self, channel, format_record=None):
+        import win32evtlog
+        self._api = win32evtlog
+        self.channel = channel
+        self._format = format_record
+        self._log = win32evtlog.EvtOpenLog(channel, win32evtlog.EvtOpenChannelPath)
+
+    def bounds(self):
+        count, _ = self._api.EvtGetLogInfo(self._log, self._api.EvtLogNumberOfLogRecords)
+        if not count:
+            return None, None
+        oldest, _ = self._api.EvtGetLogInfo(self._log, self._api.EvtLogOldestRecordNumber)
+        return oldest, oldest + count - 1
+
+    def read_forward(self, start, limit):
+        query = self._api.EvtQuery(self.channel,
+                                   self._api.EvtQueryChannelPath | self._api.EvtQueryForwardDirection,
+                                   f"*[System[EventRecordID>={start}]]")
+        records = []
+        while len(records) < limit:
+            handles = self._api.EvtNext(query, min(limit - len(records), 256))
+            if not handles:
+                break
+            for handle in handles:
+                xml = self._api.EvtRender(handle, self._api.EvtRenderEventXml)
+                records.append((_record_id(xml), xml, handle))
+        return records
+
+    def record_number(self, record):
+        return record[0]
+
+    def format(self, record):
+        _, xml, handle = record
+        return self._format(self.channel, xml, handle) if self._format else xml
+
+
+def _record_id(xml):
+    start = xml.index('<EventRecordID>') + len('<EventRecordID>')
+    return int(xml[start:xml.index('<', start)])
+
+
+class FileEventSource(EventSource):
+    """Fake source over a JSON list or NDJSON file of event dicts, for tests off Windows.
+
+    Records without a RecordNumber are numbered from 1 in file order. The file is
+    re-read on every call so tests can append to it, truncate it (a clear) or drop
+    its head (a wrap) between cycles.
+    """
+
+    def __init__(self, path, channel='Security'):
+        self.path = path
+        self.channel = channel
+
+    def _records(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r') as f:
+            text = f.read()
+        if text.lstrip().startswith('['):
+            records = json.loads(text)
+        else:
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        for number, record in enumerate(records, 1):
+            record.setdefault('RecordNumber', number)
+        return records
+
+    def bounds(self):
+        records = self._records()
+        if not records:
+            return None, None
+        return records[0]['RecordNumber'], records[-1]['RecordNumber']
+
+    def read_forward(self, start, limit):
+        selected = [r for r in self._records() if r['RecordNumber'] >= start]
+        return selected[:limit]
+
+    def record_number(self, record):
+        return record['RecordNumber']
+
+
+class IncrementalCollector:
+    """Reads a source forward from its persisted cursor in bounded batches.
+
+    Typical use:
+
+        for batch in collector.batches():
+            process(batch)
+            collector.commit()
+    """
+
+    def __init__(self, source, cursors, batch_size=1000, start_at='end'):
+        self.source = source
+        self.cursors = cursors
+        self.batch_size = batch_size
+        self.start_at = start_at
+        self.first = None
+        self.position = None
+        self.lost = 0
+
+    def _start(self):
+        # (first record to read, newest record now), or None when there is nothing new
+        channel = self.source.channel
+        oldest, newest = self.source.bounds()
+        cursor = self.cursors.get(channel)
+        if oldest is None:
+            return None
+        if cursor is None:
+            # First run: begin at the end of the log unless asked to backfill
+            if self.start_at == 'end':
+                self.cursors.set(channel, newest)
+                return None
+            start = oldest
+        elif newest < cursor:
+            logging.warning(f"{channel} log was cleared or reset (cursor {cursor}, newest {newest}); restarting at {oldest}")
+            start = oldest
+        elif oldest > cursor + 1:
+            self.lost += oldest - cursor - 1
+            logging.warning(f"{channel} log wrapped: {oldest - cursor - 1} records were overwritten before collection")
+            start = oldest
+        else:
+            start = cursor + 1
+        # Caught up: a seek past the last record can fail rather than return nothing
+        return (start, newest) if start <= newest else None
+
+    def batches(self):
+        self.first = self.position = None
+        bounds = self._start()
+        if bounds is None:
+            return
+        start, newest = bounds
+        self.first = start
+        while True:
+            records = self.source.read_forward(start, self.batch_size)
+            if not records:
+                return
+            batch = []
+            for record in records:
+                try:
+                    batch.append(self.source.format(record))
+                except Exception as e:
+                    logging.error(f"Error processing event: {str(e)}")
+            self.position = self.source.record_number(records[-1])
+            start = self.position + 1
+            yield batch
+            if len(records) < self.batch_size or start > newest:
+                return
+
+    def commit(self, position=None):
+        """Persist the cursor at `position` (default: the end of the last batch)."""
+        position = self.position if position is None else position
+        if position is not None:
+            self.cursors.set(self.source.channel, position)
+
+    def collect(self):
+        """Collect everything new in one list and commit; for callers without batching."""
+        events = []
+        for batch in self.batches():
+            events.extend(batch)
+        self.commit()
+        return events
@@ -0,0 +1,286 @@
+import collections
+import datetime
+import glob
+import json
+import logging
+import os
+import re
+
+import yaml
+
+import atomic
+import sigma
+
+# Stateful Sigma correlation rules (`event_count`, `value_count`, `temporal`)
+# evaluated on top of the single-event matches. Windows slide over event time
+# per group-by key. Each group keeps at most as many entries as its threshold
+# needs, idle groups expire from the front of an LRU, and the whole state can
+# be checkpointed so windows survive restarts and span collection cycles.
+
+TIMESPAN = re.compile(r'^(\d+)([smhd])$')
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+OPERATORS = {
+    'gte': lambda count, limit: count >= limit,
+    'gt': lambda count, limit: count > limit,
+    'eq': lambda count, limit: count == limit,
+}
+
+
+def parse_timespan(value):
+    match = TIMESPAN.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Unsupported timespan '{value}'")
+    return int(match.group(1)) * UNITS[match.group(2)]
+
+
+def event_time(timestamp):
+    # Hit timestamps are ISO strings from sigma.format_timestamp()
+    if not timestamp:
+        return None
+    try:
+        moment = datetime.datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+def load_documents(rules_path):
+    """Every YAML document under `rules_path`, split into (base rules, correlations)."""
+    rules = []
+    correlations = []
+    paths = sorted(glob.glob(os.path.join(rules_path, '**', '*.yml'), recursive=True))
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                documents = list(yaml.load_all(f, Loader=sigma._RuleLoader))
+        except Exception as e:
+            logging.error(f"Error loading Sigma rule {path}: {str(e)}")
+            continue
+        for document in documents:
+            if not isinstance(document, dict):
+                continue
+            if 'correlation' in document:
+                correlations.append((path, document))
+            elif 'detection' in document:
+                rules.append((path, document))
+    return rules, correlations
+
+
+class Correlation:
+    """One compiled correlation rule and its per-group sliding windows."""
+
+    def __init__(self, rule, mapping, path=None):
+        spec = rule['correlation']
+        self.path = path
+        self.id = rule.get('id')
+        self.name = rule.get('name')
+        self.title = rule.get('title', '')
+        self.level = sigma.LEVELS.get(rule.get('level'), rule.get('level'))
+        self.status = sigma.STATUSES.get(rule.get('status'), rule.get('status'))
+        self.authors = sigma.split_authors(rule.get('author'))
+        self.tags = rule.get('tags') or []
+        self.falsepositives = rule.get('falsepositives') or []
+        self.type = spec['type']
+        if self.type not in ('event_count', 'value_count', 'temporal'):
+            raise ValueError(f"Unsupported correlation type '{self.type}'")
+        self.rules = [str(r) for r in (spec.get('rules') or [])]
+        if not self.rules:
+            raise ValueError("Correlation references no rules")
+        self.generate = bool(spec.get('generate', False))
+        group_by = spec.get('group-by') or []
+        self.group_by = [group_by] if isinstance(group_by, str) else list(group_by)
+        self.group_paths = [sigma.field_path(mapping, field) for field in self.group_by]
+        self.timespan = parse_timespan(spec.get('timespan') or spec.get('timeframe'))
+
+        condition = dict(spec.get('condition') or {})
+        self.value_field = condition.pop('field', None)
+        self.value_path = sigma.field_path(mapping, self.value_field) if self.value_field else None
+        if self.type == 'temporal':
+            self.operator, self.limit = None, len(self.rules)
+        else:
+            if len(condition) != 1 or next(iter(condition)) not in OPERATORS:
+                raise ValueError(f"Unsupported correlation condition {spec.get('condition')}")
+            operator, limit = next(iter(condition.items()))
+            self.operator, self.limit = OPERATORS[operator], int(limit)
+            if self.type == 'value_count' and not self.value_path:
+                raise ValueError("value_count correlation needs condition.field")
+        # Entries a group must remember to decide the condition
+        self.capacity = self.limit + 1 if self.operator is OPERATORS['gt'] else self.limit
+        self.groups = collections.OrderedDict()
+
+    def group_key(self, document):
+        return tuple(sigma.to_text(sigma.resolve(document, path)) for path in self.group_paths)
+
+    def _expire(self, now):
+        # Groups are in last-touched order, so idle ones sit at the front
+        horizon = now - self.timespan
+        while self.groups:
+            key, state = next(iter(self.groups.items()))
+            if state['last'] >= horizon:
+                break
+            self.groups.popitem(last=False)
+
+    def observe(self, document, key, ref, now, max_groups):
+        """Feed one base-rule match; returns the window contents when the rule fires."""
+        record_id = sigma.resolve(document, ('Event', 'System', 'EventRecordID'))
+        state = self.groups.pop(key, None)
+        if state is None:
+            state = {'last': now, 'entries': collections.OrderedDict() if self.type != 'event_count'
+                     else collections.deque(maxlen=self.capacity)}
+        state['last'] = max(state['last'], now)
+        self.groups[key] = state
+        self._expire(now)
+        while len(self.groups) > max_groups:
+            self.groups.popitem(last=False)
+
+        entries = state['entries']
+        horizon = now - self.timespan
+        if self.type == 'event_count':
+            entries.append((now, record_id))
+            while entries[0][0] < horizon:
+                entries.popleft()
+            count = len(entries)
+        else:
+            if self.type == 'value_count':
+                value = sigma.to_text(sigma.resolve(document, self.value_path))
+            else:
+                value = ref
+            entries.pop(value, None)
+            entries[value] = (now, record_id)
+            while entries and next(iter(entries.values()))[0] < horizon:
+                entries.popitem(last=False)
+            while len(entries) > self.capacity:
+                entries.popitem(last=False)
+            count = len(entries)
+
+        if self.type == 'temporal':
+            fired = count >= self.limit
+        else:
+            fired = self.operator(count, self.limit)
+        if not fired:
+            return None
+        # Start a fresh window so a sustained burst fires once per threshold
+        del self.groups[key]
+        if self.type == 'event_count':
+            return count, [r for _, r in entries], None
+        return count, [r for _, r in entries.values()], list(entries)
+
+    def hit(self, document, path, timestamp, key, count, record_ids, values):
+        aggregate = {
+            'type': self.type,
+            'group_by': dict(zip(self.group_by, key)),
+            'count': count,
+            'timespan': self.timespan,
+            'event_record_ids': record_ids,
+        }
+        if values is not None:
+            aggregate['values' if self.type == 'value_count' else 'rules'] = values
+        return {
+            'group': 'Sigma',
+            'kind': 'aggregate',
+            'document': {
+                'kind': 'evtx',
+                'path': path,
+                'data': document,
+            },
+            'aggregate': aggregate,
+            'name': self.title,
+            'timestamp': timestamp,
+            'authors': self.authors,
+            'level': self.level,
+            'source': 'sigma',
+            'status': self.status,
+            'falsepositives': self.falsepositives,
+            'id': self.id,
+            'logsource': {},
+            'tags': self.tags,
+        }
+
+    def state(self):
+        groups = []
+        for key, group in self.groups.items():
+            entries = group['entries']
+            items = [list(e) for e in entries] if self.type == 'event_count' else [[v, t, r] for v, (t, r) in entries.items()]
+            groups.append([list(key), group['last'], items])
+        return groups
+
+    def restore(self, groups):
+        self.groups.clear()
+        for key, last, items in groups:
+            if self.type == 'event_count':
+                entries = collections.deque((tuple(item) for item in items), maxlen=self.capacity)
+            else:
+                entries = collections.OrderedDict((v, (t, r)) for v, t, r in items)
+            self.groups[tuple(key)] = {'last': last, 'entries': entries}
+
+
+class Correlator:
+    """Routes base-rule matches to the correlations that reference them."""
+
+    def __init__(self, correlations, max_groups=50000):
+        self.correlations = correlations
+        self.max_groups = max_groups
+        self.by_rule = {}
+        for correlation in correlations:
+            for ref in correlation.rules:
+                self.by_rule.setdefault(ref, []).append(correlation)
+        # Base rules whose own matches are only inputs to a correlation
+        self.silent = {ref for c in correlations if not c.generate for ref in c.rules}
+
+    @classmethod
+    def from_documents(cls, documents, mapping, max_groups=50000):
+        compiled = []
+        for path, rule in documents:
+            try:
+                compiled.append(Correlation(rule, mapping, path))
+            except Exception as e:
+                logging.error(f"Error compiling Sigma correlation {path}: {str(e)}")
+        logging.info(f"Compiled {len(compiled)} Sigma correlation rules")
+        return cls(compiled, max_groups)
+
+    def refs(self, rule):
+        return [ref for ref in (rule.id, rule.name) if ref and ref in self.by_rule]
+
+    def is_silent(self, rule):
+        return rule.id in self.silent or (rule.name is not None and rule.name in self.silent)
+
+    def observe(self, document, rules, path, timestamp):
+        """Correlation hits triggered by `document`, which matched `rules`."""
+        now = event_time(timestamp)
+        if now is None:
+            return []
+        hits = []
+        for rule in rules:
+            for ref in self.refs(rule):
+                for correlation in self.by_rule[ref]:
+                    key = correlation.group_key(document)
+                    result = correlation.observe(document, key, ref, now, self.max_groups)
+                    if result:
+                        hits.append(correlation.hit(document, path, timestamp, key, *result))
+        return hits
+
+    def active_groups(self):
+        return sum(len(c.groups) for c in self.correlations)
+
+    def save(self, path):
+        state = {c.id or c.title: {'type': c.type, 'timespan': c.timespan, 'groups': c.state()}
+                 for c in self.correlations}
+        with atomic.replacing(path, prefix='.correlation-') as f:
+            json.dump(state, f, separators=(',', ':'), default=str)
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+        except Exception as e:
+            logging.error(f"Error reading correlation state {path}: {str(e)}")
+            return
+        for correlation in self.correlations:
+            saved = state.get(correlation.id or correlation.title)
+            # A changed rule starts over rather than reuse windows built for other settings
+            if saved and saved['type'] == correlation.type and saved['timespan'] == correlation.timespan:
+                correlation.restore(saved['groups'])
@@ -0,0 +1,240 @@
+import datetime
+import logging
+import os
+
+import metrics
+import serializer
+import sigma
+
+# Edge filter between collection and upload. Rules from a small YAML file are
+# compiled once into a decision table keyed by EventID: each EventID maps to
+# the ordered list of rules that can apply to it, so an event only meets
+# those, and a rule's SourceName / EventType / field tests are plain set
+# lookups. Field tests read "Label: value" lines of the rendered message and
+# are only parsed for events whose rules need them. The first matching rule
+# decides: allow, drop, or sample (keep one event in `rate`). Detection reads
+# the event log on its own, so filtering never hides events from Sigma.
+
+ACTIONS = ('allow', 'drop', 'sample')
+DEFAULT_RULE = 'default'
+MODIFIERS = {
+    '': lambda value, needles: value in needles,
+    'contains': lambda value, needles: any(needle in value for needle in needles),
+    'startswith': lambda value, needles: value.startswith(tuple(needles)),
+    'endswith': lambda value, needles: value.endswith(tuple(needles)),
+}
+
+FILTERED = metrics.counter('evtx_edge_filter_events_total', 'Events decided by each edge filter rule', ('rule', 'action'))
+
+
+def message_fields(text, wanted=None):
+    """Values of the "Label:<tab>value" lines of a rendered event message.
+
+    Each value is available under its label and under "Section.Label" when it
+    sits below a section heading such as "Subject:" or "New Logon:". The first
+    occurrence of a bare label wins. With `wanted`, parsing stops once all of
+    those labels have been seen.
+    """
+    fields = {}
+    section = None
+    remaining = set(wanted) if wanted else None
+    for line in text.splitlines():
+        if not line.strip():
+            section = None
+            continue
+        label, colon, value = line.strip().partition(':')
+        if not colon or not label:
+            continue
+        value = value.strip()
+        if not value and not line.startswith('\t'):
+            section = label
+            continue
+        if section and line.startswith('\t'):
+            fields.setdefault(f"{section}.{label}", value)
+            if remaining is not None:
+                remaining.discard(f"{section}.{label}")
+        fields.setdefault(label, value)
+        if remaining is not None:
+            remaining.discard(label)
+            if not remaining:
+                break
+    return fields
+
+
+def _values(value):
+    return value if isinstance(value, list) else [value]
+
+
+class FilterRule:
+    """One compiled rule; `hits` counts the events it decided."""
+
+    __slots__ = ('name', 'action', 'rate', 'event_ids', 'sources', 'event_types', 'fields', 'countdown', 'hits', 'kept')
+
+    def __init__(self, spec, position):
+        self.name = str(spec.get('name') or f"rule{position}")
+        self.action = spec.get('action', 'drop')
+        if self.action not in ACTIONS:
+            raise ValueError(f"Edge filter rule {self.name}: unknown action '{self.action}'")
+        self.rate = int(spec.get('rate', 1))
+        if self.action == 'sample' and self.rate < 1:
+            raise ValueError(f"Edge filter rule {self.name}: sample rate must be at least 1")
+        self.event_ids = {int(v) for v in _values(spec['EventID'])} if 'EventID' in spec else None
+        self.sources = {str(v).lower() for v in _values(spec['SourceName'])} if 'SourceName' in spec else None
+        self.event_types = {str(v).lower() for v in _values(spec['EventType'])} if 'EventType' in spec else None
+        self.fields = []
+        for key, expected in (spec.get('fields') or {}).items():
+            label, _, modifier = key.partition('|')
+            if modifier not in MODIFIERS:
+                raise ValueError(f"Edge filter rule {self.name}: unsupported modifier '{modifier}'")
+            needles = [str(v).lower() for v in _values(expected)]
+            self.fields.append((label, MODIFIERS[modifier], set(needles) if not modifier else needles))
+        self.countdown = 1
+        self.hits = 0
+        self.kept = 0
+
+    def matches(self, source, event_type, fields):
+        if self.sources is not None and str(source).lower() not in self.sources:
+            return False
+        if self.event_types is not None and str(event_type).lower() not in self.event_types:
+            return False
+        if self.fields:
+            values = fields()
+            for label, test, needles in self.fields:
+                value = values.get(label)
+                if value is None or not test(value.lower(), needles):
+                    return False
+        return True
+
+    def keep(self):
+        self.hits += 1
+        if self.action == 'allow':
+            keep = True
+        elif self.action == 'drop':
+            keep = False
+        else:
+            self.countdown -= 1
+            keep = not self.countdown
+            if keep:
+                self.countdown = self.rate
+        if keep:
+            self.kept += 1
+        return keep
+
+
+class EdgeFilter:
+    """Decides per event whether it is uploaded.
+
+    Typical use:
+
+        edge = EdgeFilter.load('filters/edge.yml')
+        for log in edge.apply(logs, dropped=DroppedLog('dropped')):
+            upload(log)
+    """
+
+    def __init__(self, specs=(), default='allow'):
+        if default not in ('allow', 'drop'):
+            raise ValueError(f"Edge filter default must be allow or drop, not '{default}'")
+        self.rules = [FilterRule(spec, position) for position, spec in enumerate(specs, 1)]
+        self.default = FilterRule({'name': DEFAULT_RULE, 'action': default}, 0)
+        # EventID -> (rules that can apply, message labels they test). Rules
+        # without an EventID apply to every event, in file order with the rest
+        self.wildcard = self._bucket([rule for rule in self.rules if rule.event_ids is None])
+        self.table = {}
+        for event_id in set().union(*(rule.event_ids for rule in self.rules if rule.event_ids is not None)):
+            self.table[event_id] = self._bucket([rule for rule in self.rules
+                                                 if rule.event_ids is None or event_id in rule.event_ids])
+        self.seen = 0
+        self.kept = 0
+        self.counters = {}
+
+    @staticmethod
+    def _bucket(rules):
+        return rules, frozenset(label for rule in rules for label, _, _ in rule.fields)
+
+    @classmethod
+    def load(cls, path):
+        config = sigma.load_yaml(path) or {}
+        return cls(config.get('rules') or [], config.get('default', 'allow'))
+
+    def decide(self, log):
+        """The rule that decided `log`, and whether the event is uploaded."""
+        if isinstance(log, dict):
+            event_id, source, event_type = log.get('EventID'), log.get('SourceName'), log.get('EventType')
+        else:
+            event_id, source, event_type = log.event_id, log.source, log.event_type
+        try:
+            # ReadEventLog reports qualifier bits above the 16-bit event code
+            event_id = int(event_id) & 0xFFFF
+        except (TypeError, ValueError):
+            event_id = None
+        rules, labels = self.table.get(event_id, self.wildcard)
+        fields = None
+
+        def parsed():
+            nonlocal fields
+            if fields is None:
+                fields = message_fields(str(log['Message'] if isinstance(log, dict) else log.message), labels)
+            return fields
+
+        self.seen += 1
+        for rule in rules:
+            if rule.matches(source, event_type, parsed):
+                break
+        else:
+            rule = self.default
+        keep = rule.keep()
+        if keep:
+            self.kept += 1
+        counter = self.counters.get((rule.name, keep))
+        if counter is None:
+            action = rule.action if rule.action != 'sample' else ('sampled' if keep else 'dropped')
+            counter = self.counters[(rule.name, keep)] = FILTERED.labels(rule=rule.name, action=action)
+        counter.inc()
+        return rule, keep
+
+    def apply(self, logs, dropped=None):
+        """Yield the events to upload; the others go to `dropped` when given."""
+        for log in logs:
+            if self.decide(log)[1]:
+                yield log
+            elif dropped is not None:
+                try:
+                    dropped.write(log)
+                except Exception as e:
+                    logging.error(f"Error keeping dropped event: {str(e)}")
+
+    def stats(self):
+        return {
+            'seen': self.seen,
+            'kept': self.kept,
+            'rules': {rule.name: {'action': rule.action, 'hits': rule.hits, 'kept': rule.kept}
+                      for rule in self.rules + [self.default]},
+        }
+
+
+class DroppedLog:
+    """Filtered-out events kept on disk as daily NDJSON files."""
+
+    def __init__(self, folder, prefix='dropped'):
+        self.folder = folder
+        self.prefix = prefix
+        self.day = None
+        self.file = None
+        os.makedirs(folder, exist_ok=True)
+
+    def write(self, log):
+        day = datetime.datetime.now().strftime('%Y%m%d')
+        if day != self.day:
+            self.close()
+            self.file = open(os.path.join(self.folder, f"{self.prefix}_{day}.ndjson"), 'ab')
+            self.day = day
+        self.file.write(serializer.ndjson_event(log))
+
+    def flush(self):
+        if self.file:
+            self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,397 @@
+import collections
+import glob
+import json
+import logging
+import os
+import re
+import threading
+
+import serializer
+
+# Structured EventData from rendered message text. A rendered Security message
+# is a fixed sequence of lines for a given (SourceName, EventID): headings
+# such as "Subject:", "Label:<tabs>value" lines and free text, with only the
+# values changing. The first message seen for a key is parsed line by line and
+# its layout, the exact text before each value and the line it sits on, is
+# compiled into a positional splitter. Later messages are cut at those offsets
+# and only the label prefixes are checked; a message that does not fit adds
+# another layout variant for that key. Labels are mapped to the EventData
+# names of the event's XML (TargetUserName, LogonType, IpAddress, ...), and
+# lines continuing a value, as in the Privileges list, make it a list.
+
+PROVIDER = 'Microsoft-Windows-Security-Auditing'
+AUDIT_SUCCESS = '0x8020000000000000'
+AUDIT_FAILURE = '0x8010000000000000'
+
+# "Label:<tabs>value", or "Heading:" alone on its line
+LABEL = re.compile(r'[ \t]*([^\t:]{1,64}):(\t+|$)')
+
+# Account blocks: section -> name prefix, label -> name suffix
+ACCOUNT_SECTIONS = {
+    'Subject': 'Subject',
+    'Creator Subject': 'Subject',
+    'New Logon': 'Target',
+    'Target Subject': 'Target',
+    'Account For Which Logon Failed': 'Target',
+    'Account Whose Credentials Were Used': 'Target',
+    'Account Information': 'Target',
+}
+ACCOUNT_FIELDS = {
+    'Security ID': 'UserSid',
+    'Account Name': 'UserName',
+    'Account Domain': 'DomainName',
+    'Logon ID': 'LogonId',
+    'Linked Logon ID': 'LinkedLogonId',
+    'Logon GUID': 'LogonGuid',
+}
+
+FIELD_NAMES = {
+    'Logon Type': 'LogonType',
+    'Restricted Admin Mode': 'RestrictedAdminMode',
+    'Virtual Account': 'VirtualAccount',
+    'Elevated Token': 'ElevatedToken',
+    'Impersonation Level': 'ImpersonationLevel',
+    'Network Account Name': 'TargetOutboundUserName',
+    'Network Account Domain': 'TargetOutboundDomainName',
+    'Workstation Name': 'WorkstationName',
+    'Source Network Address': 'IpAddress',
+    'Source Port': 'IpPort',
+    'Client Address': 'IpAddress',
+    'Client Port': 'IpPort',
+    'Process ID': 'ProcessId',
+    'Process Name': 'ProcessName',
+    'New Process ID': 'NewProcessId',
+    'New Process Name': 'NewProcessName',
+    'Token Elevation Type': 'TokenElevationType',
+    'Mandatory Label': 'MandatoryLabel',
+    'Creator Process ID': 'ProcessId',
+    'Creator Process Name': 'ParentProcessName',
+    'Process Command Line': 'CommandLine',
+    'Logon Process': 'LogonProcessName',
+    'Authentication Package': 'AuthenticationPackageName',
+    'Transited Services': 'TransmittedServices',
+    'Package Name (NTLM only)': 'LmPackageName',
+    'Key Length': 'KeyLength',
+    'Privileges': 'PrivilegeList',
+    'Failure Reason': 'FailureReason',
+    'Status': 'Status',
+    'Sub Status': 'SubStatus',
+    'Target Server Name': 'TargetServerName',
+    'Additional Information': 'TargetInfo',
+    'Supplied Realm Name': 'TargetDomainName',
+    'User ID': 'TargetSid',
+    'Service Name': 'ServiceName',
+    'Service ID': 'ServiceSid',
+    'Ticket Options': 'TicketOptions',
+    'Result Code': 'Status',
+    'Failure Code': 'Status',
+    'Ticket Encryption Type': 'TicketEncryptionType',
+    'Pre-Authentication Type': 'PreAuthType',
+    'Logon Account': 'TargetUserName',
+    'Source Workstation': 'Workstation',
+    'Error Code': 'Status',
+    'Object Server': 'ObjectServer',
+    'Object Type': 'ObjectType',
+    'Object Name': 'ObjectName',
+    'Handle ID': 'HandleId',
+    'Operation Type': 'OperationType',
+    'Accesses': 'AccessList',
+    'Access Mask': 'AccessMask',
+    'Properties': 'Properties',
+}
+
+# Per-event names where the generic ones are wrong for the event's XML
+_LOGOFF = {'Subject.Security ID': 'TargetUserSid', 'Subject.Account Name': 'TargetUserName',
+           'Subject.Account Domain': 'TargetDomainName', 'Subject.Logon ID': 'TargetLogonId'}
+_MEMBERSHIP = {'Member.Security ID': 'MemberSid', 'Member.Account Name': 'MemberName',
+               'Group.Security ID': 'TargetSid', 'Group.Group Name': 'TargetUserName',
+               'Group.Group Domain': 'TargetDomainName'}
+_ACCOUNT = {'New Account.Security ID': 'TargetSid', 'New Account.Account Name': 'TargetUserName',
+            'New Account.Account Domain': 'TargetDomainName', 'Target Account.Security ID': 'TargetSid',
+            'Target Account.Account Name': 'TargetUserName', 'Target Account.Account Domain': 'TargetDomainName'}
+EVENT_NAMES = {
+    (PROVIDER, 4634): _LOGOFF,
+    (PROVIDER, 4647): _LOGOFF,
+    **{(PROVIDER, event_id): _MEMBERSHIP for event_id in (4728, 4729, 4732, 4733, 4756, 4757)},
+    **{(PROVIDER, event_id): _ACCOUNT for event_id in (4720, 4722, 4723, 4724, 4725, 4726, 4738, 4740, 4767)},
+}
+
+# Values that are always lists, even with a single line
+LIST_LABELS = frozenset(('Privileges', 'Accesses', 'Properties'))
+
+
+def field_name(source, event_id, section, label):
+    key = f"{section}.{label}" if section else label
+    name = EVENT_NAMES.get((source, event_id), {}).get(key)
+    if name:
+        return name
+    if section in ACCOUNT_SECTIONS and label in ACCOUNT_FIELDS:
+        return ACCOUNT_SECTIONS[section] + ACCOUNT_FIELDS[label]
+    name = FIELD_NAMES.get(label)
+    if name:
+        return name
+    # Unknown labels keep their section, as one XML-safe name
+    return ''.join(word[:1].upper() + word[1:] for word in re.split(r'[^0-9A-Za-z]+', key) if word)
+
+
+def _value(values, listed):
+    values = [value for value in values if value]
+    if listed or len(values) > 1:
+        return values
+    return values[0] if values else ''
+
+
+def learn(source, event_id, lines):
+    """EventData of one message parsed line by line, and its compiled Layout (None if it has no fixed shape)."""
+    data = {}
+    found = []          # [line, prefix, name, listed, values]
+    section = None
+    current = None
+    for index, line in enumerate(lines):
+        if not line.strip():
+            section = current = None
+            continue
+        match = LABEL.match(line)
+        if match is None:
+            if current is not None and line[:1] in ' \t':
+                # A value continued on the next lines, as in the Privileges list
+                current[4].append(line.strip())
+            else:
+                current = None
+            continue
+        label, gap = match.group(1).strip(), match.group(2)
+        if not gap:
+            section, current = label, None
+            continue
+        qualifier = section if line[:1] in ' \t' else None
+        name = field_name(source, event_id, qualifier, label)
+        if name in data:
+            # A repeated name is spelled out with its section, or skipped
+            name = field_name(source, event_id, None, f"{qualifier}.{label}") if qualifier else None
+            if name is None or name in data:
+                current = None
+                continue
+        data[name] = None
+        current = [index, line[:match.end()], name, label in LIST_LABELS, [line[match.end():].strip()]]
+        found.append(current)
+    for _, _, name, listed, values in found:
+        data[name] = _value(values, listed)
+    return data, Layout.compile(lines, found)
+
+
+class Layout:
+    """Where each value of one message shape sits, with at most one multi-line value."""
+
+    __slots__ = ('size', 'before', 'multi', 'after')
+
+    def __init__(self, size, before, multi, after):
+        self.size = size
+        self.before = before
+        self.multi = multi
+        self.after = after
+
+    @classmethod
+    def compile(cls, lines, found):
+        continued = [entry for entry in found if entry[3] or len(entry[4]) > 1]
+        if len(continued) > 1:
+            return None
+        extra = len(continued[0][4]) - 1 if continued else 0
+        multi = None
+        before = []
+        after = []
+        for entry in found:
+            index, prefix, name, listed, _ = entry
+            if continued and entry is continued[0]:
+                multi = (index, prefix, len(prefix), name, listed)
+            elif multi is None:
+                before.append((index, prefix, len(prefix), name))
+            else:
+                # Positions after the multi-line value are kept for a single-line one
+                after.append((index - extra, prefix, len(prefix), name))
+        return cls(len(lines) - extra, tuple(before), multi, tuple(after))
+
+    def extract(self, lines):
+        """EventData for a message with this layout, or None if it does not fit."""
+        extra = len(lines) - self.size
+        if extra < 0 or extra and self.multi is None:
+            return None
+        data = {}
+        for index, prefix, cut, name in self.before:
+            line = lines[index]
+            if not line.startswith(prefix):
+                return None
+            data[name] = line[cut:].strip()
+        if self.multi is None:
+            return data
+        index, prefix, cut, name, listed = self.multi
+        line = lines[index]
+        if not line.startswith(prefix):
+            return None
+        values = [line[cut:].strip()]
+        values.extend(item.strip() for item in lines[index + 1:index + 1 + extra])
+        data[name] = _value(values, listed)
+        for index, prefix, cut, name in self.after:
+            line = lines[index + extra]
+            if not line.startswith(prefix):
+                return None
+            data[name] = line[cut:].strip()
+        return data
+
+
+class FieldExtractor:
+    """Bounded LRU of message layouts per (SourceName, EventID), with counters.
+
+    Typical use:
+
+        extractor = FieldExtractor()
+        for log in with_event_data(logs, extractor):
+            log['EventData']['TargetUserName']
+    """
+
+    def __init__(self, max_size=1024, variants=4):
+        self.max_size = max_size
+        self.variants = variants
+        self.layouts = collections.OrderedDict()
+        self.hits = 0
+        self.learned = 0
+        self.unshaped = 0
+        self.evictions = 0
+        # Uploads may serialize on worker threads
+        self.lock = threading.RLock()
+
+    def extract(self, source, event_id, message):
+        try:
+            # ReadEventLog reports qualifier bits above the 16-bit event code
+            event_id = int(event_id) & 0xFFFF
+        except (TypeError, ValueError):
+            pass
+        lines = str(message).splitlines()
+        key = (source, event_id)
+        with self.lock:
+            layouts = self.layouts.get(key)
+            if layouts is not None:
+                self.layouts.move_to_end(key)
+                for layout in layouts:
+                    data = layout.extract(lines)
+                    if data is not None:
+                        self.hits += 1
+                        return data
+            data, layout = learn(source, event_id, lines)
+            if layout is None:
+                self.unshaped += 1
+                return data
+            self.learned += 1
+            if layouts is None:
+                layouts = self.layouts[key] = []
+                if len(self.layouts) > self.max_size:
+                    self.layouts.popitem(last=False)
+                    self.evictions += 1
+            layouts.insert(0, layout)
+            del layouts[self.variants:]
+            return data
+
+    def event_data(self, log):
+        if isinstance(log, dict):
+            return self.extract(log.get('SourceName'), log.get('EventID'), log.get('Message') or '')
+        return self.extract(log.source, log.event_id, log.message)
+
+    def stats(self):
+        parsed = self.hits + self.learned + self.unshaped
+        return {
+            'size': len(self.layouts),
+            'hits': self.hits,
+            'learned': self.learned,
+            'unshaped': self.unshaped,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / parsed if parsed else 0.0,
+        }
+
+
+def with_event_data(logs, extractor):
+    """Pass `logs` through as dicts carrying an EventData dict."""
+    for log in logs:
+        log = dict(log) if isinstance(log, dict) else log.to_dict()
+        try:
+            log['EventData'] = extractor.event_data(log)
+        except Exception as e:
+            logging.error(f"Error extracting event fields: {str(e)}")
+        yield log
+
+
+def event_document(log, extractor):
+    """The Chainsaw `Event.System/EventData` document of a flat export event.
+
+    Flat exports carry no record number, keywords or XML, so System holds what
+    the flat fields give; TimeGenerated is the collecting host's wall clock
+    and is taken as is. EventData is the event's own, if it was backfilled,
+    or extracted from the message.
+    """
+    try:
+        event_id = int(log['EventID']) & 0xFFFF
+    except (TypeError, ValueError):
+        event_id = log['EventID']
+    data = log.get('EventData')
+    if not isinstance(data, dict):
+        data = extractor.event_data(log)
+    system = {
+        'Provider_attributes': {'Name': log.get('SourceName') or PROVIDER},
+        'EventID': event_id,
+        'Task': log.get('EventCategory'),
+        'Keywords': AUDIT_FAILURE if log.get('EventType') == 'Audit Failure' else AUDIT_SUCCESS,
+        'TimeCreated_attributes': {'SystemTime': str(log.get('TimeGenerated') or '').replace(' ', 'T')},
+        'Channel': log.get('Channel') or 'Security',
+    }
+    if isinstance(log.get('RecordNumber'), int):
+        system['EventRecordID'] = log['RecordNumber']
+    return {'Event': {'System': system, 'EventData': data or None}}
+
+
+def backfill(paths, folder, extractor):
+    """Copy JSON exports into `folder` with EventData added; returns the number of events."""
+    import eventstore
+
+    os.makedirs(folder, exist_ok=True)
+    total = 0
+    for path in paths:
+        target = os.path.join(folder, os.path.basename(path))
+        if os.path.abspath(target) == os.path.abspath(path):
+            raise ValueError(f"Backfill would overwrite {path}; choose another output folder")
+        with serializer.JsonExport(target) as export:
+            for log in with_event_data(eventstore.read_exports(path), extractor):
+                export.write(log)
+        logging.info(f"Added EventData to {export.count} events from {path}: {target}")
+        total += export.count
+    return total
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Structured EventData from rendered event messages")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fill = commands.add_parser("backfill", help="Add EventData to JSON exports (e.g. security_logs_*.json)")
+    fill.add_argument("files", nargs="+")
+    fill.add_argument("--out", default="eventdata", help="Output folder for the rewritten exports")
+    show = commands.add_parser("show", help="Print the EventData of the events in an export")
+    show.add_argument("file")
+    show.add_argument("--event-id", type=int)
+    show.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    extractor = FieldExtractor()
+    if args.command == "backfill":
+        paths = sorted(path for pattern in args.files for path in glob.glob(pattern))
+        backfill(paths, args.out, extractor)
+    elif args.command == "show":
+        import eventstore
+
+        shown = 0
+        for log in with_event_data(eventstore.read_exports(args.file), extractor):
+            if args.event_id is not None and int(log.get('EventID') or 0) & 0xFFFF != args.event_id:
+                continue
+            print(json.dumps({'EventID': log.get('EventID'), 'EventData': log['EventData']}))
+            shown += 1
+            if shown >= args.limit:
+                break
+    logging.info(f"Layout cache: {extractor.stats()}")
@@ -0,0 +1,434 @@
+import datetime
+import functools
+import json
+import logging
+import marshal
+import os
+import shutil
+import struct
+import time
+import zlib
+
+import edgefilter
+import records
+
+# Local event store, append-only and partitioned by channel and hour:
+#
+#   <root>/<channel>/<YYYYMMDDHH>/events.dat   zlib-compressed blocks of records
+#   <root>/<channel>/<YYYYMMDDHH>/index.ndjson one line per block
+#
+# A block holds up to BLOCK_EVENTS records, sorted by time. Its index line
+# carries the block's offset, time range and the distinct EventIDs, account
+# names and source IPs in it, which makes a sparse time index and block-level
+# secondary indexes in one small file. A query picks partitions by directory
+# name, blocks by their index line, and decompresses only those blocks.
+# Retention drops whole partitions. Times are the event's wall-clock reading
+# as integer seconds, as in records.EventRecord. Blocks hold the record tuples
+# as JSON arrays; blocks from before that (marshal) are still read.
+
+BLOCK_EVENTS = 2000
+BLOCK_BYTES = 1024 * 1024
+HEADER = struct.Struct('<4sII')
+MAGIC = b'EVB2'
+LEGACY_MAGIC = b'EVB1'
+STANDARD_CHANNELS = {name.lower(): name for name in ('Application', 'Security', 'Setup', 'System', 'ForwardedEvents')}
+PARTITION_FORMAT = '%Y%m%d%H'
+ACCOUNT_LABELS = frozenset(('Account Name', 'Target Account Name', 'User Name'))
+ADDRESS_LABELS = frozenset(('Source Network Address', 'Client Address', 'Source Address', 'Network Address'))
+EMPTY_VALUES = frozenset(('', '-', '::1', '127.0.0.1'))
+
+
+@functools.lru_cache(maxsize=None)
+def channel_name(channel):
+    """The folder a channel is stored in: its file-name form (as channels.file_name),
+    with the standard logs in their usual case, so "security" from
+    security_logs_*.json is stored and queried as "Security"."""
+    channel = channel.replace('/', '%4')
+    return STANDARD_CHANNELS.get(channel.lower(), channel)
+
+
+def encode_block(items):
+    return zlib.compress(json.dumps(items, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def decode_block(magic, payload):
+    if magic == LEGACY_MAGIC:
+        return marshal.loads(zlib.decompress(payload))
+    return json.loads(zlib.decompress(payload))
+
+
+def event_time(log):
+    if isinstance(log, dict):
+        return records.to_seconds(datetime.datetime.fromisoformat(str(log['TimeGenerated'])[:19]))
+    return log.time
+
+
+def parse_time(text):
+    """Seconds for an ISO date/time given on the command line or to query()."""
+    if text is None or isinstance(text, (int, float)):
+        return text
+    return records.to_seconds(datetime.datetime.fromisoformat(text))
+
+
+def _indexed(fields):
+    # Account names and addresses under any section ("Subject.Account Name", "New Logon.Account Name", ...)
+    accounts = set()
+    addresses = set()
+    for key, value in fields.items():
+        if value in EMPTY_VALUES:
+            continue
+        label = key[key.rfind('.') + 1:]
+        if label in ACCOUNT_LABELS:
+            accounts.add(value.lower())
+        elif label in ADDRESS_LABELS:
+            addresses.add(value)
+    return tuple(sorted(accounts)), tuple(sorted(addresses))
+
+
+def encode(log):
+    """The stored tuple for a flat event: fields, then the indexed account names and addresses."""
+    if isinstance(log, dict):
+        values = (event_time(log), log.get('EventID'), log.get('SourceName'), log.get('EventType'),
+                  log.get('EventCategory'), str(log.get('Message') or ''))
+    else:
+        values = (log.time, log.event_id, log.source, log.event_type, log.category, str(log.message))
+    return values + _indexed(edgefilter.message_fields(values[5]))
+
+
+def decode(item, channel):
+    moment, event_id, source, event_type, category, message = item[:6]
+    return {
+        'EventID': event_id,
+        'TimeGenerated': time.strftime(records.TIME_FORMAT, time.gmtime(moment)),
+        'SourceName': source,
+        'EventType': event_type,
+        'EventCategory': category,
+        'Message': message,
+        'Channel': channel,
+    }
+
+
+class _PartitionWriter:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        data_path = os.path.join(path, 'events.dat')
+        index_path = os.path.join(path, 'index.ndjson')
+        end = 0
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                lines = f.read().split(b'\n')
+            if lines[-1]:
+                # A torn last line from a crash: drop it and rewrite the rest
+                with open(index_path, 'wb') as f:
+                    f.write(b'\n'.join(lines[:-1]) + (b'\n' if len(lines) > 1 else b''))
+            for line in lines[:-1]:
+                entry = json.loads(line)
+                end = entry['offset'] + entry['length']
+        self.data = open(data_path, 'ab')
+        if self.data.tell() > end:
+            # Data written after the last indexed block never became visible
+            self.data.truncate(end)
+            self.data.seek(end)
+        self.index = open(index_path, 'ab')
+        self.pending = []
+        self.pending_bytes = 0
+        self.blocks = 0
+
+    def add(self, item):
+        self.pending.append(item)
+        self.pending_bytes += len(item[5]) + 64
+        if len(self.pending) >= BLOCK_EVENTS or self.pending_bytes >= BLOCK_BYTES:
+            self.write_block()
+
+    def write_block(self):
+        if not self.pending:
+            return
+        items = sorted(self.pending, key=lambda item: item[0])
+        self.pending = []
+        self.pending_bytes = 0
+        payload = encode_block(items)
+        offset = self.data.tell()
+        self.data.write(HEADER.pack(MAGIC, len(payload), zlib.crc32(payload)) + payload)
+        self.data.flush()
+        entry = {
+            'offset': offset, 'length': HEADER.size + len(payload), 'count': len(items),
+            'first': items[0][0], 'last': items[-1][0],
+            'event_ids': sorted({item[1] for item in items if item[1] is not None}),
+            'accounts': sorted({account for item in items for account in item[6]}),
+            'addresses': sorted({address for item in items for address in item[7]}),
+        }
+        # The index line goes last, so a block is visible only once it is complete
+        self.index.write(json.dumps(entry, separators=(',', ':')).encode('utf-8') + b'\n')
+        self.index.flush()
+        self.blocks += 1
+
+    def close(self):
+        self.write_block()
+        self.data.close()
+        self.index.close()
+
+
+class QueryStats:
+    __slots__ = ('partitions', 'blocks_total', 'blocks_read', 'events_scanned', 'matched', 'seconds')
+
+    def __init__(self):
+        self.partitions = 0
+        self.blocks_total = 0
+        self.blocks_read = 0
+        self.events_scanned = 0
+        self.matched = 0
+        self.seconds = 0.0
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class EventStore:
+    """Hour-partitioned event store with block-level indexes.
+
+    Typical use:
+
+        store = EventStore('events')
+        for log in store.writing(collected, 'Security'):   # or store.append(logs, 'Security')
+            ...
+        store.flush()
+        for event in store.query(start='2025-02-01T00:00', event_ids=[4625], address='203.0.113.7'):
+            ...
+    """
+
+    def __init__(self, root, retention_days=None):
+        self.root = root
+        self.retention_days = retention_days
+        self.writers = {}
+        self.stats = {'appended': 0, 'blocks': 0}
+
+    def _close(self, writer):
+        writer.close()
+        self.stats['blocks'] += writer.blocks
+
+    def _partitions(self, channel):
+        folder = os.path.join(self.root, channel)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(name for name in os.listdir(folder) if len(name) == 10 and name.isdigit())
+
+    def channels(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def append(self, logs, channel='Security'):
+        count = 0
+        for log in logs:
+            self.add(log, channel)
+            count += 1
+        return count
+
+    def add(self, log, channel='Security'):
+        channel = channel_name(channel)
+        item = encode(log)
+        partition = time.strftime(PARTITION_FORMAT, time.gmtime(item[0]))
+        writer = self.writers.get((channel, partition))
+        if writer is None:
+            writer = self.writers[(channel, partition)] = _PartitionWriter(os.path.join(self.root, channel, partition))
+        writer.add(item)
+        self.stats['appended'] += 1
+
+    def writing(self, logs, channel='Security'):
+        """Pass `logs` through, storing each event on the way."""
+        for log in logs:
+            try:
+                self.add(log, channel)
+            except Exception as e:
+                logging.error(f"Error storing event: {str(e)}")
+            yield log
+
+    def flush(self):
+        """Write every partial block and release the partition files."""
+        for writer in self.writers.values():
+            self._close(writer)
+        self.writers = {}
+
+    def enforce_retention(self, now=None):
+        """Drop partitions older than the retention period; returns how many were removed."""
+        if not self.retention_days:
+            return 0
+        now = records.to_seconds(datetime.datetime.now()) if now is None else now
+        return self.drop_before(now - self.retention_days * 86400)
+
+    def drop_before(self, cutoff):
+        removed = 0
+        for channel in self.channels():
+            for partition in self._partitions(channel):
+                hour_end = records.to_seconds(datetime.datetime.strptime(partition, PARTITION_FORMAT)) + 3600
+                if hour_end > cutoff:
+                    break
+                writer = self.writers.pop((channel, partition), None)
+                if writer:
+                    self._close(writer)
+                shutil.rmtree(os.path.join(self.root, channel, partition), ignore_errors=True)
+                removed += 1
+        if removed:
+            logging.info(f"Event store retention removed {removed} hourly partitions")
+        return removed
+
+    def _index(self, path):
+        entries = []
+        try:
+            with open(os.path.join(path, 'index.ndjson'), 'rb') as f:
+                for line in f:
+                    if line.endswith(b'\n'):
+                        entries.append(json.loads(line))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def query(self, start=None, end=None, channel='Security', event_ids=None, account=None, address=None,
+              source=None, contains=None, limit=None, stats=None):
+        """Events with start <= time < end matching every given predicate, oldest first.
+
+        `start`/`end` are ISO strings or seconds. `event_ids`, `account` (case-
+        insensitive) and `address` use the block indexes; `source` and
+        `contains` (a message substring, case-insensitive) are checked per event.
+        """
+        stats = stats if stats is not None else QueryStats()
+        started = time.perf_counter()
+        channel = channel_name(channel)
+        start, end = parse_time(start), parse_time(end)
+        event_ids = set(event_ids) if event_ids else None
+        account = account.lower() if account else None
+        source = source.lower() if source else None
+        contains = contains.lower() if contains else None
+        low = time.strftime(PARTITION_FORMAT, time.gmtime(start)) if start is not None else None
+        high = time.strftime(PARTITION_FORMAT, time.gmtime(end - 1)) if end is not None else None
+        try:
+            for partition in self._partitions(channel):
+                if (low and partition < low) or (high and partition > high):
+                    continue
+                stats.partitions += 1
+                path = os.path.join(self.root, channel, partition)
+                matches = []
+                with open(os.path.join(path, 'events.dat'), 'rb') as data:
+                    for entry in self._index(path):
+                        stats.blocks_total += 1
+                        if start is not None and entry['last'] < start or end is not None and entry['first'] >= end:
+                            continue
+                        if event_ids and event_ids.isdisjoint(entry['event_ids']):
+                            continue
+                        if account and account not in entry['accounts']:
+                            continue
+                        if address and address not in entry['addresses']:
+                            continue
+                        stats.blocks_read += 1
+                        data.seek(entry['offset'])
+                        magic, length, crc = HEADER.unpack(data.read(HEADER.size))
+                        payload = data.read(length)
+                        if magic not in (MAGIC, LEGACY_MAGIC) or zlib.crc32(payload) != crc:
+                            logging.error(f"Skipping corrupt block at {entry['offset']} in {path}")
+                            continue
+                        for item in decode_block(magic, payload):
+                            stats.events_scanned += 1
+                            if start is not None and item[0] < start or end is not None and item[0] >= end:
+                                continue
+                            if event_ids and item[1] not in event_ids:
+                                continue
+                            if account and account not in item[6]:
+                                continue
+                            if address and address not in item[7]:
+                                continue
+                            if source and str(item[2]).lower() != source:
+                                continue
+                            if contains and contains not in item[5].lower():
+                                continue
+                            matches.append(item)
+                matches.sort(key=lambda item: item[0])
+                for item in matches:
+                    stats.matched += 1
+                    yield decode(item, channel)
+                    if limit and stats.matched >= limit:
+                        return
+        finally:
+            stats.seconds += time.perf_counter() - started
+
+    def summary(self):
+        result = {}
+        for channel in self.channels():
+            partitions = self._partitions(channel)
+            events = blocks = size = 0
+            for partition in partitions:
+                path = os.path.join(self.root, channel, partition)
+                entries = self._index(path)
+                blocks += len(entries)
+                events += sum(entry['count'] for entry in entries)
+                size += sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+            result[channel] = {'partitions': len(partitions), 'first': partitions[0] if partitions else None,
+                               'last': partitions[-1] if partitions else None, 'blocks': blocks, 'events': events,
+                               'bytes': size}
+        return result
+
+
+def read_exports(path):
+    """Flat events from a JSON export (a list, as main.py and evtx.py write) or an NDJSON file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if not text.strip():
+        return []
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Hour-partitioned local event store")
+    parser.add_argument("--store", default="events", help="Event store directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    query = commands.add_parser("query", help="Events in a time range matching field predicates")
+    query.add_argument("--channel", default="Security")
+    query.add_argument("--from", dest="start", help="Start time, ISO format (inclusive)")
+    query.add_argument("--to", dest="end", help="End time, ISO format (exclusive)")
+    query.add_argument("--event-id", type=int, action="append", help="EventID (repeatable)")
+    query.add_argument("--account", help="Account name in any account field")
+    query.add_argument("--ip", help="Source network address")
+    query.add_argument("--source", help="SourceName (provider)")
+    query.add_argument("--contains", help="Substring of the message text")
+    query.add_argument("--limit", type=int)
+    query.add_argument("--count", action="store_true", help="Print only the number of matches")
+    ingest = commands.add_parser("ingest", help="Add JSON/NDJSON exports (e.g. main.py json/ output)")
+    ingest.add_argument("files", nargs="+")
+    ingest.add_argument("--channel", help="Channel (default: the file-name prefix, e.g. Security_...json or "
+                                          "security_logs_...json)")
+    prune = commands.add_parser("prune", help="Drop partitions older than the retention period")
+    prune.add_argument("--retention-days", type=int, required=True)
+    commands.add_parser("stats", help="Partitions, blocks and events per channel")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = EventStore(args.store)
+    if args.command == "query":
+        query_stats = QueryStats()
+        matched = store.query(args.start, args.end, args.channel, args.event_id, args.account, args.ip,
+                              args.source, args.contains, args.limit, query_stats)
+        for event in matched:
+            if not args.count:
+                print(json.dumps(event))
+        if args.count:
+            print(query_stats.matched)
+        logging.info(f"{query_stats.matched} events in {query_stats.seconds * 1000:.1f} ms: "
+                     f"{query_stats.partitions} partitions, {query_stats.blocks_read} of "
+                     f"{query_stats.blocks_total} indexed blocks read, {query_stats.events_scanned} events scanned")
+    elif args.command == "ingest":
+        for pattern in args.files:
+            for path in sorted(glob.glob(pattern)):
+                channel = channel_name(args.channel or os.path.basename(path).split('_')[0])
+                count = store.append(read_exports(path), channel)
+                logging.info(f"Stored {count} events from {path} in {channel}")
+        store.flush()
+    elif args.command == "prune":
+        store.retention_days = args.retention_days
+        store.enforce_retention()
+    elif args.command == "stats":
+        print(json.dumps(store.summary(), indent=2))
@@ -1,18 +1,39 @@
-import win32evtlog
-import win32evtlogutil
+try:
+    import win32evtlog
+    import win32evtlogutil
+except ImportError:
+    # Lets the pipeline functions be imported by benchmarks off Windows
+    win32evtlog = win32evtlogutil = None
 import datetime
 import time
 import json
-import xml.etree.ElementTree as ET
 import os
 import logging
-import requests
 import asyncio
 import socket
 import sys
 import subprocess
 from datetime import timezone
 import argparse
+import multiprocessing
+import archive
+import edgefilter
+import eventdata
+import eventstore
+import hunt
+import metrics
+import sigma
+import collection
+import messages
+import records
+import results
+import retrohunt
+import rulepack
+import scheduler
+import serializer
+import spool
+import uploader
+import zdict
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,6 +42,91 @@ API_ENDPOINT = "http://localhost:3001/api/logs"
 CHAINSAW_ENDPOINT = "http://localhost:3001/api/chainsaw_logs"
 SENDEMAIL_ENDPOINT = "http://localhost:3001/api/sendemail"
 
+# Upload bodies: 'xml' (wire-compatible) or 'ndjson', gzip on the fly, bounded per request
+UPLOAD_FORMAT = 'xml'
+UPLOAD_COMPRESS = True
+UPLOAD_MAX_EVENTS = 5000
+UPLOAD_MAX_BYTES = 8 * 1024 * 1024
+# Compress upload bodies against the bundled preset dictionary (dictionaries/)
+# instead of gzip; the backend needs the same dictionary files
+UPLOAD_DICTIONARY = False
+
+# Background upload workers (pooled connections) and the queue that collection waits on
+UPLOAD_WORKERS = 4
+UPLOAD_QUEUE_SIZE = 16
+
+# On-disk spool that every upload goes through, so nothing is lost while the backend is down
+SPOOL_MAX_BYTES = 512 * 1024 * 1024
+# Spooled records are stored compressed against the preset dictionary
+SPOOL_DICTIONARY = True
+
+# Exported snapshots go into a chunk-deduplicated archive instead of piling up as loose files
+ARCHIVE_SNAPSHOTS = True
+# Re-hunt archived history with rules added or changed since the last start
+RETRO_HUNT = True
+
+# Uploaded events carry an EventData dict parsed from their message text
+# (TargetUserName, LogonType, IpAddress, ...)
+EVENT_DATA = False
+
+# Every collected event, filtered or not, goes into the local hour-partitioned
+# event store in events/; partitions older than the retention period are dropped
+EVENT_STORE = True
+EVENT_STORE_RETENTION_DAYS = 30
+
+# Collected events pass the edge filter rules before upload (None: the bundled
+# filters/edge.yml); dropped events can be kept locally in dropped/
+EDGE_FILTER = True
+EDGE_FILTER_FILE = None
+KEEP_DROPPED = False
+
+# Detections are uploaded as compact records; a repeat of the same rule and key
+# fields within SUPPRESSION_SECONDS is only counted, and email goes out as a
+# digest every DIGEST_SECONDS (at once for critical detections)
+SUPPRESSION_SECONDS = results.SUPPRESSION_SECONDS
+DIGEST_SECONDS = results.DIGEST_SECONDS
+# Keep the full per-cycle result files in output/ after they have been spooled
+KEEP_RAW_RESULTS = False
+
+# Collection windows are contiguous; the interval between them follows the event
+# rate within these bounds, aiming for about SCHEDULE_TARGET_EVENTS per window
+SCHEDULE_MIN_INTERVAL = 10
+SCHEDULE_MAX_INTERVAL = 600
+SCHEDULE_TARGET_EVENTS = 5000
+# After a long stop, catch up on at most this much history
+SCHEDULE_MAX_CATCHUP = 24 * 3600
+
+# Prometheus-style metrics on a local port (0 disables), optionally dumped to a file every cycle
+METRICS_PORT = 9464
+METRICS_FILE = None
+# Per-event debug lines are logged for one event in this many
+DEBUG_LOG_SAMPLE = 1000
+
+EVENTS = metrics.counter('evtx_events_total', 'Events collected from the Security log')
+EVENT_RATE = metrics.gauge('evtx_events_per_second', 'Events collected per second of the last cycle')
+CYCLE_LAG = metrics.gauge('evtx_cycle_lag_seconds', 'Wall-clock time between the end of the collected window and the end of its cycle')
+DETECTIONS = metrics.counter('evtx_detections_total', 'Detections written by the native Sigma engine')
+SUPPRESSED = metrics.counter('evtx_detections_suppressed_total', 'Repeat detections counted but not uploaded within the suppression window')
+UPLOAD_QUEUE = metrics.gauge('evtx_upload_queue_depth', 'Upload jobs waiting for a worker')
+SPOOL_PENDING = metrics.gauge('evtx_spool_pending_bytes', 'Spooled bytes not yet delivered')
+SCHEDULE_INTERVAL = metrics.gauge('evtx_schedule_interval_seconds', 'Current interval between collection windows')
+COALESCED_TICKS = metrics.counter('evtx_schedule_coalesced_total', 'Collection deadlines folded into a later window after an overrun')
+debug_sampler = metrics.Sampler(DEBUG_LOG_SAMPLE)
+
+message_cache = None
+upload_client = None
+upload_spool = None
+snapshot_store = None
+result_store = None
+edge_filter = None
+dropped_log = None
+event_store = None
+field_extractor = None
+dictionaries = None
+draining = False
+# Background tasks started by main(), referenced until they finish
+background_tasks = set()
+
 def get_base_path():
     if getattr(sys, 'frozen', False):
         # Running as compiled executable
@@ -29,6 +135,13 @@ def get_base_path():
         # Running as script
         return os.path.dirname(os.path.abspath(__file__))
 
+def get_state_path():
+    if getattr(sys, 'frozen', False):
+        # State must outlive the PyInstaller temp folder
+        return os.path.dirname(sys.executable)
+    else:
+        return os.path.dirname(os.path.abspath(__file__))
+
 def get_local_ip():
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -51,39 +164,188 @@ def event_type_to_string(event_type):
     }
     return types.get(event_type, f'Unknown ({event_type})')
 
-def get_security_logs(start_time):
-    logs = []
+def get_message_cache():
+    global message_cache
+    if message_cache is None:
+        message_cache = messages.MessageTemplateCache(messages.WindowsMessageLoader())
+    return message_cache
+
+def get_uploader():
+    global upload_client
+    if upload_client is None:
+        upload_client = uploader.Uploader(workers=UPLOAD_WORKERS, queue_size=UPLOAD_QUEUE_SIZE)
+    return upload_client
+
+def get_dictionaries():
+    global dictionaries
+    if dictionaries is None:
+        dictionaries = zdict.Dictionaries(os.path.join(get_base_path(), "dictionaries"))
+        if dictionaries:
+            logging.info(f"Compression dictionary {dictionaries.current}")
+    return dictionaries
+
+def get_spool():
+    global upload_spool
+    if upload_spool is None:
+        # Earlier dictionary versions stay loaded, so records spooled before an update still read back
+        codec = get_dictionaries() if SPOOL_DICTIONARY and get_dictionaries() else None
+        upload_spool = spool.Spool(os.path.join(get_state_path(), "spool"), max_bytes=SPOOL_MAX_BYTES, codec=codec)
+    return upload_spool
+
+def get_result_store():
+    global result_store
+    if result_store is None:
+        result_store = results.ResultStore(os.path.join(get_state_path(), "results"),
+                                           suppression=SUPPRESSION_SECONDS, digest_interval=DIGEST_SECONDS)
+    return result_store
+
+def get_event_store():
+    global event_store
+    if event_store is None:
+        event_store = eventstore.EventStore(os.path.join(get_state_path(), "events"),
+                                            retention_days=EVENT_STORE_RETENTION_DAYS)
+    return event_store
+
+def store_events(logs):
+    return get_event_store().writing(logs, 'Security') if EVENT_STORE else logs
+
+def get_edge_filter():
+    global edge_filter
+    if edge_filter is None:
+        path = EDGE_FILTER_FILE or os.path.join(get_base_path(), "filters", "edge.yml")
+        if EDGE_FILTER and os.path.exists(path):
+            edge_filter = edgefilter.EdgeFilter.load(path)
+            logging.info(f"Edge filter: {len(edge_filter.rules)} rules from {path}")
+        else:
+            # Uploads everything, but still counts what went by
+            edge_filter = edgefilter.EdgeFilter()
+    return edge_filter
+
+def get_field_extractor():
+    global field_extractor
+    if field_extractor is None:
+        field_extractor = eventdata.FieldExtractor()
+    return field_extractor
+
+def filter_for_upload(logs):
+    global dropped_log
+    if KEEP_DROPPED and dropped_log is None:
+        dropped_log = edgefilter.DroppedLog(os.path.join(get_state_path(), "dropped"))
+    logs = get_edge_filter().apply(logs, dropped_log)
+    return eventdata.with_event_data(logs, get_field_extractor()) if EVENT_DATA else logs
+
+def format_event(event, log_type='Security'):
+    # Message text is rendered from a cached template only when it is serialized
+    return records.EventRecord(
+        event.EventID, event.TimeGenerated, event.SourceName, event_type_to_string(event.EventType),
+        event.EventCategory,
+        get_message_cache().message(
+            log_type, event.SourceName, event.EventID, event.StringInserts,
+            lambda: win32evtlogutil.SafeFormatMessage(event, log_type)))
+
+def generated_utc(generated, newer=None):
+    # TimeGenerated is naive local time, which repeats an hour when daylight
+    # saving time ends. Reading newest first, an ambiguous time is the later
+    # reading unless that would put it after the event read just before it
+    if generated.tzinfo is not None:
+        return generated.astimezone(timezone.utc)
+    later = generated.replace(fold=1).astimezone(timezone.utc)
+    if newer is not None and later > newer:
+        return generated.replace(fold=0).astimezone(timezone.utc)
+    return later
+
+@metrics.STAGE_SECONDS.labels(stage='collect').time()
+def iter_security_logs(start_time, end_time):
+    # Events with start_time <= TimeGenerated < end_time (UTC-aware bounds);
+    # reading newest first stops at the first batch that reaches back past the
+    # window. Events are yielded one ReadEventLog batch at a time, never held
+    # for the whole window
+    count = 0
+    newer = None
     try:
         handle = win32evtlog.OpenEventLog(None, 'Security')
         flags = win32evtlog.EVENTLOG_BACKWARDS_READ | win32evtlog.EVENTLOG_SEQUENTIAL_READ
         total_events = win32evtlog.GetNumberOfEventLogRecords(handle)
         logging.info(f"Total events in Security log: {total_events}")
 
-        events = win32evtlog.ReadEventLog(handle, flags, 0)
-        
-        for event in events:
-            if event.TimeGenerated > start_time:
+        reached_start = False
+        while not reached_start:
+            events = win32evtlog.ReadEventLog(handle, flags, 0)
+            if not events:
+                break
+            for event in events:
+                newer = generated = generated_utc(event.TimeGenerated, newer)
+                if generated >= end_time:
+                    continue
+                if generated < start_time:
+                    reached_start = True
+                    continue
                 try:
-                    data = {
-                        'EventID': event.EventID,
-                        'TimeGenerated': str(event.TimeGenerated),
-                        'SourceName': event.SourceName,
-                        'EventType': event_type_to_string(event.EventType),
-                        'EventCategory': event.EventCategory,
-                        'Message': win32evtlogutil.SafeFormatMessage(event, 'Security')
-                    }
-                    logs.append(data)
-                    logging.debug(f"Processed event: {data['EventID']} from {data['SourceName']}")
+                    data = format_event(event)
                 except Exception as e:
                     logging.error(f"Error processing event: {str(e)}")
+                    continue
+                count += 1
+                if debug_sampler.ready():
+                    logging.debug(f"Processed event: {data.event_id} from {data.source} (1 in {DEBUG_LOG_SAMPLE} logged)")
+                yield data
         
         win32evtlog.CloseEventLog(handle)
     except Exception as e:
         logging.error(f"Error reading Security log: {str(e)}")
     
-    logging.info(f"Collected {len(logs)} events from Security log")
-    return logs
+    logging.info(f"Collected {count} events from Security log")
+
+def create_security_collector(batch_size):
+    source = collection.WindowsEventSource('Security', format_event)
+    cursors = collection.CursorStore(os.path.join(get_state_path(), "cursors.json"))
+    return collection.IncrementalCollector(source, cursors, batch_size=batch_size)
+
+async def collect_and_upload(collector, access_key, ip_address, desktop_name, email):
+    # The cursor advances once a batch is durable in the spool, not once it is
+    # uploaded; a batch that could not be spooled is read again next cycle
+    count = 0
+    for batch in collector.batches():
+        try:
+            spool_logs(filter_for_upload(store_events(batch)))
+        except Exception as e:
+            logging.error(f"Error spooling Security events; the batch is left for the next cycle: {str(e)}")
+            break
+        collector.commit()
+        count += len(batch)
+        await schedule_drain(access_key, ip_address, desktop_name, email)
+    logging.info(f"Collected {count} new events from Security log")
+    return count
+
+@metrics.STAGE_SECONDS.labels(stage='render').time()
+def get_security_events(start_time, end_time, record_range=None):
+    documents = []
+    if record_range:
+        query = f"*[System[EventRecordID>={record_range[0]} and EventRecordID<={record_range[1]}]]"
+    else:
+        start = start_time.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        end = end_time.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        # Half-open, so consecutive windows neither overlap nor leave a gap
+        query = f"*[System[TimeCreated[@SystemTime>='{start}' and @SystemTime<'{end}']]]"
+    try:
+        handle = win32evtlog.EvtQuery('Security', win32evtlog.EvtQueryChannelPath, query)
+        while True:
+            events = win32evtlog.EvtNext(handle, 100)
+            if not events:
+                break
+            for event in events:
+                try:
+                    xml_text = win32evtlog.EvtRender(event, win32evtlog.EvtRenderEventXml)
+                    documents.append(sigma.parse_event_xml(xml_text))
+                except Exception as e:
+                    logging.error(f"Error rendering event: {str(e)}")
+    except Exception as e:
+        logging.error(f"Error querying Security log: {str(e)}")
+
+    logging.info(f"Rendered {len(documents)} events from Security log")
+    return documents
 
+@metrics.STAGE_SECONDS.labels(stage='export').time()
 def save_evtx(log_type, filename):
     try:
         os.system(f'wevtutil epl {log_type} {filename}')
@@ -91,6 +353,19 @@ def save_evtx(log_type, filename):
     except Exception as e:
         logging.error(f"Error saving EVTX file: {str(e)}")
 
+@metrics.STAGE_SECONDS.labels(stage='archive').time()
+def archive_snapshot(evtx_file):
+    global snapshot_store
+    try:
+        if snapshot_store is None:
+            snapshot_store = archive.SnapshotStore(os.path.join(get_state_path(), "evtx", "store"))
+        # add() returns only once the chunks and manifest are fsynced
+        snapshot_store.add(evtx_file)
+        os.remove(evtx_file)
+    except Exception as e:
+        logging.error(f"Error archiving EVTX file: {str(e)}")
+
+@metrics.STAGE_SECONDS.labels(stage='chainsaw').time()
 def analyze_with_chainsaw(evtx_file, start_time, end_time):
     base_path = get_base_path()
     chainsaw_path = os.path.join(base_path, "chainsaw.exe")
@@ -132,78 +407,336 @@ def analyze_with_chainsaw(evtx_file, start_time, end_time):
         logging.error(f"An error occurred during Chainsaw analysis: {str(e)}")
         return None
 
-async def upload_to_api(logs, access_key):
+def get_rule_pack_path():
+    return os.path.join(get_state_path(), "rulepack.bin")
+
+def load_rule_pack():
+    base_path = get_base_path()
+    sigma_rules_path = os.path.join(base_path, "needed")
+    mappings_path = os.path.join(base_path, "mappings", "sigma-event-logs-all.yml")
+    # Correlation rules live apart from needed/ so chainsaw.exe never loads them
+    correlations_path = os.path.join(base_path, "correlations")
+    # Parsed rules are cached in a pack that is rebuilt only when a rule file changes
+    return rulepack.load(sigma_rules_path, mappings_path, correlations_path, get_rule_pack_path())
+
+def load_sigma_engine():
+    pack = load_rule_pack()
+    engine = pack.engine()
+    if engine.correlator:
+        engine.correlator.load(get_correlation_state_path())
+    return engine
+
+def get_correlation_state_path():
+    return os.path.join(get_state_path(), "correlation_state.json")
+
+@metrics.STAGE_SECONDS.labels(stage='sigma').time()
+def analyze_with_sigma(engine, documents, evtx_file, start_time):
+    output_folder = os.path.join(get_base_path(), "output")
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    output_file = os.path.join(output_folder, f"chainsaw_results_{start_time.strftime('%Y%m%d_%H%M%S')}.json")
+
     try:
-        # Create XML
-        root = ET.Element("Events")
-        for log in logs:
-            event = ET.SubElement(root, "Event")
-            for key, value in log.items():
-                ET.SubElement(event, key).text = str(value)
-        
-        xml_content = ET.tostring(root, encoding='unicode')
-        
-        # Send to API
-        response = requests.post(
-            API_ENDPOINT,
-            files={
-                'xml_file': ('logs.xml', xml_content, 'application/xml'),
-            },
-            data={
-                'accessKey': access_key,
-            }
-        )
-            
-        if response.status_code == 200:
-            logging.info(f"Uploaded logs to API successfully")
-        else:
-            logging.error(f"Failed to upload to API. Status code: {response.status_code}")
-            logging.error(f"Response: {response.text}")
+        hits = engine.hunt(documents, evtx_file)
+        DETECTIONS.inc(len(hits))
+        with open(output_file, 'w') as f:
+            json.dump(hits, f)
+        if engine.correlator:
+            # Windows carry over to the next cycle and across restarts
+            engine.correlator.save(get_correlation_state_path())
+        logging.info(f"Sigma analysis completed: {len(hits)} detections in {len(documents)} events.")
+        logging.info(f"Output file: {output_file}")
+        return output_file
     except Exception as e:
-        logging.error(f"Error uploading to API: {str(e)}")
+        logging.error(f"An error occurred during Sigma analysis: {str(e)}")
+        return None
+
+def retro_hunt():
+    # Only (rule, chunk or JSON export) pairs never evaluated are hunted; returns a results file or None
+    try:
+        exports = [os.path.join(get_base_path(), "security_logs_*.json"),
+                   os.path.join(get_base_path(), "json", "*.json")]
+        hits, _ = retrohunt.run(load_rule_pack(), get_rule_pack_path(),
+                                os.path.join(get_state_path(), "retrohunt.json"),
+                                os.path.join(get_state_path(), "evtx", "store"),
+                                os.path.join(get_base_path(), "evtx"), exports=exports)
+    except Exception as e:
+        logging.error(f"An error occurred during retro-hunt: {str(e)}")
+        return None
+    if not hits:
+        return None
+    output_folder = os.path.join(get_base_path(), "output")
+    os.makedirs(output_folder, exist_ok=True)
+    output_file = os.path.join(output_folder, f"retrohunt_results_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_file, 'w') as f:
+        json.dump(hits, f)
+    logging.info(f"Retro-hunt found {len(hits)} retroactive detections: {output_file}")
+    return output_file
 
-def upload_chainsaw_results(json_file, access_key, ip_address, desktop_name, email):
+async def run_retro_hunt(access_key, ip_address, desktop_name, email):
+    # Runs beside collection; findings leave through the same spool as live results
+    output_file = await asyncio.to_thread(retro_hunt)
+    if output_file:
+        spool_chainsaw_results(output_file)
+        await schedule_drain(access_key, ip_address, desktop_name, email)
+
+async def upload_to_api(logs, access_key):
+    # Events are streamed into bounded, gzip- or dictionary-compressed requests;
+    # each body is sent with chunked transfer encoding as it is produced
     try:
-        with open(json_file, 'r') as f:
-            chainsaw_logs = json.load(f)
+        dictionary = get_dictionaries().current if UPLOAD_DICTIONARY else None
+        for body in serializer.upload_bodies(logs, {'accessKey': access_key}, fmt=UPLOAD_FORMAT,
+                                             compress=UPLOAD_COMPRESS, max_events=UPLOAD_MAX_EVENTS,
+                                             max_bytes=UPLOAD_MAX_BYTES, dictionary=dictionary):
+            response = await get_uploader().post(API_ENDPOINT, data=body.__iter__, headers=body.headers)
 
-        if not chainsaw_logs:  # If the JSON file is empty (only [])
-            logging.info("Chainsaw results are empty. Skipping upload.")
-            return
+            if response.status_code == 200:
+                logging.info(f"Uploaded {len(body.events)} logs to API successfully ({body.size} bytes, {body.wire_bytes} on the wire)")
+            else:
+                logging.error(f"Failed to upload to API. Status code: {response.status_code}")
+                logging.error(f"Response: {response.text}")
+                return False
+        return True
+    except Exception as e:
+        logging.error(f"Error uploading to API: {str(e)}")
+        return False
 
-        files = {'json_file': (os.path.basename(json_file), json.dumps(chainsaw_logs), 'application/json')}
+async def post_chainsaw_logs(name, chainsaw_logs, access_key, ip_address, desktop_name):
+    try:
+        files = {'json_file': (name, json.dumps(chainsaw_logs), 'application/json')}
         data = {
             'accessKey': access_key,
             'ipAddress': ip_address,
             'desktopName': desktop_name
         }
-        
-        # Send to chainsaw_logs endpoint
-        response = requests.post(CHAINSAW_ENDPOINT, files=files, data=data)
-        
+        response = await get_uploader().post(CHAINSAW_ENDPOINT, files=files, data=data)
+
         if response.status_code == 200:
             logging.info(f"Uploaded Chainsaw results to API successfully")
-        else:
-            logging.error(f"Failed to upload Chainsaw results to API. Status code: {response.status_code}")
-            logging.error(f"Response: {response.text}")
+            return True
+        logging.error(f"Failed to upload Chainsaw results to API. Status code: {response.status_code}")
+        logging.error(f"Response: {response.text}")
+    except Exception as e:
+        logging.error(f"Error uploading Chainsaw results to API: {str(e)}")
+    return False
 
-        # Send to sendemail endpoint
+async def send_email(chainsaw_logs, email):
+    try:
         email_data = {
             'email': email,
             'jsonData': chainsaw_logs
         }
-        email_response = requests.post(SENDEMAIL_ENDPOINT, json=email_data)
+        email_response = await get_uploader().post(SENDEMAIL_ENDPOINT, json=email_data)
 
         if email_response.status_code == 200:
             logging.info(f"Sent email with Chainsaw results successfully")
-        else:
-            logging.error(f"Failed to send email with Chainsaw results. Status code: {email_response.status_code}")
-            logging.error(f"Response: {email_response.text}")
+            return True
+        logging.error(f"Failed to send email with Chainsaw results. Status code: {email_response.status_code}")
+        logging.error(f"Response: {email_response.text}")
+    except Exception as e:
+        logging.error(f"Error sending email with Chainsaw results: {str(e)}")
+    return False
 
+def read_chainsaw_results(json_file):
+    # Compact records for the hits worth uploading, or None if the file could not
+    # be read; the file is streamed, never loaded whole. The caller commits or
+    # rolls back the result store once the records are delivered or not
+    store = get_result_store()
+    suppressed = store.stats['suppressed']
+    try:
+        records = store.process(results.iter_hits(json_file))
     except Exception as e:
-        logging.error(f"Error uploading Chainsaw results to API: {str(e)}")
+        logging.error(f"Error reading Chainsaw results {json_file}: {str(e)}")
+        return None
+    SUPPRESSED.inc(store.stats['suppressed'] - suppressed)
+    return records
 
-async def main(access_key, email):
+def due_digest():
+    # Per-rule digest entries when the digest window has closed; the caller resets it once sent or spooled
+    store = get_result_store()
+    return store.digest.summary() if store.digest.due(time.time()) else None
+
+async def upload_chainsaw_results(json_file, access_key, ip_address, desktop_name, email):
+    chainsaw_logs = read_chainsaw_results(json_file)
+    if chainsaw_logs is None:
+        return False
+    digest = due_digest()
+    jobs = []
+    if chainsaw_logs:
+        jobs.append(post_chainsaw_logs(os.path.basename(json_file), chainsaw_logs, access_key, ip_address, desktop_name))
+    if digest:
+        jobs.append(send_email(digest, email))
+    if not jobs:
+        get_result_store().commit()
+        logging.info("No new Chainsaw results to upload.")
+        return True
+
+    # Send to chainsaw_logs and sendemail endpoints concurrently
+    sent = await asyncio.gather(*jobs)
+    if chainsaw_logs and not sent[0]:
+        # Not delivered, so not suppressed next time either
+        get_result_store().rollback()
+    else:
+        get_result_store().commit()
+    if digest and sent[-1]:
+        get_result_store().digest.reset()
+    return all(sent)
+
+@metrics.STAGE_SECONDS.labels(stage='spool').time()
+def spool_logs(logs):
+    # Takes a list or a stream of events; returns how many were spooled
+    target = get_spool()
+    count = 0
+    for log in logs:
+        target.append_json(['log', log if isinstance(log, dict) else log.to_dict()])
+        count += 1
+    target.flush()
+    return count
+
+def spool_chainsaw_results(json_file):
+    # Returns whether the results were spooled; a file that could not be read or
+    # spooled is kept, and its hits are not counted against suppression
+    chainsaw_logs = read_chainsaw_results(json_file)
+    if chainsaw_logs is None:
+        return False
+    store = get_result_store()
+    if chainsaw_logs:
+        try:
+            target = get_spool()
+            target.append_json(['chainsaw', {'name': os.path.basename(json_file), 'hits': chainsaw_logs}])
+            target.flush()
+        except Exception as e:
+            logging.error(f"Error spooling Chainsaw results {json_file}: {str(e)}")
+            store.rollback()
+            return False
+    else:
+        logging.info("No new Chainsaw results to upload.")
+    try:
+        # Suppression state only once the records it admitted are spooled
+        store.commit()
+    except Exception as e:
+        logging.error(f"Error saving detection state: {str(e)}")
+    if ARCHIVE_SNAPSHOTS and not KEEP_RAW_RESULTS:
+        # Hit records reference the archived snapshot; the full copy is no longer needed
+        try:
+            os.remove(json_file)
+        except OSError as e:
+            logging.error(f"Error removing {json_file}: {str(e)}")
+    return True
+
+def spool_digest():
+    # Once spooled the digest is delivered with everything else, so it can start over
+    digest = due_digest()
+    if not digest:
+        return False
+    target = get_spool()
+    target.append_json(['email', digest])
+    target.flush()
+    get_result_store().digest.reset()
+    return True
+
+async def drain_spool(access_key, ip_address, desktop_name, email):
+    # Deliver spooled records through the upload pool: each round reads up to
+    # one batch per worker and submits every run of events, result file and
+    # digest as its own job, so --upload-workers requests are in flight at once.
+    # Runs are acknowledged in spool order up to the first failure; the rest is
+    # left for the next drain
+    source = get_spool()
+    uploads = get_uploader()
+    delivered = 0
+    while True:
+        records = source.read_json(max_records=UPLOAD_MAX_EVENTS * UPLOAD_WORKERS,
+                                   max_bytes=UPLOAD_MAX_BYTES * UPLOAD_WORKERS)
+        if not records:
+            break
+        jobs = []
+        index = 0
+        while index < len(records):
+            kind, payload = records[index][0]
+            end = index + 1
+            if kind == 'log':
+                while end < len(records) and records[end][0][0] == 'log' and end - index < UPLOAD_MAX_EVENTS:
+                    end += 1
+                job = await uploads.submit(upload_to_api, [record[1] for record, _ in records[index:end]], access_key)
+            elif kind == 'chainsaw':
+                job = await uploads.submit(post_chainsaw_logs, payload['name'], payload['hits'], access_key,
+                                           ip_address, desktop_name)
+            elif kind == 'email':
+                job = await uploads.submit(send_email, payload, email)
+            else:
+                logging.error(f"Skipping unknown spool record type {kind}")
+                job = None
+            jobs.append((job, records[end - 1][1], end - index))
+            index = end
+        sent = await asyncio.gather(*(job for job, _, _ in jobs if job is not None), return_exceptions=True)
+        sent = iter(sent)
+        for job, position, count in jobs:
+            ok = next(sent) is True if job is not None else True
+            if not ok:
+                logging.warning(f"Backend unavailable; {source.pending_bytes()} bytes stay spooled")
+                return delivered
+            source.ack(position)
+            delivered += count
+    return delivered
+
+def start_background(coroutine, name):
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+
+    def finished(task):
+        background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Error in {name}: {str(task.exception())}")
+
+    task.add_done_callback(finished)
+    return task
+
+async def schedule_drain(access_key, ip_address, desktop_name, email):
+    # A single drain at a time, in the background; it keeps going until the spool is empty
+    global draining
+    if draining:
+        return
+
+    async def run():
+        global draining
+        try:
+            return await drain_spool(access_key, ip_address, desktop_name, email)
+        finally:
+            draining = False
+
+    draining = True
+    # Not an upload job itself: it feeds the pool and waits on it
+    start_background(run(), 'spool drain')
+
+def start_metrics():
+    UPLOAD_QUEUE.set_function(lambda: upload_client.depth if upload_client else 0)
+    if METRICS_PORT:
+        try:
+            metrics.serve(METRICS_PORT)
+        except OSError as e:
+            logging.error(f"Error starting metrics endpoint: {str(e)}")
+
+def create_scheduler():
+    policy = scheduler.AdaptiveInterval(SCHEDULE_MIN_INTERVAL, SCHEDULE_MAX_INTERVAL, SCHEDULE_TARGET_EVENTS)
+    return scheduler.Scheduler(policy, state_path=os.path.join(get_state_path(), "window.json"),
+                               max_catchup=SCHEDULE_MAX_CATCHUP)
+
+def record_cycle(collected, end_time, started):
+    elapsed = time.perf_counter() - started
+    metrics.STAGE_SECONDS.labels(stage='cycle').observe(elapsed)
+    EVENTS.inc(collected)
+    EVENT_RATE.set(collected / elapsed if elapsed > 0 else 0)
+    CYCLE_LAG.set((datetime.datetime.now(timezone.utc) - end_time).total_seconds())
+    if upload_spool:
+        SPOOL_PENDING.set(upload_spool.pending_bytes())
+    if METRICS_FILE:
+        try:
+            metrics.dump(METRICS_FILE)
+        except Exception as e:
+            logging.error(f"Error writing metrics file: {str(e)}")
+
+async def main(access_key, email, engine_name='native', incremental=False, batch_size=1000):
     desktop_name = socket.gethostname()
     local_ip = get_local_ip()
 
@@ -214,16 +747,41 @@ async def main(access_key, email):
     logging.info(f"Desktop Name: {desktop_name}")
     logging.info(f"Local IP Address: {local_ip}")
 
+    start_metrics()
+    engine = load_sigma_engine() if engine_name == 'native' else None
+    collector = create_security_collector(batch_size) if incremental else None
+    await get_uploader().start()
+    # Deliver anything left over from a previous run
+    await schedule_drain(access_key, local_ip, desktop_name, email)
+    if engine and RETRO_HUNT:
+        start_background(run_retro_hunt(access_key, local_ip, desktop_name, email), 'retro-hunt')
+
+    schedule = create_scheduler()
     while True:
-        start_time = datetime.datetime.now() - datetime.timedelta(seconds=10)
-        end_time = datetime.datetime.now()
+        # Sleeps until the next deadline; each window starts where the last one ended
+        window = await schedule.next_window()
+        cycle_started = time.perf_counter()
+        start_time, end_time = window.start, window.end
+        if window.coalesced:
+            logging.warning(f"Previous cycle overran {window.coalesced} deadline(s); collecting them as one window")
         
         logging.info(f"Starting log collection for period: {start_time} to {end_time}")
         
-        logs = get_security_logs(start_time)
-        
-        if logs:
-            await upload_to_api(logs, access_key)
+        record_range = None
+        if collector:
+            collected = await collect_and_upload(collector, access_key, local_ip, desktop_name, email)
+            if collected:
+                record_range = (collector.first, collector.position)
+        else:
+            # Events stream from the Event Log into the event store and, through the
+            # edge filter, into the spool; uploads read them back in bounded batches
+            edge = get_edge_filter()
+            seen = edge.seen
+            if spool_logs(filter_for_upload(store_events(iter_security_logs(start_time, end_time)))):
+                await schedule_drain(access_key, local_ip, desktop_name, email)
+            collected = edge.seen - seen
+
+        if collected:
             
             # Create evtx folder if it doesn't exist
             evtx_folder = os.path.join(get_base_path(), "evtx")
@@ -231,32 +789,115 @@ async def main(access_key, email):
                 os.makedirs(evtx_folder)
             
             # Save logs to EVTX
-            timestamp = start_time.strftime('%Y%m%d_%H%M%S')
+            timestamp = start_time.astimezone().strftime('%Y%m%d_%H%M%S')
             base_filename = f"Security_{timestamp}"
             evtx_file = os.path.join(evtx_folder, f"{base_filename}.evtx")
             save_evtx('Security', evtx_file)
             
-            # Analyze with Chainsaw
             start_time_utc = start_time.astimezone(timezone.utc)
             end_time_utc = end_time.astimezone(timezone.utc)
-            chainsaw_output = analyze_with_chainsaw(evtx_file, start_time_utc, end_time_utc)
+            if engine:
+                # Match only the events of this window, in process
+                documents = get_security_events(start_time, end_time, record_range)
+                chainsaw_output = analyze_with_sigma(engine, documents, evtx_file, start_time_utc)
+            else:
+                # Analyze with Chainsaw
+                chainsaw_output = analyze_with_chainsaw(evtx_file, start_time_utc, end_time_utc)
             if chainsaw_output:
-                upload_chainsaw_results(chainsaw_output, access_key, local_ip, desktop_name, email)
+                spool_chainsaw_results(chainsaw_output)
+                await schedule_drain(access_key, local_ip, desktop_name, email)
+            if ARCHIVE_SNAPSHOTS:
+                archive_snapshot(evtx_file)
         
-        logging.info(f"Log collection cycle completed. Waiting for next cycle.")
+        # Checked every cycle, so a quiet cycle still closes the digest window
+        if spool_digest():
+            await schedule_drain(access_key, local_ip, desktop_name, email)
         
-        # Wait until the next 10-minute mark
-        next_run = datetime.datetime.now() + datetime.timedelta(minutes=10)
-        next_run = next_run.replace(minute=next_run.minute // 10 * 10, second=0, microsecond=0)
-        wait_time = (next_run - datetime.datetime.now()).total_seconds()
-        # await asyncio.sleep(10)
+        if message_cache:
+            logging.debug(f"Message template cache: {message_cache.stats()}")
+        if upload_client:
+            logging.debug(f"Upload queue depth {upload_client.depth}: {upload_client.stats}")
+        if upload_spool:
+            logging.debug(f"Upload spool: {upload_spool.pending_bytes()} bytes pending, {upload_spool.stats}")
+        if edge_filter:
+            logging.debug(f"Edge filter: {edge_filter.stats()}")
+        if field_extractor:
+            logging.debug(f"EventData layout cache: {field_extractor.stats()}")
+        if dropped_log:
+            dropped_log.flush()
+        if event_store:
+            event_store.flush()
+            event_store.enforce_retention()
+        record_cycle(collected, end_time, cycle_started)
+        interval = schedule.complete(window, collected)
+        SCHEDULE_INTERVAL.set(interval)
+        COALESCED_TICKS.inc(window.coalesced)
+        logging.info(f"Log collection cycle completed. Next cycle in {schedule.wait_time():.0f}s.")
 
 if __name__ == "__main__":
+    # Hunt worker processes re-enter the frozen executable
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1 and sys.argv[1] == "hunt":
+        # Offline bulk hunt over collected exports: evtx.exe hunt <dirs/globs> -o hits.ndjson
+        sys.exit(hunt.main(sys.argv[2:], get_base_path(), get_state_path()))
+
     parser = argparse.ArgumentParser(description="Windows Log Collector and Chainsaw Analyzer")
     parser.add_argument("-a", "--access-key", required=True, help="Access key for API authentication")
     parser.add_argument("-e", "--email", required=True, help="Email address for receiving reports")
+    parser.add_argument("--engine", choices=["native", "chainsaw"], default="native", help="Detection engine: in-process Sigma matcher or chainsaw.exe")
+    parser.add_argument("--incremental", action="store_true", help="Collect forward from a persisted record cursor instead of a time window")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Events per read/upload batch in incremental mode")
+    parser.add_argument("--upload-format", choices=sorted(serializer.FORMATS), default=UPLOAD_FORMAT, help="Upload body format")
+    parser.add_argument("--no-compress", action="store_true", help="Send upload bodies without gzip")
+    parser.add_argument("--upload-dictionary", action="store_true", help="Compress upload bodies with the bundled preset dictionary (the backend must have it)")
+    parser.add_argument("--max-upload-events", type=int, default=UPLOAD_MAX_EVENTS, help="Maximum events per upload request")
+    parser.add_argument("--max-upload-bytes", type=int, default=UPLOAD_MAX_BYTES, help="Maximum uncompressed bytes per upload request")
+    parser.add_argument("--upload-workers", type=int, default=UPLOAD_WORKERS, help="Concurrent upload connections")
+    parser.add_argument("--upload-queue", type=int, default=UPLOAD_QUEUE_SIZE, help="Upload jobs queued behind the workers while draining the spool")
+    parser.add_argument("--keep-evtx", action="store_true", help="Keep loose .evtx exports instead of archiving them")
+    parser.add_argument("--no-retro-hunt", action="store_true", help="Do not re-hunt archived history when rules change")
+    parser.add_argument("--event-data", action="store_true", help="Add EventData fields parsed from the message to uploaded events")
+    parser.add_argument("--no-event-store", action="store_true", help="Do not keep collected events in the local event store")
+    parser.add_argument("--store-retention-days", type=int, default=EVENT_STORE_RETENTION_DAYS, help="Days of events kept in the local event store")
+    parser.add_argument("--edge-filter", help="Edge filter rules deciding which events are uploaded (default: bundled filters/edge.yml)")
+    parser.add_argument("--no-edge-filter", action="store_true", help="Upload every collected event")
+    parser.add_argument("--keep-dropped", action="store_true", help="Write events the edge filter drops to dropped/ as NDJSON")
+    parser.add_argument("--suppress-minutes", type=int, default=SUPPRESSION_SECONDS // 60, help="Upload a repeat of the same detection at most once per this many minutes (0 disables)")
+    parser.add_argument("--digest-minutes", type=int, default=DIGEST_SECONDS // 60, help="Email a digest of detections at most this often; critical ones go at once")
+    parser.add_argument("--keep-raw-results", action="store_true", help="Keep full result files in output/ after spooling")
+    parser.add_argument("--no-spool-dictionary", action="store_true", help="Store spooled records without the preset dictionary")
+    parser.add_argument("--spool-max-mb", type=int, default=SPOOL_MAX_BYTES // (1024 * 1024), help="Disk cap for undelivered uploads; oldest are dropped first")
+    parser.add_argument("--min-interval", type=int, default=SCHEDULE_MIN_INTERVAL, help="Shortest time between collection cycles, seconds")
+    parser.add_argument("--max-interval", type=int, default=SCHEDULE_MAX_INTERVAL, help="Longest time between collection cycles when idle, seconds")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Serve Prometheus metrics on this local port (0 disables)")
+    parser.add_argument("--metrics-file", help="Also write a JSON metrics snapshot to this file every cycle")
     args = parser.parse_args()
 
+    UPLOAD_FORMAT = args.upload_format
+    UPLOAD_COMPRESS = not args.no_compress
+    UPLOAD_DICTIONARY = args.upload_dictionary
+    UPLOAD_MAX_EVENTS = args.max_upload_events
+    UPLOAD_MAX_BYTES = args.max_upload_bytes
+    UPLOAD_WORKERS = args.upload_workers
+    UPLOAD_QUEUE_SIZE = args.upload_queue
+    SPOOL_MAX_BYTES = args.spool_max_mb * 1024 * 1024
+    SPOOL_DICTIONARY = not args.no_spool_dictionary
+    ARCHIVE_SNAPSHOTS = not args.keep_evtx
+    RETRO_HUNT = not args.no_retro_hunt
+    EVENT_DATA = args.event_data
+    EVENT_STORE = not args.no_event_store
+    EVENT_STORE_RETENTION_DAYS = args.store_retention_days
+    EDGE_FILTER = not args.no_edge_filter
+    EDGE_FILTER_FILE = args.edge_filter
+    KEEP_DROPPED = args.keep_dropped
+    SUPPRESSION_SECONDS = args.suppress_minutes * 60
+    DIGEST_SECONDS = args.digest_minutes * 60
+    KEEP_RAW_RESULTS = args.keep_raw_results
+    SCHEDULE_MIN_INTERVAL = args.min_interval
+    SCHEDULE_MAX_INTERVAL = args.max_interval
+    METRICS_PORT = args.metrics_port
+    METRICS_FILE = args.metrics_file
+
     access_key = args.access_key
     email = args.email
     logging.info(f"Logging Access key {access_key}")
@@ -264,7 +905,7 @@ if __name__ == "__main__":
 
     logging.info("Starting Windows Log Collector")
     try:
-        asyncio.run(main(access_key, email))
+        asyncio.run(main(access_key, email, args.engine, args.incremental, args.batch_size))
     except KeyboardInterrupt:
         logging.info("Script terminated by user")
     except Exception as e:
@@ -9,6 +9,9 @@ a = Analysis(['evtx.py'],
                  ('chainsaw.exe', '.'),
                  ('needed', 'needed'),
                  ('mappings', 'mappings'),
+                 ('correlations', 'correlations'),
+                 ('filters', 'filters'),
+                 ('dictionaries', 'dictionaries'),
              ],
              hiddenimports=['win32evtlog', 'win32evtlogutil'],
              hookspath=[],
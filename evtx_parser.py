@@ -0,0 +1,499 @@
+import binascii
+import collections
+import concurrent.futures
+import datetime
+import itertools
+import logging
+import mmap
+import os
+import struct
+
+# Pure-Python EVTX reader. The file is memory-mapped, every 64 KB chunk is
+# validated before use and records are decoded lazily from BinXML into the
+# same `Event.System` / `Event.EventData` documents Chainsaw emits.
+
+FILE_MAGIC = b'ElfFile\x00'
+CHUNK_MAGIC = b'ElfChnk\x00'
+RECORD_MAGIC = b'\x2a\x2a\x00\x00'
+FILE_HEADER_SIZE = 4096
+CHUNK_SIZE = 65536
+CHUNK_HEADER_SIZE = 512
+
+FILETIME_EPOCH = datetime.datetime(1601, 1, 1)
+ENTITIES = {'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'"}
+
+# Fixed-size BinXML value types and their struct formats.
+NUMERIC_TYPES = {
+    0x03: '<b', 0x04: '<B', 0x05: '<h', 0x06: '<H', 0x07: '<i', 0x08: '<I',
+    0x09: '<q', 0x0a: '<Q', 0x0b: '<f', 0x0c: '<d',
+}
+HEX_TYPES = {0x14: '<I', 0x15: '<Q'}
+ARRAY_ITEM_SIZES = {
+    0x03: 1, 0x04: 1, 0x05: 2, 0x06: 2, 0x07: 4, 0x08: 4, 0x09: 8, 0x0a: 8,
+    0x0b: 4, 0x0c: 8, 0x0d: 4, 0x0f: 16, 0x11: 8, 0x12: 16, 0x14: 4, 0x15: 8,
+}
+
+
+class EvtxFormatError(ValueError):
+    pass
+
+
+def file_header_checksum(header):
+    return binascii.crc32(header[:120]) & 0xffffffff
+
+
+def chunk_header_checksum(chunk):
+    return binascii.crc32(chunk[128:CHUNK_HEADER_SIZE], binascii.crc32(chunk[:120])) & 0xffffffff
+
+
+def chunk_data_checksum(chunk):
+    free_space, = struct.unpack_from('<I', chunk, 48)
+    return binascii.crc32(chunk[CHUNK_HEADER_SIZE:free_space]) & 0xffffffff
+
+
+def parse_file_header(header):
+    if header[:8] != FILE_MAGIC:
+        raise EvtxFormatError("Not an EVTX file (bad file signature)")
+    (first_chunk, last_chunk, next_record_id, header_size, minor, major,
+     block_size, chunk_count) = struct.unpack_from('<QQQIHHHH', header, 8)
+    flags, checksum = struct.unpack_from('<II', header, 120)
+    return {
+        'first_chunk': first_chunk,
+        'last_chunk': last_chunk,
+        'next_record_id': next_record_id,
+        'header_size': header_size,
+        'version': (major, minor),
+        'header_block_size': block_size,
+        'chunk_count': chunk_count,
+        'flags': flags,
+        'checksum': checksum,
+        'checksum_valid': checksum == file_header_checksum(header),
+    }
+
+
+def validate_chunk(chunk):
+    """Return None if the chunk is usable, otherwise the reason it is not."""
+    if chunk[:8] != CHUNK_MAGIC:
+        return 'bad chunk signature'
+    header_checksum, = struct.unpack_from('<I', chunk, 124)
+    if header_checksum != chunk_header_checksum(chunk):
+        return 'chunk header checksum mismatch'
+    free_space, data_checksum = struct.unpack_from('<II', chunk, 48)
+    if not CHUNK_HEADER_SIZE <= free_space <= CHUNK_SIZE:
+        return 'free space offset out of range'
+    if data_checksum != chunk_data_checksum(chunk):
+        return 'record data checksum mismatch'
+    return None
+
+
+# -- value formatting -------------------------------------------------------
+
+def format_filetime(value):
+    return (FILETIME_EPOCH + datetime.timedelta(microseconds=value // 10)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def format_systemtime(data, pos):
+    year, month, _, day, hour, minute, second, millis = struct.unpack_from('<8H', data, pos)
+    return f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}.{millis * 1000:06d}Z"
+
+
+def format_guid(data, pos):
+    a, b, c = struct.unpack_from('<IHH', data, pos)
+    d = bytes(data[pos + 8:pos + 16]).hex().upper()
+    return f"{a:08X}-{b:04X}-{c:04X}-{d[:4]}-{d[4:]}"
+
+
+def format_sid(data, pos):
+    revision, count = data[pos], data[pos + 1]
+    authority = int.from_bytes(data[pos + 2:pos + 8], 'big')
+    sub_authorities = struct.unpack_from(f'<{count}I', data, pos + 8)
+    return '-'.join(['S', str(revision), str(authority)] + [str(s) for s in sub_authorities])
+
+
+class _Node:
+    __slots__ = ('name', 'attributes', 'content')
+
+    def __init__(self, name, attributes, content):
+        self.name = name
+        self.attributes = attributes
+        self.content = content
+
+
+class _Fragment:
+    # A BinXML substitution value: a nested (template, values) pair.
+    __slots__ = ('node', 'values')
+
+    def __init__(self, node, values):
+        self.node = node
+        self.values = values
+
+
+class _Chunk:
+    """BinXML decoder for one chunk; names and templates are cached per chunk."""
+
+    def __init__(self, data):
+        self.data = data
+        self.names = {}
+        self.templates = {}
+
+    def name(self, offset):
+        name = self.names.get(offset)
+        if name is None:
+            length, = struct.unpack_from('<H', self.data, offset + 6)
+            name = self.data[offset + 8:offset + 8 + length * 2].decode('utf-16-le')
+            self.names[offset] = name
+        return name
+
+    def name_ref(self, pos):
+        offset, = struct.unpack_from('<I', self.data, pos)
+        pos += 4
+        if offset == pos:
+            # Name defined inline, right after the reference
+            length, = struct.unpack_from('<H', self.data, pos + 6)
+            pos += 10 + length * 2
+        return self.name(offset), pos
+
+    def records(self):
+        data = self.data
+        free_space, = struct.unpack_from('<I', data, 48)
+        pos = CHUNK_HEADER_SIZE
+        while pos + 24 <= free_space:
+            if data[pos:pos + 4] != RECORD_MAGIC:
+                logging.warning(f"Bad record signature at chunk offset {pos}")
+                break
+            size, record_id = struct.unpack_from('<IQ', data, pos + 4)
+            if size < 28 or pos + size > free_space:
+                logging.warning(f"Bad record size {size} at chunk offset {pos}")
+                break
+            try:
+                yield self.render(pos + 24)
+            except Exception as e:
+                logging.error(f"Error decoding record {record_id}: {str(e)}")
+            pos += size
+
+    # -- BinXML structure --
+
+    def render(self, pos):
+        fragment = self.fragment(pos)
+        out = []
+        render_node(fragment.node, fragment.values, out, None)
+        return _fold(out)
+
+    def fragment(self, pos):
+        if self.data[pos] != 0x0f:
+            raise EvtxFormatError(f"Expected BinXML fragment header at {pos}")
+        pos += 4
+        if self.data[pos] == 0x0c:
+            return self.template_instance(pos)
+        node, pos = self.element(pos)
+        return _Fragment(node, [])
+
+    def template_instance(self, pos):
+        data = self.data
+        definition, = struct.unpack_from('<I', data, pos + 6)
+        pos += 10
+        template = self.templates.get(definition)
+        if template is None:
+            template, _ = self.element(definition + 28)
+            self.templates[definition] = template
+        if definition == pos:
+            size, = struct.unpack_from('<I', data, pos + 20)
+            pos += 24 + size
+        count, = struct.unpack_from('<I', data, pos)
+        pos += 4
+        descriptors = struct.unpack_from('<' + 'HBx' * count, data, pos)
+        pos += 4 * count
+        values = []
+        for i in range(count):
+            size, value_type = descriptors[2 * i], descriptors[2 * i + 1]
+            values.append(self.value(pos, size, value_type))
+            pos += size
+        return _Fragment(template, values)
+
+    def element(self, pos):
+        data = self.data
+        token = data[pos]
+        name, pos = self.name_ref(pos + 7)
+        attributes = []
+        if token & 0x40:
+            pos += 4
+            while data[pos] & 0xbf == 0x06:
+                attribute, pos = self.name_ref(pos + 1)
+                parts, pos = self.parts(pos)
+                attributes.append((attribute, parts))
+        token = data[pos]
+        pos += 1
+        content = []
+        if token == 0x02:
+            content, pos = self.content(pos)
+        elif token != 0x03:
+            raise EvtxFormatError(f"Unexpected token 0x{token:02x} closing element {name}")
+        return _Node(name, attributes, content), pos
+
+    def content(self, pos):
+        content = []
+        data = self.data
+        while True:
+            token = data[pos] & 0xbf
+            if token == 0x04:
+                return content, pos + 1
+            if token == 0x01:
+                node, pos = self.element(pos)
+                content.append(node)
+            elif token in (0x05, 0x07, 0x08, 0x09, 0x0d, 0x0e):
+                parts, pos = self.parts(pos)
+                content.extend(parts)
+            elif token == 0x0a:
+                _, pos = self.name_ref(pos + 1)
+            elif token == 0x0b:
+                length, = struct.unpack_from('<H', data, pos + 1)
+                pos += 3 + length * 2
+            else:
+                raise EvtxFormatError(f"Unexpected token 0x{data[pos]:02x} in element content")
+
+    def parts(self, pos):
+        # Text and substitution tokens; literals are str, substitutions (index, optional)
+        parts = []
+        data = self.data
+        while True:
+            token = data[pos] & 0xbf
+            if token == 0x05:
+                length, = struct.unpack_from('<H', data, pos + 2)
+                parts.append(data[pos + 4:pos + 4 + length * 2].decode('utf-16-le'))
+                pos += 4 + length * 2
+            elif token in (0x0d, 0x0e):
+                index, = struct.unpack_from('<H', data, pos + 1)
+                parts.append((index, token == 0x0e))
+                pos += 4
+            elif token == 0x07:
+                length, = struct.unpack_from('<H', data, pos + 1)
+                parts.append(data[pos + 3:pos + 3 + length * 2].decode('utf-16-le'))
+                pos += 3 + length * 2
+            elif token == 0x08:
+                parts.append(chr(struct.unpack_from('<H', data, pos + 1)[0]))
+                pos += 3
+            elif token == 0x09:
+                entity, pos = self.name_ref(pos + 1)
+                parts.append(ENTITIES.get(entity, f"&{entity};"))
+            else:
+                return parts, pos
+
+    def value(self, pos, size, value_type):
+        data = self.data
+        if value_type == 0x00 or size == 0:
+            return None
+        if value_type == 0x01:
+            return data[pos:pos + size].decode('utf-16-le').rstrip('\x00')
+        if value_type == 0x02:
+            return data[pos:pos + size].decode('cp1252', errors='replace').rstrip('\x00')
+        if value_type in NUMERIC_TYPES:
+            return struct.unpack_from(NUMERIC_TYPES[value_type], data, pos)[0]
+        if value_type in HEX_TYPES:
+            return f"0x{struct.unpack_from(HEX_TYPES[value_type], data, pos)[0]:x}"
+        if value_type == 0x0d:
+            return struct.unpack_from('<I', data, pos)[0] != 0
+        if value_type == 0x0e:
+            return data[pos:pos + size].hex().upper()
+        if value_type == 0x0f:
+            return format_guid(data, pos)
+        if value_type == 0x10:
+            return f"0x{int.from_bytes(data[pos:pos + size], 'little'):x}"
+        if value_type == 0x11:
+            return format_filetime(struct.unpack_from('<Q', data, pos)[0])
+        if value_type == 0x12:
+            return format_systemtime(data, pos)
+        if value_type == 0x13:
+            return format_sid(data, pos)
+        if value_type == 0x21:
+            return self.fragment(pos)
+        if value_type == 0x81:
+            return [s for s in data[pos:pos + size].decode('utf-16-le').split('\x00') if s]
+        if value_type & 0x80 and value_type & 0x7f in ARRAY_ITEM_SIZES:
+            item_size = ARRAY_ITEM_SIZES[value_type & 0x7f]
+            return [self.value(pos + i, item_size, value_type & 0x7f) for i in range(0, size, item_size)]
+        return data[pos:pos + size].hex().upper()
+
+
+# -- rendering to Chainsaw-shaped documents ---------------------------------
+
+def _text(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        return ','.join(_text(v) for v in value)
+    return str(value)
+
+
+def _resolve(parts, values):
+    # Returns the element/attribute value: typed when it is a single substitution.
+    resolved = []
+    for part in parts:
+        if isinstance(part, tuple):
+            value = values[part[0]] if part[0] < len(values) else None
+            if value is not None:
+                resolved.append(value)
+        else:
+            resolved.append(part)
+    if not resolved:
+        return None
+    if len(resolved) == 1:
+        return resolved[0]
+    return ''.join(_text(v) for v in resolved)
+
+
+def _fold(pairs):
+    # Repeated element names become lists, as in Chainsaw's JSON.
+    result = {}
+    repeated = set()
+    for key, value in pairs:
+        if key not in result:
+            result[key] = value
+            continue
+        if key not in repeated:
+            result[key] = [result[key]]
+            repeated.add(key)
+        result[key].append(value)
+    return result
+
+
+def render_node(node, values, out, parent):
+    attributes = {}
+    for name, parts in node.attributes:
+        value = _resolve(parts, values)
+        if value is not None:
+            attributes[name] = value
+
+    if parent == 'EventData' and node.name == 'Data' and 'Name' in attributes:
+        out.append((attributes['Name'], _resolve(node.content, values)))
+        return
+
+    children = []
+    texts = []
+    for item in node.content:
+        if isinstance(item, _Node):
+            render_node(item, values, children, node.name)
+        elif isinstance(item, tuple):
+            value = values[item[0]] if item[0] < len(values) else None
+            if isinstance(value, _Fragment):
+                render_node(value.node, value.values, children, node.name)
+            elif value is not None:
+                texts.append(value)
+        else:
+            texts.append(item)
+
+    if children:
+        value = _fold(children)
+    elif not texts:
+        value = None
+    elif len(texts) == 1:
+        value = texts[0]
+    else:
+        value = ''.join(_text(t) for t in texts)
+
+    if value is not None or not attributes:
+        out.append((node.name, value))
+    if attributes:
+        out.append((f"{node.name}_attributes", attributes))
+
+
+def parse_chunk(chunk):
+    """Decode every record of one validated chunk into documents."""
+    return list(_Chunk(bytes(chunk)).records())
+
+
+# -- file access ------------------------------------------------------------
+
+class EvtxFile:
+    """Memory-mapped EVTX file with lazy, chunk-at-a-time record decoding."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < FILE_HEADER_SIZE:
+            self._file.close()
+            raise EvtxFormatError(f"{path} is too small to be an EVTX file")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header = parse_file_header(self._map[:FILE_HEADER_SIZE])
+        if not self.header['checksum_valid']:
+            logging.warning(f"EVTX file header checksum mismatch in {path}")
+        self.chunk_slots = (size - FILE_HEADER_SIZE) // CHUNK_SIZE
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def chunk(self, index):
+        start = FILE_HEADER_SIZE + index * CHUNK_SIZE
+        return self._map[start:start + CHUNK_SIZE]
+
+    def chunks(self):
+        # Yields (index, bytes) for every valid chunk; unused trailing slots are all zeros.
+        for index in range(self.chunk_slots):
+            chunk = self.chunk(index)
+            if chunk[:8] == b'\x00' * 8:
+                continue
+            problem = validate_chunk(chunk)
+            if problem:
+                logging.warning(f"Skipping chunk {index} of {self.path}: {problem}")
+                continue
+            yield index, chunk
+
+    def records(self):
+        for _, chunk in self.chunks():
+            yield from parse_chunk(chunk)
+
+
+_worker_files = {}
+
+
+def _parse_chunks_at(path, indexes):
+    evtx = _worker_files.get(path)
+    if evtx is None:
+        evtx = _worker_files[path] = EvtxFile(path)
+    documents = []
+    for index in indexes:
+        documents.extend(parse_chunk(evtx.chunk(index)))
+    return documents
+
+
+def iter_records(path, workers=1, chunks_per_task=4):
+    """Yield records in file order, decoding chunks on `workers` processes."""
+    with EvtxFile(path) as evtx:
+        if workers <= 1:
+            yield from evtx.records()
+            return
+        indexes = [index for index, _ in evtx.chunks()]
+
+    batches = iter([indexes[i:i + chunks_per_task] for i in range(0, len(indexes), chunks_per_task)])
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep a bounded number of tasks in flight so memory stays flat.
+        pending = collections.deque(
+            pool.submit(_parse_chunks_at, path, batch) for batch in itertools.islice(batches, workers * 2))
+        while pending:
+            documents = pending.popleft().result()
+            for batch in itertools.islice(batches, 1):
+                pending.append(pool.submit(_parse_chunks_at, path, batch))
+            yield from documents
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Dump EVTX records as JSON lines")
+    parser.add_argument("files", nargs="+", help=".evtx files to read")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Processes used to decode chunks")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for path in args.files:
+        for document in iter_records(path, workers=args.workers):
+            sys.stdout.write(json.dumps(document) + "\n")
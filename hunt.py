@@ -0,0 +1,372 @@
+import collections
+import concurrent.futures
+import glob
+import hashlib
+import heapq
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+import atomic
+import eventdata
+import evtx_parser
+import rulepack
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Offline bulk hunting over collected exports. Every input is split into
+# shards (a range of chunks of an .evtx file, or a whole JSON export) and the
+# shards are hunted on a process pool, each worker compiling the rule pack
+# once. A worker writes its shard's hits, sorted by time, to a part file and
+# the parent journals the shard as done, so an interrupted sweep resumes where
+# it stopped. When every shard is in, the part files are merged into a single
+# time-ordered NDJSON or Chainsaw JSON output; correlation rules run during
+# that merge, since their windows need the events of all shards in order.
+
+CHUNKS_PER_SHARD = 32
+EVTX_SUFFIXES = ('.evtx',)
+JSON_SUFFIXES = ('.json', '.ndjson', '.jsonl')
+
+_engine = None
+
+
+def find_inputs(patterns):
+    """Expand directories and globs into a sorted list of .evtx and JSON files."""
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for folder, _, names in os.walk(pattern):
+                found.update(os.path.join(folder, n) for n in names if n.lower().endswith(EVTX_SUFFIXES + JSON_SUFFIXES))
+        else:
+            found.update(p for p in glob.glob(pattern, recursive=True)
+                         if os.path.isfile(p) and p.lower().endswith(EVTX_SUFFIXES + JSON_SUFFIXES))
+    return sorted(os.path.abspath(p) for p in found)
+
+
+def plan_shards(paths, chunks_per_shard=CHUNKS_PER_SHARD):
+    """Shard descriptors for `paths`; each is keyed by the file's size and mtime."""
+    shards = []
+    for path in paths:
+        stat = os.stat(path)
+        base = {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        if not path.lower().endswith(EVTX_SUFFIXES):
+            shards.append(dict(base, kind='json', first=0, last=0))
+            continue
+        try:
+            with open(path, 'rb') as f:
+                evtx_parser.parse_file_header(f.read(evtx_parser.FILE_HEADER_SIZE))
+        except (OSError, evtx_parser.EvtxFormatError) as e:
+            logging.error(f"Error reading EVTX header of {path}: {str(e)}")
+            continue
+        slots = (stat.st_size - evtx_parser.FILE_HEADER_SIZE) // evtx_parser.CHUNK_SIZE
+        for first in range(0, slots, chunks_per_shard):
+            shards.append(dict(base, kind='evtx', first=first, last=min(first + chunks_per_shard, slots)))
+    for shard in shards:
+        identity = f"{shard['path']}|{shard['size']}|{shard['mtime']}|{shard['first']}-{shard['last']}"
+        shard['id'] = hashlib.sha1(identity.encode('utf-8')).hexdigest()
+    return shards
+
+
+def read_evtx_range(path, first, last):
+    # Plain reads rather than an mmap of the whole file, so a worker's address
+    # space stays within its memory cap whatever the file size
+    with open(path, 'rb') as f:
+        for index in range(first, last):
+            f.seek(evtx_parser.FILE_HEADER_SIZE + index * evtx_parser.CHUNK_SIZE)
+            chunk = f.read(evtx_parser.CHUNK_SIZE)
+            if len(chunk) < evtx_parser.CHUNK_SIZE or chunk[:8] == b'\x00' * 8:
+                continue
+            problem = evtx_parser.validate_chunk(chunk)
+            if problem:
+                logging.warning(f"Skipping chunk {index} of {path}: {problem}")
+                continue
+            yield evtx_parser.parse_chunk(chunk)
+
+
+def _document(item, extractor):
+    # Event documents as written by evtx_parser, Chainsaw hits wrapping one, or
+    # the flat events of main.py and evtx.py exports
+    if isinstance(item, dict):
+        if 'Event' in item:
+            return item
+        document = item.get('document')
+        if isinstance(document, dict) and isinstance(document.get('data'), dict):
+            return document['data']
+        if 'EventID' in item and 'Message' in item:
+            return eventdata.event_document(item, extractor)
+    return None
+
+
+def read_json_documents(path, batch_size=1000):
+    with open(path, 'r', encoding='utf-8') as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        if head == '[':
+            items = json.load(f)
+        else:
+            items = (json.loads(line) for line in f if line.strip())
+        extractor = eventdata.FieldExtractor()
+        batch = []
+        for item in items:
+            document = _document(item, extractor)
+            if document is not None:
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+
+def hit_key(hit):
+    record_id = ((hit['document']['data'].get('Event') or {}).get('System') or {}).get('EventRecordID')
+    return (hit.get('timestamp') or '', hit['document']['path'], record_id if isinstance(record_id, int) else 0)
+
+
+def watch_parent(parent):
+    # A killed parent leaves pool workers blocked on their task queue forever
+    while os.getppid() == parent:
+        time.sleep(1.0)
+    os._exit(1)
+
+
+def _init_worker(pack_path, max_memory):
+    global _engine
+    logging.getLogger().setLevel(logging.WARNING)
+    threading.Thread(target=watch_parent, args=(os.getppid(),), daemon=True).start()
+    if max_memory and resource is not None:
+        limit = max_memory * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    _engine = rulepack.RulePack.open(pack_path).engine()
+    # Correlations need every shard's events in time order; they run at merge
+    _engine.correlator = None
+
+
+def hunt_shard(shard, parts_dir):
+    """Hunt one shard into a time-sorted part file; returns (events, hits)."""
+    if shard['kind'] == 'evtx':
+        batches = read_evtx_range(shard['path'], shard['first'], shard['last'])
+    else:
+        batches = read_json_documents(shard['path'])
+    events = 0
+    hits = []
+    for documents in batches:
+        events += len(documents)
+        hits.extend(_engine.hunt(documents, shard['path']))
+    if shard['kind'] == 'json' and not events:
+        logging.warning(f"No event documents in {shard['path']}")
+    hits.sort(key=hit_key)
+    with atomic.replacing(os.path.join(parts_dir, f"{shard['id']}.ndjson"), prefix='.part-') as f:
+        for hit in hits:
+            f.write(json.dumps(hit, default=str) + "\n")
+    return events, len(hits)
+
+
+class Journal:
+    """Append-only record of finished shards next to their part files."""
+
+    def __init__(self, parts_dir, key):
+        self.path = os.path.join(parts_dir, 'manifest.ndjson')
+        self.done = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                lines = f.read().splitlines()
+            try:
+                header = json.loads(lines[0]) if lines else {}
+            except ValueError:
+                header = {}
+            if header.get('key') == key:
+                for line in lines[1:]:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line of an interrupted run
+                        continue
+                    self.done[entry['id']] = entry
+            else:
+                logging.info(f"Rule set changed since the last run; starting {parts_dir} over")
+                os.remove(self.path)
+        if not os.path.exists(self.path):
+            with open(self.path, 'w') as f:
+                f.write(json.dumps({'key': key}) + "\n")
+        self._file = open(self.path, 'a')
+
+    def record(self, shard, events, hits):
+        entry = {'id': shard['id'], 'path': shard['path'], 'first': shard['first'], 'last': shard['last'],
+                 'events': events, 'hits': hits}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done[shard['id']] = entry
+
+    def close(self):
+        self._file.close()
+
+
+def _read_part(path):
+    with open(path, 'r') as f:
+        for line in f:
+            hit = json.loads(line)
+            yield hit_key(hit), hit
+
+
+def merge_parts(part_paths, output, fmt='ndjson', engine=None, correlate=True):
+    """Stream the sorted part files into `output`; returns the number of hits written.
+
+    Hits of silent correlation base rules are dropped even when `correlate` is
+    false and the correlations themselves are skipped.
+    """
+    correlator = engine.correlator if engine else None
+    rules = {rule.id: rule for rule in engine.rules if rule.id} if correlator else {}
+    merged = heapq.merge(*(_read_part(p) for p in part_paths), key=lambda item: item[0])
+    written = 0
+    with atomic.replacing(output, prefix='.hunt-') as f:
+        if fmt == 'json':
+            f.write('[')
+        for _, hit in merged:
+            emitted = [hit]
+            rule = rules.get(hit.get('id'))
+            if rule is not None:
+                if correlate:
+                    document = hit['document']
+                    emitted.extend(correlator.observe(document['data'], [rule], document['path'],
+                                                      hit['timestamp']))
+                if correlator.is_silent(rule):
+                    emitted.pop(0)
+            for item in emitted:
+                if fmt == 'json':
+                    f.write(',' if written else '')
+                    f.write(json.dumps(item, default=str))
+                else:
+                    f.write(json.dumps(item, default=str) + "\n")
+                written += 1
+        if fmt == 'json':
+            f.write(']')
+    return written
+
+
+def _run_pool(work, workers, pack_path, max_memory, parts_dir, journal, progress):
+    """Hunt shards from `work` until it is empty or the pool breaks; returns shards completed."""
+    completed = 0
+    width = (workers or os.cpu_count() or 1) * 2
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                initargs=(pack_path, max_memory)) as pool:
+        running = {}
+        while True:
+            # Bounded in-flight work keeps the parent's queue small
+            while work and len(running) < width:
+                shard = work.popleft()
+                try:
+                    running[pool.submit(hunt_shard, shard, parts_dir)] = shard
+                except concurrent.futures.BrokenExecutor:
+                    work.appendleft(shard)
+                    break
+            if not running:
+                return completed
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                shard = running.pop(future)
+                try:
+                    events, hits = future.result()
+                except Exception as e:
+                    # A worker that died (memory cap, crash) also fails the shards beside it
+                    progress['failed'] += 1
+                    logging.error(f"Error hunting {shard['path']} chunks {shard['first']}-{shard['last']}: "
+                                  f"{type(e).__name__}: {str(e)}")
+                    continue
+                journal.record(shard, events, hits)
+                completed += 1
+                progress['events'] += events
+                progress['hits'] += hits
+            elapsed = time.monotonic() - progress['started']
+            if elapsed - progress['reported'] >= 1.0 or not (running or work):
+                progress['reported'] = elapsed
+                logging.info(f"Hunt progress: {len(journal.done) + progress['failed']}/{progress['total']} shards, "
+                             f"{progress['events']} events, {progress['hits']} hits, "
+                             f"{progress['events'] / elapsed if elapsed else 0:.0f} events/s")
+
+
+def run(inputs, output, rules_path, mapping_path, correlations_path=None, pack_path=None, workers=None,
+        chunks_per_shard=CHUNKS_PER_SHARD, max_memory=None, fmt='ndjson', correlate=True, keep_parts=False):
+    """Hunt every shard of `inputs` not already done and write the merged output."""
+    parts_dir = f"{output}.parts"
+    os.makedirs(parts_dir, exist_ok=True)
+    pack_path = pack_path or os.path.join(parts_dir, 'rulepack.bin')
+    pack = rulepack.load(rules_path, mapping_path, correlations_path, pack_path)
+    if max_memory and resource is None:
+        logging.warning("Per-worker memory caps are not supported on this platform")
+
+    shards = plan_shards(find_inputs(inputs), chunks_per_shard)
+    journal = Journal(parts_dir, pack.key.hex())
+    pending = [shard for shard in shards if shard['id'] not in journal.done]
+    logging.info(f"Hunting {len(shards)} shards ({len(shards) - len(pending)} already done) on "
+                 f"{workers or os.cpu_count()} workers")
+
+    started = time.monotonic()
+    progress = {'events': 0, 'hits': 0, 'failed': 0, 'total': len(shards), 'started': started, 'reported': 0.0}
+    work = collections.deque(pending)
+    while work:
+        if not _run_pool(work, workers, pack_path, max_memory, parts_dir, journal, progress):
+            # Broke before finishing a single shard: the workers cannot start
+            logging.error(f"Worker pool failed; {len(work)} shards not hunted")
+            progress['failed'] += len(work)
+            break
+        if work:
+            logging.warning(f"Worker pool broke; restarting it for {len(work)} remaining shards")
+    failed = progress['failed']
+    journal.close()
+
+    parts = [os.path.join(parts_dir, f"{shard['id']}.ndjson") for shard in shards if shard['id'] in journal.done]
+    written = merge_parts(parts, output, fmt, pack.engine(), correlate)
+    summary = {
+        'shards': len(shards),
+        'failed': failed,
+        'events': sum(entry['events'] for entry in journal.done.values()),
+        'hits': written,
+        'seconds': round(time.monotonic() - started, 3),
+    }
+    if failed:
+        logging.error(f"{failed} shards failed; run the same command again to retry them")
+    elif not keep_parts:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    logging.info(f"Hunt finished: {summary}")
+    return summary
+
+
+def main(argv=None, base_path=None, state_path=None):
+    import argparse
+
+    base_path = base_path or os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(prog="hunt", description="Hunt Sigma rules over directories of .evtx and JSON exports")
+    parser.add_argument("inputs", nargs="+", help="Files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="Merged, time-ordered hits")
+    parser.add_argument("--format", choices=["ndjson", "json"], default="ndjson", help="NDJSON lines or a Chainsaw JSON array")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--chunks-per-shard", type=int, default=CHUNKS_PER_SHARD, help="EVTX chunks (64 KB each) per work unit")
+    parser.add_argument("--max-worker-mb", type=int, default=2048, help="Address-space cap per worker process (0 for none)")
+    parser.add_argument("--no-correlations", action="store_true", help="Skip correlation rules")
+    parser.add_argument("--keep-parts", action="store_true", help="Keep per-shard part files after merging")
+    parser.add_argument("--rules", default=os.path.join(base_path, "needed"), help="Sigma rule directory")
+    parser.add_argument("--mapping", default=os.path.join(base_path, "mappings", "sigma-event-logs-all.yml"))
+    parser.add_argument("--correlations", default=os.path.join(base_path, "correlations"), help="Correlation rule directory")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    pack_path = os.path.join(state_path, "rulepack.bin") if state_path else None
+    summary = run(args.inputs, args.output, args.rules, args.mapping, args.correlations, pack_path, args.workers,
+                  args.chunks_per_shard, args.max_worker_mb or None, args.format, not args.no_correlations,
+                  args.keep_parts)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,757 @@
+import asyncio
+import collections
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+import zlib
+
+import metrics
+import zdict
+
+# Reference ingest server for the agent's three endpoints, on plain asyncio.
+# Request bodies are read as they arrive: chunked framing and gzip are undone
+# incrementally, the multipart stream is split into parts without buffering
+# the body, and the XML or NDJSON log part is parsed event by event. Accepted
+# records from all connections go to one writer that flushes them together
+# (group commit): a request is answered once the flush holding its records has
+# been written, and a busy server makes few large appends instead of one per
+# request. A batch re-sent after a lost response has the same content digest
+# and is acknowledged without being stored twice. Bodies compressed against a
+# preset dictionary (x-deflate-dictionary) are decoded with the matching
+# version from the dictionary folder.
+#
+#   python ingest.py serve --port 3001 --data ingest
+#   python ingest.py loadtest --agents 500 --events 500 --cycles 3
+
+HOST = '127.0.0.1'
+PORT = 3001
+DATA_DIR = 'ingest'
+DICTIONARY_DIR = 'dictionaries'
+MAX_BODY_BYTES = 64 * 1024 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+READ_SIZE = 64 * 1024
+FLUSH_SECONDS = 0.02
+FLUSH_BYTES = 8 * 1024 * 1024
+FSYNC = False
+DEDUPE_ENTRIES = 200000
+
+ENDPOINTS = {'/api/logs': 'logs', '/api/chainsaw_logs': 'chainsaw', '/api/sendemail': 'email'}
+LOG_PARTS = ('xml_file', 'ndjson_file')
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           431: 'Request Header Fields Too Large', 500: 'Internal Server Error'}
+PARAMETER = re.compile(r'(\w+)="([^"]*)"')
+
+REQUESTS = metrics.counter('ingest_requests_total', 'Requests by endpoint and response status', ('endpoint', 'status'))
+RECORDS = metrics.counter('ingest_records_total', 'Events, detections and emails stored', ('endpoint',))
+DUPLICATES = metrics.counter('ingest_duplicates_total', 'Re-sent batches acknowledged without storing them again', ('endpoint',))
+BODY_BYTES = metrics.counter('ingest_body_bytes_total', 'Request body bytes received on the wire', ('endpoint',))
+REQUEST_SECONDS = metrics.histogram('ingest_request_seconds', 'Time from request headers to response', ('endpoint',))
+WRITE_SECONDS = metrics.histogram('ingest_flush_seconds', 'Time to write one group of records')
+FLUSH_SIZE = metrics.histogram('ingest_flush_bytes', 'Bytes written per flush', buckets=metrics.BYTE_BUCKETS)
+CONNECTIONS = metrics.gauge('ingest_connections', 'Open agent connections')
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def iter_body(reader, headers):
+    """Body chunks as they arrive, with chunked framing removed."""
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        while True:
+            line = await reader.readline()
+            try:
+                size = int(line.split(b';')[0].strip(), 16)
+            except ValueError:
+                raise RequestError(400, 'bad chunk size') from None
+            if size == 0:
+                # Trailers end with an empty line
+                while (await reader.readline()).strip():
+                    pass
+                return
+            yield await reader.readexactly(size)
+            await reader.readexactly(2)
+    remaining = int(headers.get('content-length') or 0)
+    while remaining:
+        data = await reader.read(min(remaining, READ_SIZE))
+        if not data:
+            raise asyncio.IncompleteReadError(b'', remaining)
+        remaining -= len(data)
+        yield data
+
+
+async def iter_decoded(chunks, headers, stats, dictionaries=None):
+    """Body chunks with gzip or dictionary deflate undone, capped at MAX_BODY_BYTES decoded."""
+    encoding = headers.get('content-encoding', '').lower()
+    decompressor = None
+    if encoding == 'gzip':
+        decompressor = zlib.decompressobj(31)
+    elif encoding == zdict.ENCODING:
+        try:
+            decompressor = dictionaries.get(headers.get(zdict.ID_HEADER.lower(), '')).decompressobj()
+        except (AttributeError, ValueError):
+            raise RequestError(400, f"unknown compression dictionary {headers.get(zdict.ID_HEADER.lower())}")
+    total = 0
+    async for chunk in chunks:
+        stats['wire'] += len(chunk)
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+        total += len(chunk)
+        if total > MAX_BODY_BYTES:
+            raise RequestError(413, f"body over {MAX_BODY_BYTES} bytes")
+        if chunk:
+            yield chunk
+    if decompressor:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+class MultipartParser:
+    """Incremental multipart/form-data splitter.
+
+    feed() returns ('part', headers), ('data', bytes) and ('end', None) events;
+    part data is passed on as soon as it cannot be the start of a boundary.
+    """
+
+    def __init__(self, boundary):
+        self.delimiter = b'\r\n--' + boundary
+        # The opening boundary has no CRLF in front of it
+        self.buffer = bytearray(b'\r\n')
+        self.state = 'preamble'
+
+    def feed(self, data):
+        self.buffer += data
+        events = []
+        while True:
+            if self.state in ('preamble', 'body'):
+                index = self.buffer.find(self.delimiter)
+                if index < 0:
+                    safe = len(self.buffer) - len(self.delimiter)
+                    if safe > 0:
+                        if self.state == 'body':
+                            events.append(('data', bytes(self.buffer[:safe])))
+                        del self.buffer[:safe]
+                    return events
+                if self.state == 'body':
+                    events.append(('data', bytes(self.buffer[:index])))
+                    events.append(('end', None))
+                del self.buffer[:index + len(self.delimiter)]
+                self.state = 'boundary'
+            if self.state == 'boundary':
+                if len(self.buffer) < 2:
+                    return events
+                if self.buffer[:2] == b'--':
+                    self.state = 'done'
+                    self.buffer.clear()
+                    return events
+                index = self.buffer.find(b'\r\n')
+                if index < 0:
+                    return events
+                del self.buffer[:index + 2]
+                self.state = 'headers'
+            if self.state == 'headers':
+                index = self.buffer.find(b'\r\n\r\n')
+                if index < 0:
+                    if len(self.buffer) > MAX_FIELD_BYTES:
+                        raise RequestError(400, 'part headers too long')
+                    return events
+                headers = {}
+                for line in bytes(self.buffer[:index]).decode('utf-8', 'replace').split('\r\n'):
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                del self.buffer[:index + 4]
+                self.state = 'body'
+                events.append(('part', headers))
+            if self.state == 'done':
+                self.buffer.clear()
+                return events
+
+
+def _xml_record(element):
+    record = {}
+    for child in element:
+        if len(child):
+            # <EventData><Data Name="...">: repeated names become lists
+            data = {}
+            for item in child:
+                name, text = item.get('Name', item.tag), item.text or ''
+                if name in data:
+                    data[name] = (data[name] if isinstance(data[name], list) else [data[name]]) + [text]
+                else:
+                    data[name] = text
+            record[child.tag] = data
+        else:
+            record[child.tag] = child.text or ''
+    return record
+
+
+class XmlEvents:
+    """<Events><Event>... parsed as it is fed; each Event is emptied once read."""
+
+    def __init__(self):
+        self.parser = ET.XMLPullParser(events=('end',))
+
+    def feed(self, data):
+        self.parser.feed(data)
+        return self._read()
+
+    def close(self):
+        self.parser.close()
+        return self._read()
+
+    def _read(self):
+        records = []
+        for _, element in self.parser.read_events():
+            if element.tag == 'Event':
+                records.append(_xml_record(element))
+                element.clear()
+        return records
+
+
+class NdjsonEvents:
+    def __init__(self):
+        self.buffer = b''
+
+    def feed(self, data):
+        lines = (self.buffer + data).split(b'\n')
+        self.buffer = lines.pop()
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def close(self):
+        data, self.buffer = self.buffer, b''
+        return [json.loads(data)] if data.strip() else []
+
+
+class Deduper:
+    """Digests of recently stored batches, oldest forgotten first."""
+
+    def __init__(self, max_entries=DEDUPE_ENTRIES):
+        self.max_entries = max_entries
+        self.digests = collections.OrderedDict()
+
+    def claim(self, digest):
+        # False when the batch was already stored or is being stored right now
+        if digest in self.digests:
+            self.digests.move_to_end(digest)
+            return False
+        self.digests[digest] = True
+        if len(self.digests) > self.max_entries:
+            self.digests.popitem(last=False)
+        return True
+
+    def release(self, digest):
+        self.digests.pop(digest, None)
+
+
+class BatchWriter:
+    """Group commit of NDJSON lines into <root>/<kind>/<YYYYMMDD>.ndjson."""
+
+    def __init__(self, root, flush_seconds=FLUSH_SECONDS, flush_bytes=FLUSH_BYTES, fsync=FSYNC):
+        self.root = root
+        self.flush_seconds = flush_seconds
+        self.flush_bytes = flush_bytes
+        self.fsync = fsync
+        self.pending = []
+        self.waiters = []
+        self.pending_bytes = 0
+        self.ready = asyncio.Event()
+        self.files = {}
+        # One thread, so flushes reach the files in the order they were taken
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-writer')
+        self.task = None
+        self.stats = {'flushes': 0, 'lines': 0, 'bytes': 0}
+
+    def start(self):
+        self.task = asyncio.ensure_future(self._run())
+
+    async def append(self, kind, lines):
+        """Resolves once `lines` are written."""
+        data = b''.join(lines)
+        waiter = asyncio.get_running_loop().create_future()
+        self.pending.append((kind, data, len(lines)))
+        self.waiters.append(waiter)
+        self.pending_bytes += len(data)
+        if self.pending_bytes >= self.flush_bytes:
+            # A full batch leaves at once; under load the timer task may not get a turn for a while
+            asyncio.ensure_future(self._flush())
+        else:
+            self.ready.set()
+        await waiter
+
+    async def _run(self):
+        while True:
+            await self.ready.wait()
+            # Give other requests a moment to join this flush
+            await asyncio.sleep(self.flush_seconds)
+            self.ready.clear()
+            if self.pending:
+                await self._flush()
+
+    async def _flush(self):
+        batch, waiters = self.pending, self.waiters
+        self.pending, self.waiters, self.pending_bytes = [], [], 0
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._write, batch)
+        except Exception as e:
+            logging.error(f"Error writing ingested records: {str(e)}")
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        day = datetime.datetime.now().strftime('%Y%m%d')
+        groups = collections.defaultdict(list)
+        lines = 0
+        for kind, data, count in batch:
+            groups[kind].append(data)
+            lines += count
+        written = 0
+        for kind, parts in groups.items():
+            handle = self._file(kind, day)
+            data = b''.join(parts)
+            handle.write(data)
+            handle.flush()
+            if self.fsync:
+                os.fsync(handle.fileno())
+            written += len(data)
+        self.stats['flushes'] += 1
+        self.stats['lines'] += lines
+        self.stats['bytes'] += written
+        FLUSH_SIZE.observe(written)
+        WRITE_SECONDS.observe(time.perf_counter() - started)
+
+    def _file(self, kind, day):
+        current = self.files.get(kind)
+        if current is not None and current[0] == day:
+            return current[1]
+        if current is not None:
+            current[1].close()
+        folder = os.path.join(self.root, kind)
+        os.makedirs(folder, exist_ok=True)
+        handle = open(os.path.join(folder, f"{day}.ndjson"), 'ab')
+        self.files[kind] = (day, handle)
+        return handle
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+        self.executor.shutdown()
+        for _, handle in self.files.values():
+            handle.close()
+        self.files = {}
+
+
+ENCODER = json.JSONEncoder(separators=(',', ':'), default=str)
+
+
+def _line(record):
+    return ENCODER.encode(record).encode('utf-8') + b'\n'
+
+
+def _lines(prefix, key, records):
+    # {"accessKey":...,"<key>":record} with the per-request part encoded once
+    head = ENCODER.encode(prefix)[:-1].encode('utf-8') + f',"{key}":'.encode('ascii')
+    return [head + ENCODER.encode(record).encode('utf-8') + b'}\n' for record in records]
+
+
+class IngestServer:
+    """The agent's /api/logs, /api/chainsaw_logs and /api/sendemail, plus /stats and /metrics."""
+
+    def __init__(self, root=DATA_DIR, host=HOST, port=PORT, dictionaries=DICTIONARY_DIR, **writer_options):
+        self.host = host
+        self.port = port
+        self.dictionaries = zdict.Dictionaries(dictionaries)
+        self.writer = BatchWriter(root, **writer_options)
+        self.deduper = Deduper()
+        self.server = None
+        self.started = time.time()
+        self.recent = collections.deque()
+        self.stats = {'connections': 0, 'requests': 0, 'records': 0, 'duplicates': 0, 'errors': 0, 'wire_bytes': 0}
+
+    async def start(self):
+        self.writer.start()
+        self.server = await asyncio.start_server(self._connection, self.host, self.port, limit=MAX_FIELD_BYTES)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info(f"Ingest server listening on http://{self.host}:{self.port}, storing in {self.writer.root}, "
+                     f"{len(self.dictionaries.by_id)} compression dictionaries")
+        return self
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.writer.close()
+
+    async def _connection(self, reader, writer):
+        peer = (writer.get_extra_info('peername') or ('', 0))[0]
+        self.stats['connections'] += 1
+        CONNECTIONS.inc()
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 431, {'error': 'headers too long'}, False)
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'bad request line'}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                status, payload, intact = await self._request(method, target.split('?')[0], headers, reader, peer)
+                await self._respond(writer, status, payload, keep_alive and intact)
+                if not (keep_alive and intact):
+                    break
+        except Exception as e:
+            logging.error(f"Error serving {peer}: {str(e)}")
+        finally:
+            CONNECTIONS.dec()
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+        content_type = metrics.CONTENT_TYPE if isinstance(payload, bytes) else 'application/json'
+        writer.write((f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+                      f"Content-Length: {len(body)}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1') + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _request(self, method, path, headers, reader, peer):
+        """(status, payload, whether the body was consumed so the connection can be reused)."""
+        if method == 'GET' and path == '/metrics':
+            return 200, metrics.REGISTRY.render().encode('utf-8'), True
+        if method == 'GET' and path == '/stats':
+            return 200, self.summary(), True
+        endpoint = ENDPOINTS.get(path)
+        body = {'wire': 0}
+        chunks = iter_decoded(iter_body(reader, headers), headers, body, self.dictionaries)
+        if endpoint is None or method != 'POST':
+            async for _ in chunks:
+                pass
+            return (404 if endpoint is None else 405), {'error': f"{method} {path} not supported"}, True
+        started = time.perf_counter()
+        self.stats['requests'] += 1
+        status, payload, intact = 500, {'error': 'internal error'}, False
+        try:
+            if endpoint == 'email':
+                status, payload = await self._email(chunks)
+            else:
+                status, payload = await self._multipart(endpoint, headers, chunks, peer)
+            intact = True
+        except RequestError as e:
+            status, payload = e.status, {'error': str(e)}
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            status, payload = 400, {'error': f"incomplete body: {str(e)}"}
+        except Exception as e:
+            logging.error(f"Error handling {path}: {str(e)}")
+        if status != 200:
+            self.stats['errors'] += 1
+        self.stats['wire_bytes'] += body['wire']
+        BODY_BYTES.labels(endpoint=endpoint).inc(body['wire'])
+        REQUESTS.labels(endpoint=endpoint, status=str(status)).inc()
+        REQUEST_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - started)
+        return status, payload, intact
+
+    async def _multipart(self, endpoint, headers, chunks, peer):
+        match = re.search(r'boundary="?([^";]+)"?', headers.get('content-type', ''))
+        if not match:
+            raise RequestError(400, 'multipart/form-data boundary missing')
+        parser = MultipartParser(match.group(1).encode('latin-1'))
+        fields = {}
+        records = []
+        digest = hashlib.sha256(endpoint.encode('ascii'))
+        name = filename = reader = None
+        value = bytearray()
+        async for chunk in chunks:
+            for event, data in parser.feed(chunk):
+                if event == 'part':
+                    disposition = dict(PARAMETER.findall(data.get('content-disposition', '')))
+                    name, filename = disposition.get('name'), disposition.get('filename')
+                    if filename is None:
+                        reader = None
+                    elif endpoint == 'logs' and name in LOG_PARTS:
+                        reader = XmlEvents() if name == 'xml_file' else NdjsonEvents()
+                    else:
+                        # Detection files are small compact records; they are parsed whole
+                        reader = None
+                    value = bytearray()
+                elif event == 'data':
+                    if filename is not None:
+                        digest.update(data)
+                    if reader is not None:
+                        records.extend(reader.feed(data))
+                    else:
+                        value += data
+                        if filename is None and len(value) > MAX_FIELD_BYTES:
+                            raise RequestError(413, f"form field {name} too long")
+                elif event == 'end':
+                    if reader is not None:
+                        records.extend(reader.close())
+                    elif filename is None:
+                        fields[name] = value.decode('utf-8', 'replace')
+                    elif endpoint == 'chainsaw':
+                        fields['name'] = filename
+                        records.extend(json.loads(bytes(value)))
+                    reader = None
+        if parser.state != 'done':
+            raise RequestError(400, 'multipart body ended early')
+        access_key = fields.get('accessKey')
+        if not access_key:
+            raise RequestError(400, 'accessKey missing')
+        agent = {'accessKey': access_key, 'ipAddress': fields.get('ipAddress') or peer,
+                 'desktopName': fields.get('desktopName')}
+        digest.update(access_key.encode('utf-8'))
+        received = time.time()
+        if endpoint == 'logs':
+            lines = _lines({**agent, 'received': received}, 'event', records)
+        else:
+            lines = _lines({**agent, 'received': received, 'name': fields.get('name')}, 'hit', records)
+        return await self._store(endpoint, digest.hexdigest(), lines)
+
+    async def _email(self, chunks):
+        data = bytearray()
+        async for chunk in chunks:
+            data += chunk
+        try:
+            document = json.loads(bytes(data))
+        except ValueError:
+            raise RequestError(400, 'JSON body expected') from None
+        if not isinstance(document, dict) or 'email' not in document:
+            raise RequestError(400, 'email missing')
+        digest = hashlib.sha256(b'email' + bytes(data)).hexdigest()
+        # The reference server queues the digest instead of mailing it
+        return await self._store('email', digest, [_line({'received': time.time(), **document})])
+
+    async def _store(self, endpoint, digest, lines):
+        if not self.deduper.claim(digest):
+            self.stats['duplicates'] += 1
+            DUPLICATES.labels(endpoint=endpoint).inc()
+            return 200, {'status': 'duplicate', 'records': len(lines)}
+        try:
+            if lines:
+                await self.writer.append(endpoint, lines)
+        except Exception:
+            self.deduper.release(digest)
+            raise
+        self.stats['records'] += len(lines)
+        RECORDS.labels(endpoint=endpoint).inc(len(lines))
+        now = time.time()
+        self.recent.append((now, len(lines)))
+        while self.recent and self.recent[0][0] < now - 10:
+            self.recent.popleft()
+        return 200, {'status': 'ok', 'records': len(lines)}
+
+    def summary(self):
+        uptime = time.time() - self.started
+        return {
+            **self.stats,
+            'uptime': uptime,
+            'records_per_second': self.stats['records'] / uptime if uptime else 0.0,
+            'recent_records_per_second': sum(count for _, count in self.recent) / 10,
+            'writer': dict(self.writer.stats),
+        }
+
+
+async def serve(root, host, port, **options):
+    server = await IngestServer(root, host, port, **options).start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def _post(reader, writer, host, path, body, headers):
+    head = ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+    writer.write((f"POST {path} HTTP/1.1\r\nHost: {host}\r\n{head}Transfer-Encoding: chunked\r\n\r\n"
+                  f"{len(body):x}\r\n").encode('latin-1') + body + b'\r\n0\r\n\r\n')
+    await writer.drain()
+    response = await reader.readuntil(b'\r\n\r\n')
+    lines = response.decode('latin-1').split('\r\n')
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return int(lines[0].split(' ')[1]), json.loads(await reader.readexactly(length))
+
+
+async def load_test(host, port, bodies, interval, resend, seed=0):
+    """Every agent posts its bodies one cycle at a time over its own keep-alive connection."""
+    import random
+
+    rng = random.Random(seed)
+    latencies = []
+    totals = {'requests': 0, 'resent': 0, 'duplicates': 0, 'errors': 0, 'records': 0}
+
+    async def agent(cycles):
+        await asyncio.sleep(rng.uniform(0, interval))
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_FIELD_BYTES)
+        try:
+            for body, headers in cycles:
+                cycle_started = time.perf_counter()
+                sends = 2 if rng.random() < resend else 1
+                for attempt in range(sends):
+                    started = time.perf_counter()
+                    status, payload = await _post(reader, writer, host, '/api/logs', body, headers)
+                    latencies.append(time.perf_counter() - started)
+                    totals['requests'] += 1
+                    totals['resent'] += attempt
+                    if status != 200:
+                        totals['errors'] += 1
+                    elif payload.get('status') == 'duplicate':
+                        totals['duplicates'] += 1
+                    else:
+                        totals['records'] += payload.get('records', 0)
+                await asyncio.sleep(max(0.0, interval - (time.perf_counter() - cycle_started)))
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(agent(cycles) for cycles in bodies))
+    return totals, latencies, time.perf_counter() - started
+
+
+def build_bodies(agents, events, cycles, fmt):
+    """Per agent, one gzip multipart body per cycle, as the agent's uploader sends it."""
+    import itertools
+
+    import serializer
+    from benchmarks.replay import service_noise
+
+    batches = [[flat for flat, _ in itertools.islice(service_noise(events, seed=cycle), events)]
+               for cycle in range(cycles)]
+    bodies = []
+    for number in range(agents):
+        cycles_out = []
+        for batch in batches:
+            body = next(serializer.upload_bodies(batch, {'accessKey': f"agent-{number:05d}"}, fmt=fmt,
+                                                 max_events=events, max_bytes=None))
+            cycles_out.append((b''.join(body), dict(body.headers)))
+        bodies.append(cycles_out)
+    return bodies
+
+
+def run_load_test(args):
+    import socket
+    import subprocess
+    import sys
+    import tempfile
+    import urllib.request
+
+    print(f"Building {args.agents * args.cycles} request bodies of {args.events} events...")
+    bodies = build_bodies(args.agents, args.events, args.cycles, args.format)
+    wire = sum(len(body) for cycles in bodies for body, _ in cycles)
+    with tempfile.TemporaryDirectory() as tmp:
+        child = None
+        if args.url:
+            host, _, port = args.url.split('//')[-1].rstrip('/').partition(':')
+            port = int(port or 80)
+        else:
+            # The server runs in its own process so its capacity is not shared with the simulated agents
+            with socket.socket() as probe:
+                probe.bind((HOST, 0))
+                host, port = HOST, probe.getsockname()[1]
+            command = [sys.executable, os.path.abspath(__file__), 'serve', '--host', host, '--port', str(port),
+                       '--data', tmp, '--flush-ms', str(args.flush_ms)] + (['--fsync'] if args.fsync else [])
+            child = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+            deadline = time.time() + 10
+            while True:
+                try:
+                    socket.create_connection((host, port), timeout=1).close()
+                    break
+                except OSError:
+                    if time.time() > deadline:
+                        child.kill()
+                        raise SystemExit("Ingest server did not start")
+                    time.sleep(0.05)
+        try:
+            totals, latencies, elapsed = asyncio.run(load_test(host, port, bodies, args.interval, args.resend))
+            with urllib.request.urlopen(f"http://{host}:{port}/stats") as response:
+                server = json.load(response)
+        finally:
+            if child:
+                child.terminate()
+                child.wait()
+    print(f"{args.agents} agents x {args.cycles} cycles of {args.events} events ({args.format}, "
+          f"{wire / totals['requests'] / 1024:.1f} KB per request on the wire)")
+    print(f"  {totals['requests']} requests in {elapsed:.2f} s: {totals['requests'] / elapsed:.0f} requests/s, "
+          f"{totals['records'] / elapsed:.0f} events/s stored")
+    print(f"  latency p50 {_percentile(latencies, 0.5) * 1000:.1f} ms, p95 {_percentile(latencies, 0.95) * 1000:.1f} ms, "
+          f"p99 {_percentile(latencies, 0.99) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+    print(f"  resent {totals['resent']}, acknowledged as duplicates {totals['duplicates']}, errors {totals['errors']}")
+    writer = server['writer']
+    print(f"  server: {server['records']} records in {writer['flushes']} flushes "
+          f"({writer['lines'] / max(writer['flushes'], 1):.0f} records, "
+          f"{writer['bytes'] / max(writer['flushes'], 1) / 1024:.0f} KB per flush)")
+    if not args.interval:
+        rate = totals['records'] / elapsed
+        print(f"  at {args.events} events per agent every 60 s, one node absorbs about "
+              f"{rate * 60 / args.events:.0f} agents")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Reference ingest server for the agent's upload endpoints")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Accept uploads and store them as daily NDJSON files")
+    serve_parser.add_argument("--host", default=HOST)
+    serve_parser.add_argument("--port", type=int, default=PORT)
+    serve_parser.add_argument("--data", default=DATA_DIR, help="Folder for the stored records")
+    serve_parser.add_argument("--dictionaries", default=DICTIONARY_DIR, help="Preset compression dictionaries (zdict.py publish)")
+    serve_parser.add_argument("--flush-ms", type=float, default=FLUSH_SECONDS * 1000, help="How long a flush waits for more requests")
+    serve_parser.add_argument("--fsync", action="store_true", help="fsync every flush before acknowledging it")
+    load = commands.add_parser("loadtest", help="Simulate concurrent agents against a local server")
+    load.add_argument("--agents", type=int, default=200)
+    load.add_argument("--events", type=int, default=500, help="Events per agent per cycle")
+    load.add_argument("--cycles", type=int, default=3)
+    load.add_argument("--interval", type=float, default=0.0, help="Seconds between an agent's cycles (0: back to back)")
+    load.add_argument("--resend", type=float, default=0.02, help="Fraction of batches sent twice, as after a lost response")
+    load.add_argument("--format", choices=('xml', 'ndjson'), default='xml')
+    load.add_argument("--url", help="Existing server (default: start one in a child process)")
+    load.add_argument("--flush-ms", type=float, default=FLUSH_SECONDS * 1000)
+    load.add_argument("--fsync", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.data, args.host, args.port, dictionaries=args.dictionaries,
+                              flush_seconds=args.flush_ms / 1000, fsync=args.fsync))
+        except KeyboardInterrupt:
+            pass
+    else:
+        logging.getLogger().setLevel(logging.WARNING)
+        run_load_test(args)
@@ -3,16 +3,41 @@ import win32evtlogutil
 import win32security
 import winerror
 import datetime
-import time
-import json
-import xml.etree.ElementTree as ET
 import os
 import logging
-import shutil
+import subprocess
+import xml.etree.ElementTree as ET
+import channels
+import collection
+import eventdata
+import eventstore
+import messages
+import metrics
+import records
+import serializer
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
+message_cache = messages.MessageTemplateCache(messages.WindowsMessageLoader())
+
+# Per-event debug lines are logged for one event in this many
+DEBUG_LOG_SAMPLE = 1000
+debug_sampler = metrics.Sampler(DEBUG_LOG_SAMPLE)
+
+# Channels to collect, each with its own batch size and cadence (see channels.yml;
+# without the file: System, Security and Application every 1 to 10 minutes).
+# Each channel reads forward from its record cursor in cursors.json, on a pool
+# of COLLECT_THREADS threads, so a slow channel does not hold up the others.
+CHANNELS_FILE = 'channels.yml'
+COLLECT_THREADS = 4
+
+# Every collected event is also kept in the hour-partitioned store in events/
+STORE_RETENTION_DAYS = 30
+
+# Exported events also carry an EventData dict parsed from their message text
+EXPORT_EVENT_DATA = False
+
 def event_type_to_string(event_type):
     types = {
         win32evtlog.EVENTLOG_SUCCESS: 'Success',
@@ -24,64 +49,88 @@ def event_type_to_string(event_type):
     }
     return types.get(event_type, f'Unknown ({event_type})')
 
-def get_logs(log_type, start_time):
-    logs = []
-    try:
-        handle = win32evtlog.OpenEventLog(None, log_type)
-        flags = win32evtlog.EVENTLOG_BACKWARDS_READ | win32evtlog.EVENTLOG_SEQUENTIAL_READ
-        total_events = win32evtlog.GetNumberOfEventLogRecords(handle)
-        logging.info(f"Total events in {log_type} log: {total_events}")
-
-        events = win32evtlog.ReadEventLog(handle, flags, 0)
-        
-        for event in events:
-            if event.TimeGenerated > start_time:
-                try:
-                    data = {
-                        'EventID': event.EventID,
-                        'TimeGenerated': str(event.TimeGenerated),
-                        'SourceName': event.SourceName,
-                        'EventType': event_type_to_string(event.EventType),
-                        'EventCategory': event.EventCategory,
-                        'Message': win32evtlogutil.SafeFormatMessage(event, log_type)
-                    }
-                    logs.append(data)
-                    logging.debug(f"Processed event: {data['EventID']} from {data['SourceName']}")
-                except Exception as e:
-                    logging.error(f"Error processing event: {str(e)}")
-        
-        win32evtlog.CloseEventLog(handle)
-    except Exception as e:
-        logging.error(f"Error reading {log_type} log: {str(e)}")
-    
-    logging.info(f"Collected {len(logs)} events from {log_type} log")
-    return logs
+EVENT_NS = '{http://schemas.microsoft.com/win/2004/08/events/event}'
+LEVELS = {0: 'Information', 1: 'Critical', 2: 'Error', 3: 'Warning', 4: 'Information', 5: 'Verbose'}
+publisher_metadata = {}
+
+def log_sampled(data):
+    if debug_sampler.ready():
+        logging.debug(f"Processed event: {data.event_id} from {data.source} (1 in {DEBUG_LOG_SAMPLE} logged)")
+
+def format_event(log_type, event):
+    # A ReadEventLog record of a classic log; the message is rendered lazily from cached templates
+    data = records.EventRecord(
+        event.EventID, event.TimeGenerated, event.SourceName, event_type_to_string(event.EventType),
+        event.EventCategory,
+        message_cache.message(
+            log_type, event.SourceName, event.EventID, event.StringInserts,
+            lambda event=event: win32evtlogutil.SafeFormatMessage(event, log_type)))
+    log_sampled(data)
+    return data
 
-def export_to_json(logs, filename):
+def render_message(provider, handle, event_data):
     try:
-        with open(filename, 'w') as f:
-            json.dump(logs, f, indent=4)
-        logging.info(f"Exported {len(logs)} events to JSON: {filename}")
-    except Exception as e:
-        logging.error(f"Error exporting to JSON: {str(e)}")
+        metadata = publisher_metadata.get(provider)
+        if metadata is None:
+            metadata = publisher_metadata[provider] = win32evtlog.EvtOpenPublisherMetadata(provider)
+        return win32evtlog.EvtFormatMessage(metadata, handle, win32evtlog.EvtFormatMessageEvent)
+    except Exception:
+        # No message file for the provider: the raw EventData, one "Name: value" per line
+        if event_data is None:
+            return ''
+        return '\r\n'.join(f"{data.get('Name') or 'Data'}: {data.text or ''}" for data in event_data)
+
+def format_channel_event(channel, xml, handle):
+    # An EvtQuery record of any channel (Sysmon, PowerShell, ...), in the same shape as format_event()
+    event = ET.fromstring(xml)
+    system = event.find(f'{EVENT_NS}System')
+    provider = system.find(f'{EVENT_NS}Provider').get('Name')
+    # SystemTime is UTC; the classic API and the exports use local time
+    created = system.find(f'{EVENT_NS}TimeCreated').get('SystemTime')
+    moment = datetime.datetime.fromisoformat(created[:19]).replace(tzinfo=datetime.timezone.utc)
+    level = int(system.findtext(f'{EVENT_NS}Level') or 0)
+    data = records.EventRecord(
+        int(system.findtext(f'{EVENT_NS}EventID')), moment.astimezone().replace(tzinfo=None), provider,
+        LEVELS.get(level, f'Unknown ({level})'), int(system.findtext(f'{EVENT_NS}Task') or 0),
+        render_message(provider, handle, event.find(f'{EVENT_NS}EventData')))
+    log_sampled(data)
+    return data
+
+def open_source(channel):
+    # Classic logs through ReadEventLog; operational channels only exist for the Evt API
+    if '/' in channel:
+        return collection.WindowsChannelSource(channel, format_channel_event)
+    return collection.WindowsEventSource(channel, lambda event: format_event(channel, event))
 
-def export_to_xml(logs, filename):
+def export_logs(logs, json_filename, xml_filename):
+    # JSON and XML are written in the same pass over the stream; returns the event count.
+    # A failed export is raised so the channel's cursor stays where it was
+    count = 0
     try:
-        root = ET.Element("Events")
-        for log in logs:
-            event = ET.SubElement(root, "Event")
-            for key, value in log.items():
-                ET.SubElement(event, key).text = str(value)
-        
-        tree = ET.ElementTree(root)
-        tree.write(filename)
-        logging.info(f"Exported {len(logs)} events to XML: {filename}")
+        with serializer.JsonExport(json_filename) as json_out, serializer.XmlExport(xml_filename) as xml_out:
+            for _ in serializer.exporting(logs, json_out, xml_out):
+                count += 1
+        if count:
+            logging.info(f"Exported {count} events to JSON: {json_filename}")
+            logging.info(f"Exported {count} events to XML: {xml_filename}")
     except Exception as e:
-        logging.error(f"Error exporting to XML: {str(e)}")
+        logging.error(f"Error exporting logs: {str(e)}")
+        count = 0
+        raise
+    finally:
+        if not count:
+            for filename in (json_filename, xml_filename):
+                if os.path.exists(filename):
+                    os.remove(filename)
+    return count
 
-def save_evtx(log_type, filename):
+def save_evtx(log_type, filename, first=None, last=None):
+    # Only the collected record range, written straight into evtx/
+    command = ['wevtutil', 'epl', log_type, filename, '/ow:true']
+    if first is not None and last is not None:
+        command.append(f"/q:*[System[(EventRecordID>={first} and EventRecordID<={last})]]")
     try:
-        os.system(f'wevtutil epl {log_type} {filename}')
+        subprocess.run(command, check=True, capture_output=True)
         logging.info(f"Saved EVTX file: {filename}")
     except Exception as e:
         logging.error(f"Error saving EVTX file: {str(e)}")
@@ -93,52 +142,59 @@ def create_folders():
             os.makedirs(folder)
             logging.info(f"Created folder: {folder}")
 
-def move_file(src, dest):
-    try:
-        shutil.move(src, dest)
-        logging.info(f"Moved file from {src} to {dest}")
-    except Exception as e:
-        logging.error(f"Error moving file: {str(e)}")
+def held(logs, target):
+    # Pass `logs` through, keeping each event in `target`
+    for log in logs:
+        target.append(log)
+        yield log
+
+class ChannelExport:
+    """Writes one channel's new events straight into json/, xml/ and evtx/."""
+
+    def __init__(self, settings, extractor):
+        self.channel = settings.name
+        self.name = channels.file_name(settings.name)
+        self.evtx = settings.evtx
+        self.extractor = extractor
+        # Only this channel's partitions, so workers never share open partition files
+        self.store = eventstore.EventStore('events')
+
+    def __call__(self, worker, logs):
+        base_filename = f"{self.name}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        # Stored only once the export has succeeded: a failed run is read again
+        # from the same cursor, and storing it both times would duplicate it
+        collected = []
+        logs = held(logs, collected)
+        if EXPORT_EVENT_DATA:
+            logs = eventdata.with_event_data(logs, self.extractor)
+        count = export_logs(logs, os.path.join('json', f"{base_filename}.json"),
+                            os.path.join('xml', f"{base_filename}.xml"))
+        try:
+            for _ in self.store.writing(collected, self.name):
+                pass
+            self.store.flush()
+        except Exception as e:
+            logging.error(f"Error storing {self.channel} events: {str(e)}")
+        if count and self.evtx:
+            save_evtx(self.channel, os.path.join('evtx', f"{base_filename}.evtx"),
+                      worker.collector.first, worker.collector.position)
+        return count
 
 def main():
-    log_types = ['System', 'Security', 'Application']
     create_folders()
-    
-    while True:
-        start_time = datetime.datetime.now() - datetime.timedelta(minutes=10)
-        end_time = datetime.datetime.now()
-        
-        logging.info(f"Starting log collection for period: {start_time} to {end_time}")
-        
-        for log_type in log_types:
-            logging.info(f"Processing {log_type} logs")
-            logs = get_logs(log_type, start_time)
-            
-            if logs:
-                timestamp = end_time.strftime("%Y%m%d_%H%M%S")
-                base_filename = f"{log_type}_{timestamp}"
-                
-                json_file = f"{base_filename}.json"
-                xml_file = f"{base_filename}.xml"
-                evtx_file = f"{base_filename}.evtx"
-                
-                export_to_json(logs, json_file)
-                export_to_xml(logs, xml_file)
-                save_evtx(log_type, evtx_file)
-                
-                move_file(json_file, os.path.join('json', json_file))
-                move_file(xml_file, os.path.join('xml', xml_file))
-                move_file(evtx_file, os.path.join('evtx', evtx_file))
-            else:
-                logging.warning(f"No logs collected for {log_type}")
-        
-        logging.info(f"Log collection cycle completed. Waiting for next cycle.")
-        
-        # Wait until the next 10-minute mark
-        next_run = datetime.datetime.now() + datetime.timedelta(minutes=10)
-        next_run = next_run.replace(minute=next_run.minute // 10 * 10, second=0, microsecond=0)
-        wait_time = (next_run - datetime.datetime.now()).total_seconds()
-        time.sleep(wait_time)
+    settings = channels.load_channels(CHANNELS_FILE)
+    cursors = collection.CursorStore('cursors.json')
+    extractor = eventdata.FieldExtractor()
+    workers = [channels.ChannelWorker(channel, open_source, cursors, ChannelExport(channel, extractor))
+               for channel in settings]
+    retention = eventstore.EventStore('events', retention_days=STORE_RETENTION_DAYS)
+    logging.info(f"Collecting {', '.join(channel.name for channel in settings)} on {COLLECT_THREADS} threads")
+
+    def after_run(worker):
+        retention.enforce_retention()
+        logging.debug(f"Message template cache: {message_cache.stats()}")
+
+    channels.ChannelCollector(workers, COLLECT_THREADS, after_run=after_run).run()
 
 if __name__ == "__main__":
     logging.info("Starting Windows Log Collector")
@@ -148,4 +204,3 @@ if __name__ == "__main__":
         logging.info("Script terminated by user")
     except Exception as e:
         logging.critical(f"Unexpected error: {str(e)}")
-
@@ -0,0 +1,223 @@
+import collections
+import json
+import logging
+import os
+import re
+import threading
+
+# Event message rendering from cached templates. SafeFormatMessage() looks up
+# the message DLL and formats the full text for every event; here the raw
+# format string is loaded once per (channel, source, EventID, language) and
+# each event only substitutes its StringInserts, and only when the text is
+# actually needed.
+
+INSERT = re.compile(r'%([1-9]\d?)(?:!([^!]*)!)?|%([%0nrtb.!])')
+ESCAPES = {'%': '%', 'n': '\r\n', 'r': '\r', 't': '\t', 'b': ' ', '.': '.', '!': '!', '0': ''}
+
+
+def parse_template(text):
+    """Split a FormatMessage string into literal parts and 0-based insert indexes."""
+    parts = []
+    position = 0
+    for match in INSERT.finditer(text):
+        if match.start() > position:
+            parts.append(text[position:match.start()])
+        if match.group(1):
+            parts.append(int(match.group(1)) - 1)
+        else:
+            parts.append(ESCAPES[match.group(3)])
+            if match.group(3) == '0':
+                # %0 ends the message without a trailing newline
+                return _merge(parts)
+        position = match.end()
+    if position < len(text):
+        parts.append(text[position:])
+    return _merge(parts)
+
+
+def _merge(parts):
+    merged = []
+    for part in parts:
+        if merged and isinstance(part, str) and isinstance(merged[-1], str):
+            merged[-1] += part
+        else:
+            merged.append(part)
+    return tuple(merged)
+
+
+def render_template(parts, inserts):
+    inserts = inserts or ()
+    out = []
+    for part in parts:
+        if isinstance(part, int):
+            out.append(inserts[part] if part < len(inserts) else f"%{part + 1}")
+        else:
+            out.append(part)
+    return ''.join(out)
+
+
+class MessageTemplateCache:
+    """Bounded LRU of parsed message templates with hit/miss counters.
+
+    `loader(channel, source, event_id, language)` returns the raw format string or
+    None. Missing templates are cached too, so a source without a message file
+    is only looked up once.
+    """
+
+    def __init__(self, loader, max_size=2048):
+        self.loader = loader
+        self.max_size = max_size
+        self.templates = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Messages may be rendered on upload worker threads
+        self.lock = threading.RLock()
+
+    def get(self, channel, source, event_id, language=0):
+        with self.lock:
+            return self._get((channel, source, event_id, language))
+
+    def _get(self, key):
+        channel, source, event_id, language = key
+        try:
+            parts = self.templates[key]
+        except KeyError:
+            self.misses += 1
+            try:
+                text = self.loader(channel, source, event_id, language)
+            except Exception as e:
+                logging.error(f"Error loading message template for {source} {event_id}: {str(e)}")
+                text = None
+            parts = parse_template(text) if text is not None else None
+            self.templates[key] = parts
+            if len(self.templates) > self.max_size:
+                self.templates.popitem(last=False)
+                self.evictions += 1
+            return parts
+        self.hits += 1
+        self.templates.move_to_end(key)
+        return parts
+
+    def render(self, channel, source, event_id, inserts, language=0):
+        parts = self.get(channel, source, event_id, language)
+        if parts is None:
+            return None
+        return render_template(parts, inserts)
+
+    def message(self, channel, source, event_id, inserts, fallback=None, language=0):
+        return LazyMessage(self, channel, source, event_id, inserts, fallback, language)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.templates),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class LazyMessage:
+    """Message text rendered on first use; behaves like the string it renders to."""
+
+    __slots__ = ('_cache', '_key', '_inserts', '_fallback', '_text')
+
+    def __init__(self, cache, channel, source, event_id, inserts, fallback=None, language=0):
+        self._cache = cache
+        self._key = (channel, source, event_id, language)
+        self._inserts = inserts
+        self._fallback = fallback
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            channel, source, event_id, language = self._key
+            text = self._cache.render(channel, source, event_id, self._inserts, language)
+            if text is None:
+                text = self._fallback() if self._fallback else ' '.join(self._inserts or ())
+            self._text = text
+            self._cache = self._inserts = self._fallback = None
+        return self._text
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __len__(self):
+        return len(str(self))
+
+    @property
+    def rendered(self):
+        return self._text is not None
+
+
+def json_default(value):
+    # json.dump(..., default=messages.json_default) renders lazy messages on output
+    if isinstance(value, LazyMessage):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class RecordedMessageLoader:
+    """Templates from a JSON file, for rendering recorded inserts without Windows.
+
+    The file holds a list of {"channel", "source", "event_id", "language", "template"}.
+    """
+
+    def __init__(self, path=None, templates=None):
+        self.templates = {}
+        if path:
+            with open(path, 'r') as f:
+                templates = json.load(f)
+        for item in templates or []:
+            key = (item['channel'], item['source'], item['event_id'], item.get('language', 0))
+            self.templates[key] = item['template']
+
+    def __call__(self, channel, source, event_id, language):
+        return self.templates.get((channel, source, event_id, language))
+
+
+class WindowsMessageLoader:
+    """Reads raw format strings from the message DLLs registered for a source."""
+
+    def __init__(self):
+        import win32api
+        import win32con
+        import winreg
+        self._api = win32api
+        self._con = win32con
+        self._registry = winreg
+        self._modules = {}
+
+    def _message_files(self, channel, source):
+        key = rf"SYSTEM\CurrentControlSet\Services\EventLog\{channel}\{source}"
+        with self._registry.OpenKey(self._registry.HKEY_LOCAL_MACHINE, key) as handle:
+            value, _ = self._registry.QueryValueEx(handle, 'EventMessageFile')
+        return [os.path.expandvars(path) for path in value.split(';') if path]
+
+    def _module(self, path):
+        module = self._modules.get(path)
+        if module is None:
+            module = self._api.LoadLibraryEx(path, 0, self._con.LOAD_LIBRARY_AS_DATAFILE)
+            self._modules[path] = module
+        return module
+
+    def __call__(self, channel, source, event_id, language):
+        try:
+            paths = self._message_files(channel, source)
+        except OSError:
+            return None
+        flags = self._con.FORMAT_MESSAGE_FROM_HMODULE | self._con.FORMAT_MESSAGE_IGNORE_INSERTS
+        for path in paths:
+            try:
+                return self._api.FormatMessageW(flags, self._module(path), event_id, language, None)
+            except self._api.error:
+                continue
+        return None
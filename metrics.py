@@ -0,0 +1,351 @@
+import bisect
+import functools
+import inspect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import atomic
+
+# In-process pipeline metrics. Counters, gauges and fixed-bucket histograms
+# live in one registry and are rendered in the Prometheus text format, served
+# on a local port and optionally dumped to a JSON snapshot file. Recording is
+# a lock and an addition; hot per-event paths time only a sample of calls, and
+# per-event debug lines go through a Sampler so they stay off the fast path.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Seconds; spans a single rule evaluation up to a wevtutil export
+DEFAULT_BUCKETS = (0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0)
+BYTE_BUCKETS = (1024, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Sampler:
+    """True on every `every`-th call; a cheap gate for sampled timing and logging."""
+
+    def __init__(self, every):
+        self.every = max(1, int(every))
+        self.count = 0
+
+    def ready(self):
+        self.count += 1
+        return self.count % self.every == 0
+
+
+class _CounterChild:
+    __slots__ = ('lock', 'value')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def get(self):
+        return self.value
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ('function',)
+
+    def __init__(self):
+        super().__init__()
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """Read the value from `function()` at scrape time instead."""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return math.nan
+        return self.value
+
+
+class _HistogramChild:
+    __slots__ = ('lock', 'buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[position] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self, sample=1):
+        return Timer(self, sample)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.label_names:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **values):
+        """The child series for these label values, created on first use."""
+        key = tuple(str(values[name]) for name in self.label_names)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def samples(self):
+        for key, child in list(self.children.items()):
+            yield self.name, self._label_text(key), child.get()
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default.set(value)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self, sample=1):
+        return Timer(self._default, sample)
+
+    def samples(self):
+        for key, child in list(self.children.items()):
+            with child.lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket
+                le = '+Inf' if bound == math.inf else repr(float(bound))
+                yield f"{self.name}_bucket", self._label_text(key, [('le', le)]), cumulative
+            yield f"{self.name}_sum", self._label_text(key), total
+            yield f"{self.name}_count", self._label_text(key), count
+
+
+class Timer:
+    """Observe elapsed seconds into a histogram series.
+
+    Works as a context manager (`with STAGE_SECONDS.labels(stage='x').time():`)
+    or as a decorator for plain, async and generator functions; a generator is
+    timed while it runs, not while suspended at a yield. With `sample=N` only
+    every N-th call is timed.
+    """
+
+    def __init__(self, child, sample=1):
+        self.child = child
+        self.sampler = Sampler(sample) if sample > 1 else None
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter() if self.sampler is None or self.sampler.ready() else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.started is not None:
+            self.child.observe(time.perf_counter() - self.started)
+
+    def __call__(self, function):
+        child, sampler = self.child, self.sampler
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def timed_async(*args, **kwargs):
+                if sampler is not None and not sampler.ready():
+                    return await function(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    child.observe(time.perf_counter() - started)
+            return timed_async
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def timed_generator(*args, **kwargs):
+                if sampler is not None and not sampler.ready():
+                    return (yield from function(*args, **kwargs))
+                elapsed = 0.0
+                started = time.perf_counter()
+                try:
+                    for item in function(*args, **kwargs):
+                        elapsed += time.perf_counter() - started
+                        started = None
+                        yield item
+                        started = time.perf_counter()
+                finally:
+                    if started is not None:
+                        elapsed += time.perf_counter() - started
+                    child.observe(elapsed)
+            return timed_generator
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            if sampler is not None and not sampler.ready():
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return timed
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, cls, name, *args, **kwargs):
+        # Idempotent, so a module can declare its metrics at import time
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        return {
+            'time': time.time(),
+            'samples': [{'name': name, 'labels': labels, 'value': value}
+                        for metric in list(self.metrics.values()) for name, labels, value in metric.samples()],
+        }
+
+
+def _format_value(value):
+    if value != value:
+        return 'NaN'
+    if value in (math.inf, -math.inf):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labels=()):
+    return REGISTRY.register(Counter, name, documentation, labels)
+
+
+def gauge(name, documentation, labels=()):
+    return REGISTRY.register(Gauge, name, documentation, labels)
+
+
+def histogram(name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram, name, documentation, labels, buckets)
+
+
+def dump(path, registry=REGISTRY):
+    """Write a JSON snapshot of every series to `path`, atomically."""
+    with atomic.replacing(path, prefix='.metrics-') as f:
+        json.dump(registry.snapshot(), f, default=str)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host='127.0.0.1', registry=REGISTRY):
+    """Serve /metrics from a daemon thread; returns the server (port 0 picks a free one)."""
+    handler = type('MetricsHandler', (_Handler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+# Shared by every stage of the agent pipeline
+STAGE_SECONDS = histogram('evtx_stage_seconds', 'Wall time spent in each pipeline stage', ('stage',))
@@ -0,0 +1,192 @@
+import collections
+
+# Shared multi-pattern matching for the `contains`, `startswith` and
+# `endswith` modifiers. Every plain (wildcard-free) needle a rule set uses on
+# one field with one modifier goes into a single pattern set, so a field
+# value is scanned once per event and the scan reports every needle it holds;
+# each rule then only checks its own needle IDs against that result.
+#
+# Prefixes and suffixes are found by walking a forward or reversed trie from
+# the start or end of the value, which stops at the first character no needle
+# continues with. Substrings use an Aho-Corasick automaton once a set is large
+# enough for a single pass to beat one C-level `in` test per needle; below
+# that the loop over the unique needles is faster in CPython.
+
+CONTAINS = 'contains'
+STARTSWITH = 'startswith'
+ENDSWITH = 'endswith'
+POSITIONS = (CONTAINS, STARTSWITH, ENDSWITH)
+
+# Needle count from which the automaton outruns the `in` loop
+# (see benchmarks/bench_multimatch.py)
+AUTOMATON_MIN_NEEDLES = 160
+# Distinct field values remembered per pattern set
+CACHE_SIZE = 4096
+
+# Trie nodes are dicts keyed by single characters; the empty string, which
+# no character equals, holds the IDs of needles ending at that node
+TERMINAL = ''
+
+
+class Trie:
+    """Reports the needles that `text` starts with (or ends with, if `reverse`)."""
+
+    def __init__(self, needles, reverse=False):
+        self.reverse = reverse
+        self.root = {}
+        self.empty = frozenset()
+        for needle_id, needle in enumerate(needles):
+            node = self.root
+            for ch in (reversed(needle) if reverse else needle):
+                node = node.setdefault(ch, {})
+            node[TERMINAL] = node.get(TERMINAL, ()) + (needle_id,)
+        if TERMINAL in self.root:
+            # An empty needle matches every value
+            self.empty = frozenset(self.root.pop(TERMINAL))
+
+    def scan(self, text):
+        found = set(self.empty)
+        node = self.root
+        for ch in (reversed(text) if self.reverse else text):
+            node = node.get(ch)
+            if node is None:
+                break
+            ids = node.get(TERMINAL)
+            if ids:
+                found.update(ids)
+        return found
+
+
+class AhoCorasick:
+    """Reports every needle occurring anywhere in `text` in a single pass."""
+
+    def __init__(self, needles):
+        goto = [{}]
+        outputs = [set()]
+        for needle_id, needle in enumerate(needles):
+            state = 0
+            for ch in needle:
+                following = goto[state].get(ch)
+                if following is None:
+                    following = len(goto)
+                    goto[state][ch] = following
+                    goto.append({})
+                    outputs.append(set())
+                state = following
+            outputs[state].add(needle_id)
+
+        # Breadth-first failure links, folding each state's output into the
+        # states that fall back to it
+        fail = [0] * len(goto)
+        queue = collections.deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, following in goto[state].items():
+                queue.append(following)
+                fallback = fail[state]
+                while fallback and ch not in goto[fallback]:
+                    fallback = fail[fallback]
+                target = goto[fallback].get(ch, 0)
+                fail[following] = target if target != following else 0
+                outputs[following] |= outputs[fail[following]]
+
+        self.goto = goto
+        self.fail = fail
+        self.outputs = [tuple(ids) for ids in outputs]
+        self.empty = frozenset(self.outputs[0])
+
+    def scan(self, text):
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        found = set(self.empty)
+        state = 0
+        for ch in text:
+            following = goto[state].get(ch)
+            while following is None and state:
+                state = fail[state]
+                following = goto[state].get(ch)
+            state = following or 0
+            ids = outputs[state]
+            if ids:
+                found.update(ids)
+        return found
+
+
+class NeedleLoop:
+    """The `in` test per unique needle; faster than an automaton for small sets."""
+
+    def __init__(self, needles):
+        self.needles = list(enumerate(needles))
+
+    def scan(self, text):
+        return {needle_id for needle_id, needle in self.needles if needle in text}
+
+
+class PatternSet:
+    """Every needle used with one modifier on one field, matched case-insensitively."""
+
+    def __init__(self, position):
+        if position not in POSITIONS:
+            raise ValueError(f"Unsupported match position '{position}'")
+        self.position = position
+        self.needles = []
+        self.ids = {}
+        self.matcher = None
+        self.cache = {}
+
+    def add(self, needle):
+        """Register an unescaped needle; returns its ID within the set."""
+        needle = needle.lower()
+        needle_id = self.ids.get(needle)
+        if needle_id is None:
+            needle_id = self.ids[needle] = len(self.needles)
+            self.needles.append(needle)
+            self.matcher = None
+            self.cache.clear()
+        return needle_id
+
+    def build(self):
+        if self.position == STARTSWITH:
+            self.matcher = Trie(self.needles)
+        elif self.position == ENDSWITH:
+            self.matcher = Trie(self.needles, reverse=True)
+        elif len(self.needles) >= AUTOMATON_MIN_NEEDLES:
+            self.matcher = AhoCorasick(self.needles)
+        else:
+            self.matcher = NeedleLoop(self.needles)
+        return self.matcher
+
+    def scan(self, raw):
+        """IDs of the needles `raw` matches, as a frozenset."""
+        found = self.cache.get(raw)
+        if found is None:
+            matcher = self.matcher or self.build()
+            found = frozenset(matcher.scan(raw.lower()))
+            if len(self.cache) >= CACHE_SIZE:
+                self.cache.clear()
+            self.cache[raw] = found
+        return found
+
+
+class PatternTable:
+    """Pattern sets keyed by (field path, modifier), shared by a whole rule set."""
+
+    def __init__(self):
+        self.sets = {}
+
+    def get(self, path, position):
+        key = (path, position)
+        patterns = self.sets.get(key)
+        if patterns is None:
+            patterns = self.sets[key] = PatternSet(position)
+        return patterns
+
+    def build(self):
+        for patterns in self.sets.values():
+            patterns.build()
+
+    def stats(self):
+        return {
+            'sets': len(self.sets),
+            'needles': sum(len(p.needles) for p in self.sets.values()),
+            'automata': sum(1 for p in self.sets.values() if isinstance(p.matcher, AhoCorasick)),
+        }
@@ -0,0 +1,66 @@
+import calendar
+import sys
+import time
+
+# Compact in-memory event records. A collected event used to be a dict of six
+# string keys plus a formatted timestamp string; here it is a __slots__ object
+# with the time as integer seconds, SourceName and EventType interned so a
+# burst from one provider shares a single copy, and the message left lazy.
+# Records read like the old dicts (items(), [key]), so exporters and the
+# upload serializer take either.
+
+FIELDS = ('EventID', 'TimeGenerated', 'SourceName', 'EventType', 'EventCategory', 'Message')
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _intern(text):
+    return sys.intern(text) if type(text) is str else text
+
+
+def to_seconds(value):
+    """Integer seconds for a naive datetime, keeping its wall-clock reading."""
+    return calendar.timegm(value.timetuple())
+
+
+class EventRecord:
+    __slots__ = ('event_id', 'time', 'source', 'event_type', 'category', 'message')
+
+    def __init__(self, event_id, time_generated, source, event_type, category, message):
+        self.event_id = event_id
+        self.time = time_generated if isinstance(time_generated, int) else to_seconds(time_generated)
+        self.source = _intern(source)
+        self.event_type = _intern(event_type)
+        self.category = category
+        self.message = message
+
+    @property
+    def time_generated(self):
+        # Same text as str() of the whole-second datetime the Event Log API returns
+        return time.strftime(TIME_FORMAT, time.gmtime(self.time))
+
+    def values(self):
+        return (self.event_id, self.time_generated, self.source, self.event_type, self.category, self.message)
+
+    def items(self):
+        return zip(FIELDS, self.values())
+
+    def keys(self):
+        return FIELDS
+
+    def __getitem__(self, key):
+        try:
+            return self.values()[FIELDS.index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"EventRecord({self.event_id}, {self.time_generated!r}, {self.source!r})"
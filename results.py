@@ -0,0 +1,302 @@
+import copy
+import datetime
+import hashlib
+import json
+import logging
+import os
+import time
+
+import atomic
+import sigma
+
+# Detection results as compact records. A hit keeps its rule, level, time,
+# event identity and a few key fields; the full event stays in the archived
+# snapshot, referenced by file name and EventRecordID. Repeats of the same
+# (rule, host, key fields) within the suppression window are counted rather
+# than uploaded again, and email goes out as a periodic digest per rule
+# instead of once per cycle. Result files are read one hit at a time.
+
+CHUNK_SIZE = 64 * 1024
+SUPPRESSION_SECONDS = 3600
+DIGEST_SECONDS = 3600
+# A digest holding any of these levels is sent without waiting for the interval
+DIGEST_IMMEDIATE_LEVELS = ('critical',)
+DIGEST_SAMPLES = 5
+DIGEST_MAX_COMPUTERS = 20
+LEVELS = ('critical', 'high', 'medium', 'low', 'info')
+
+# EventData fields that identify "the same thing happening again"
+KEY_FIELDS = (
+    'TargetUserName', 'TargetDomainName', 'SubjectUserName', 'IpAddress', 'WorkstationName', 'LogonType',
+    'ServiceName', 'ServiceFileName', 'NewProcessName', 'ProcessName', 'ParentProcessName', 'ObjectName',
+    'ShareName', 'RelativeTargetName', 'TaskName', 'Status', 'FailureReason',
+)
+
+
+def iter_hits(path):
+    """Hits from a Chainsaw-style JSON array or an NDJSON file, without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(CHUNK_SIZE)
+        position = len(buffer) - len(buffer.lstrip())
+        if position == len(buffer):
+            return
+        if buffer[position] != '[':
+            f.seek(0)
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        position += 1
+        eof = False
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                if position == len(buffer):
+                    raise json.JSONDecodeError("Need more data", buffer, position)
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(CHUNK_SIZE)
+                eof = not more
+                buffer = buffer[position:] + more
+                position = 0
+                continue
+            yield item
+            position = end
+            if position > CHUNK_SIZE:
+                buffer = buffer[position:]
+                position = 0
+
+
+def _system(data):
+    return sigma.resolve(data, ('Event', 'System')) or {}
+
+
+def key_fields(data):
+    event_data = sigma.resolve(data, ('Event', 'EventData'))
+    if not isinstance(event_data, dict):
+        return {}
+    return {name: event_data[name] for name in KEY_FIELDS if event_data.get(name) not in (None, '', '-')}
+
+
+def snapshot_name(path):
+    # Snapshots are archived by file name; paths may come from Windows or POSIX hosts
+    return (path or '').replace('\\', '/').rsplit('/', 1)[-1]
+
+
+def compact(hit):
+    """The compact record for one Chainsaw-layout hit."""
+    document = hit.get('document') or {}
+    data = document.get('data') if isinstance(document.get('data'), dict) else {}
+    system = _system(data)
+    record_id = system.get('EventRecordID')
+    record = {
+        'rule': hit.get('id') or hit.get('name'),
+        'name': hit.get('name'),
+        'level': hit.get('level'),
+        'kind': hit.get('kind', 'individual'),
+        'timestamp': hit.get('timestamp'),
+        'computer': system.get('Computer'),
+        'event_id': sigma._as_int(sigma.resolve(data, ('Event', 'System', 'EventID'))),
+        'record': record_id,
+        'fields': key_fields(data),
+        'ref': {'path': snapshot_name(document.get('path')), 'record': record_id},
+        'tags': hit.get('tags') or [],
+    }
+    aggregate = hit.get('aggregate')
+    if aggregate:
+        # The group-by values are what makes two correlation hits "the same"
+        record['fields'] = aggregate.get('group_by') or {}
+        record['aggregate'] = {key: aggregate[key] for key in ('type', 'count', 'timespan', 'event_record_ids')
+                               if key in aggregate}
+    if hit.get('retroactive'):
+        record['retroactive'] = True
+    return record
+
+
+def suppression_key(record):
+    identity = json.dumps([record['rule'], record.get('computer'), record['fields']], sort_keys=True, default=str)
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+def event_time(record, default):
+    try:
+        text = record.get('timestamp') or ''
+        return datetime.datetime.fromisoformat(text.replace('Z', '+00:00')).timestamp()
+    except (TypeError, ValueError):
+        return default
+
+
+def _write_json(path, value):
+    with atomic.replacing(path, prefix='.results-') as f:
+        json.dump(value, f)
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        logging.error(f"Error reading results state {path}: {str(e)}")
+        return default
+
+
+class Suppressor:
+    """First hit per key and window passes; repeats are counted onto the next one that does."""
+
+    def __init__(self, path, window=SUPPRESSION_SECONDS):
+        self.path = path
+        self.window = window
+        # key -> [window start (event time), hits suppressed since]
+        self.entries = _read_json(path, {})
+
+    def admit(self, record, now):
+        key = suppression_key(record)
+        entry = self.entries.get(key)
+        if entry is not None and now - entry[0] < self.window:
+            entry[1] += 1
+            return False
+        if entry is not None and entry[1]:
+            record['suppressed'] = entry[1]
+        self.entries[key] = [now, 0]
+        return True
+
+    def save(self, now):
+        # Keys with no pending count are forgotten once their window is over
+        horizon = now - self.window
+        self.entries = {key: entry for key, entry in self.entries.items() if entry[1] or entry[0] > horizon}
+        _write_json(self.path, self.entries)
+
+
+class Digest:
+    """Per-rule summary of everything detected since the last email."""
+
+    def __init__(self, path, interval=DIGEST_SECONDS, immediate_levels=DIGEST_IMMEDIATE_LEVELS, samples=DIGEST_SAMPLES):
+        self.path = path
+        self.interval = interval
+        self.immediate_levels = set(immediate_levels)
+        self.samples = samples
+        self.state = _read_json(path, None) or self._empty()
+
+    @staticmethod
+    def _empty():
+        return {'opened': None, 'urgent': False, 'rules': {}}
+
+    def add(self, record, admitted, now):
+        rules = self.state['rules']
+        entry = rules.get(record['rule'])
+        if entry is None:
+            entry = rules[record['rule']] = {
+                'rule': record['rule'], 'name': record['name'], 'level': record['level'], 'count': 0,
+                'suppressed': 0, 'first': record['timestamp'], 'last': record['timestamp'],
+                'computers': [], 'samples': [],
+            }
+        entry['count'] += 1
+        if not admitted:
+            entry['suppressed'] += 1
+        timestamp = record['timestamp']
+        if timestamp:
+            entry['first'] = min(entry['first'] or timestamp, timestamp)
+            entry['last'] = max(entry['last'] or timestamp, timestamp)
+        computer = record.get('computer')
+        if computer and computer not in entry['computers'] and len(entry['computers']) < DIGEST_MAX_COMPUTERS:
+            entry['computers'].append(computer)
+        if admitted and len(entry['samples']) < self.samples:
+            entry['samples'].append(record)
+        if self.state['opened'] is None:
+            self.state['opened'] = now
+        if record['level'] in self.immediate_levels:
+            self.state['urgent'] = True
+
+    def due(self, now):
+        if not self.state['rules']:
+            return False
+        return self.state['urgent'] or now - self.state['opened'] >= self.interval
+
+    def summary(self):
+        """Digest entries, most severe and most frequent first."""
+        rank = {level: position for position, level in enumerate(LEVELS)}
+        return sorted(self.state['rules'].values(), key=lambda e: (rank.get(e['level'], len(LEVELS)), -e['count']))
+
+    def reset(self):
+        self.state = self._empty()
+        self.save()
+
+    def save(self):
+        _write_json(self.path, self.state)
+
+
+class ResultStore:
+    """Compacts, suppresses and journals hits, and keeps the pending digest.
+
+    `process()` returns the records to upload; everything it sees, suppressed
+    or not, is counted in the digest. Nothing is persisted until `commit()`,
+    once the records are spooled or sent; `rollback()` forgets the pass
+    instead. Committed records are also appended to a daily NDJSON journal
+    under `folder`.
+    """
+
+    def __init__(self, folder, suppression=SUPPRESSION_SECONDS, digest_interval=DIGEST_SECONDS):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.suppressor = Suppressor(os.path.join(folder, 'suppression.json'), suppression)
+        self.digest = Digest(os.path.join(folder, 'digest.json'), digest_interval)
+        self.stats = {'hits': 0, 'admitted': 0, 'suppressed': 0}
+        self._pending = None
+
+    def process(self, hits):
+        """Records to upload from `hits`; if reading them fails, the pass is rolled back and the error raised."""
+        if self._pending is not None:
+            self.rollback()
+        wall = time.time()
+        self._pending = {'saved': copy.deepcopy((self.suppressor.entries, self.digest.state, self.stats)),
+                         'admitted': [], 'latest': None, 'wall': wall}
+        admitted = self._pending['admitted']
+        latest = None
+        try:
+            for hit in hits:
+                record = compact(hit)
+                now = event_time(record, wall)
+                latest = now if latest is None else max(latest, now)
+                passed = self.suppressor.admit(record, now)
+                self.digest.add(record, passed, wall)
+                self.stats['hits'] += 1
+                if passed:
+                    admitted.append(record)
+                else:
+                    self.stats['suppressed'] += 1
+        except Exception:
+            self.rollback()
+            raise
+        self.stats['admitted'] += len(admitted)
+        self._pending['latest'] = latest
+        return admitted
+
+    def commit(self):
+        """Persist the last pass: journal its records and save suppression and digest state."""
+        pending, self._pending = self._pending, None
+        if pending is None or pending['latest'] is None:
+            return
+        if pending['admitted']:
+            self._journal(pending['admitted'], pending['wall'])
+        self.suppressor.save(pending['latest'])
+        self.digest.save()
+
+    def rollback(self):
+        """Forget the last pass, as if its hits had never been seen."""
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            self.suppressor.entries, self.digest.state, self.stats = pending['saved']
+
+    def _journal(self, records, now):
+        day = datetime.datetime.fromtimestamp(now).strftime('%Y%m%d')
+        with open(os.path.join(self.folder, f"detections_{day}.ndjson"), 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':'), default=str) + '\n')
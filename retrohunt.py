@@ -0,0 +1,334 @@
+import bisect
+import collections
+import concurrent.futures
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import archive
+import atomic
+import evtx_parser
+import hunt
+import rulepack
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Retro-hunting archived history when the rule set changes. A manifest records
+# which (rule hash, input hash) pairs have been evaluated, where an input is
+# an archived or loose .evtx chunk (keyed by its SHA-256, so a chunk shared by
+# many snapshots counts once) or a JSON export. Each run hunts only the pairs
+# still missing, on a process pool, which after a rule edit means the changed
+# rules over the whole history and nothing else.
+#
+# Inputs that appear in the agent's own archive and exports between
+# runs were hunted live by the rules deployed at the time, so they are
+# recorded as covered by those rules instead of being re-hunted. The first run
+# only records that baseline, unless `full` is set. Extra inputs given on the
+# command line were never hunted live and are always hunted.
+# Correlation rules, and the base rules only they report on, are not
+# retro-hunted: their windows need the full event stream in order.
+
+INPUTS_PER_SHARD = 64
+CHECKPOINT_SECONDS = 30
+
+_pack = None
+_store = None
+_engines = {}
+
+
+# -- evaluated pairs --------------------------------------------------------
+
+def add_runs(runs, indices):
+    """Merge sorted `indices` into a list of [start, end) runs."""
+    added = []
+    for index in sorted(set(indices)):
+        if added and added[-1][1] == index:
+            added[-1][1] += 1
+        else:
+            added.append([index, index + 1])
+    merged = []
+    for start, end in sorted(runs + added):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def covered(runs, index):
+    position = bisect.bisect_right(runs, [index, float('inf')]) - 1
+    return position >= 0 and runs[position][0] <= index < runs[position][1]
+
+
+class Manifest:
+    """Evaluated (rule, input) pairs, stored as index runs per rule hash."""
+
+    def __init__(self, path):
+        self.path = path
+        state = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    state = json.load(f)
+            except Exception as e:
+                logging.error(f"Error reading retro-hunt manifest {path}: {str(e)}")
+        # Rule hashes of the last run's rule set; None before the first run
+        self.deployed = set(state['deployed']) if state.get('deployed') is not None else None
+        self.inputs = state.get('inputs', [])
+        self.index = {digest: i for i, digest in enumerate(self.inputs)}
+        self.done = state.get('done', {})
+        # Chunk hashes of loose .evtx files, keyed by path and checked by size/mtime
+        self.files = state.get('files', {})
+
+    def input_index(self, digest):
+        """Index of an input hash; returns (index, whether it is new)."""
+        index = self.index.get(digest)
+        if index is not None:
+            return index, False
+        index = self.index[digest] = len(self.inputs)
+        self.inputs.append(digest)
+        return index, True
+
+    def mark(self, rule_hash, indices):
+        self.done[rule_hash] = add_runs(self.done.get(rule_hash, []), indices)
+
+    def save(self):
+        state = {'deployed': sorted(self.deployed) if self.deployed is not None else None,
+                 'inputs': self.inputs, 'done': self.done, 'files': self.files}
+        with atomic.replacing(self.path, prefix='.retrohunt-') as f:
+            json.dump(state, f, separators=(',', ':'))
+
+
+# -- inputs -----------------------------------------------------------------
+
+def _evtx_chunks(manifest, path):
+    # [(chunk index, sha256)] of a loose export, hashed once per size/mtime
+    stat = os.stat(path)
+    cached = manifest.files.get(path)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    with evtx_parser.EvtxFile(path) as evtx:
+        chunks = [[index, hashlib.sha256(chunk).hexdigest()] for index, chunk in evtx.chunks()]
+    manifest.files[path] = [stat.st_size, stat.st_mtime_ns, chunks]
+    return chunks
+
+
+def collect_inputs(manifest, store_root=None, evtx_dir=None, extra=(), exports=()):
+    """Every input present now as {index: locator}, plus two index sets: live and new.
+
+    Live inputs come from `store_root`, `evtx_dir` and the `exports` globs of
+    JSON exports, which the agent hunted as it collected them; inputs found
+    only in `extra` are never live. New
+    ones are live inputs seen for the first time.
+    """
+    present = {}
+    live = set()
+    new = set()
+
+    def add(digest, locator, is_live=True):
+        index, is_new = manifest.input_index(digest)
+        if index not in present:
+            present[index] = locator
+        if is_live:
+            live.add(index)
+            if is_new:
+                new.add(index)
+
+    if store_root and os.path.isdir(store_root):
+        store = archive.SnapshotStore(store_root)
+        for name in store.names():
+            for slot in store.manifest(name)['chunks']:
+                if slot:
+                    add(slot[0], ('chunk', slot[0], name))
+    paths = sorted(glob.glob(os.path.join(evtx_dir, '*.evtx'))) if evtx_dir and os.path.isdir(evtx_dir) else []
+    paths += sorted(path for pattern in exports for path in glob.glob(pattern))
+    paths = [(path, True) for path in paths]
+    paths += [(path, False) for path in hunt.find_inputs(extra)] if extra else []
+    for path, is_live in paths:
+        try:
+            if path.lower().endswith(hunt.EVTX_SUFFIXES):
+                for index, digest in _evtx_chunks(manifest, path):
+                    add(digest, ('evtx', path, index), is_live)
+            else:
+                digest = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(block)
+                add(digest.hexdigest(), ('json', path), is_live)
+        except (OSError, evtx_parser.EvtxFormatError) as e:
+            logging.error(f"Error reading {path} for retro-hunt: {str(e)}")
+    return present, live, new
+
+
+def eligible_rules(pack):
+    """{pack position: rule hash} of every rule a retro-hunt can evaluate."""
+    silent = {ref for _, rule in pack.correlations if not (rule['correlation'].get('generate'))
+              for ref in (rule['correlation'].get('rules') or [])}
+    eligible = {}
+    for position, ((_, rule), rule_hash) in enumerate(zip(pack.rules, pack.rule_hashes())):
+        if pack.trees[position] is None or rule.get('title') in pack.mapping['exclusions']:
+            continue
+        if rule.get('id') in silent or rule.get('name') in silent:
+            continue
+        eligible[position] = rule_hash
+    return eligible
+
+
+def plan(manifest, eligible, present, live, new, full=False):
+    """Work as [(rule positions, [(index, locator), ...])], after recording covered pairs."""
+    current = set(eligible.values())
+    if manifest.deployed is None and not full:
+        # First run: the deployed rules already saw the live history
+        for rule_hash in current:
+            manifest.mark(rule_hash, live)
+    elif new and manifest.deployed is not None:
+        for rule_hash in current & manifest.deployed:
+            manifest.mark(rule_hash, new)
+    manifest.deployed = current
+
+    missing = collections.defaultdict(list)
+    total = len(manifest.inputs)
+    ordered = sorted(present)
+    for position, rule_hash in eligible.items():
+        runs = manifest.done.get(rule_hash, [])
+        if runs == [[0, total]]:
+            continue
+        for index in ordered:
+            if not covered(runs, index):
+                missing[index].append(position)
+    groups = collections.defaultdict(list)
+    for index, positions in missing.items():
+        groups[tuple(sorted(positions))].append((index, present[index]))
+    work = []
+    for positions, items in groups.items():
+        for start in range(0, len(items), INPUTS_PER_SHARD):
+            work.append((positions, items[start:start + INPUTS_PER_SHARD]))
+    return work
+
+
+# -- workers ----------------------------------------------------------------
+
+def _init_worker(pack_path, store_root, max_memory):
+    global _pack, _store
+    logging.getLogger().setLevel(logging.WARNING)
+    threading.Thread(target=hunt.watch_parent, args=(os.getppid(),), daemon=True).start()
+    if max_memory and resource is not None:
+        limit = max_memory * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    _pack = rulepack.RulePack.open(pack_path)
+    _store = archive.SnapshotStore(store_root) if store_root else None
+
+
+def _documents(locator):
+    kind = locator[0]
+    if kind == 'chunk':
+        return [evtx_parser.parse_chunk(_store.get_chunk(locator[1]))], f"{locator[2]}.evtx"
+    if kind == 'evtx':
+        return hunt.read_evtx_range(locator[1], locator[2], locator[2] + 1), locator[1]
+    return hunt.read_json_documents(locator[1]), locator[1]
+
+
+def hunt_inputs(positions, items):
+    """Hunt the rules at `positions` over `items`; returns (indices done, events, hits)."""
+    engine = _engines.get(positions)
+    if engine is None:
+        engine = _engines[positions] = _pack.engine(only=positions)
+    events = 0
+    hits = []
+    for _, locator in items:
+        batches, path = _documents(locator)
+        for documents in batches:
+            events += len(documents)
+            hits.extend(engine.hunt(documents, path))
+    for hit in hits:
+        hit['retroactive'] = True
+    return [index for index, _ in items], events, hits
+
+
+# -- runs -------------------------------------------------------------------
+
+def run(pack, pack_path, manifest_path, store_root=None, evtx_dir=None, extra=(), workers=None, full=False,
+        max_memory=None, exports=()):
+    """Retro-hunt every missing (rule, input) pair; returns (hits sorted by time, summary)."""
+    started = time.monotonic()
+    manifest = Manifest(manifest_path)
+    present, live, new = collect_inputs(manifest, store_root, evtx_dir, extra, exports)
+    eligible = eligible_rules(pack)
+    first_run = manifest.deployed is None
+    work = plan(manifest, eligible, present, live, new, full)
+    manifest.save()
+    rules = sorted({p for positions, _ in work for p in positions})
+    logging.info(f"Retro-hunt: {len(present)} inputs ({len(new)} new), {len(rules)} rules to evaluate "
+                 f"in {len(work)} shards" + (" (baseline recorded)" if first_run and not full else ""))
+
+    hits = []
+    events = failed = 0
+    if work:
+        hashes = pack.rule_hashes()
+        saved = time.monotonic()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                    initargs=(pack_path, store_root, max_memory)) as pool:
+            futures = {pool.submit(hunt_inputs, positions, items): positions for positions, items in work}
+            for future in concurrent.futures.as_completed(futures):
+                positions = futures[future]
+                try:
+                    indices, shard_events, shard_hits = future.result()
+                except Exception as e:
+                    # Left unmarked, so the next run tries these pairs again
+                    failed += 1
+                    logging.error(f"Error in retro-hunt shard: {type(e).__name__}: {str(e)}")
+                    continue
+                for position in positions:
+                    manifest.mark(hashes[position], indices)
+                events += shard_events
+                hits.extend(shard_hits)
+                if time.monotonic() - saved >= CHECKPOINT_SECONDS:
+                    manifest.save()
+                    saved = time.monotonic()
+        manifest.save()
+    hits.sort(key=hunt.hit_key)
+    summary = {'inputs': len(present), 'new_inputs': len(new), 'rules': len(rules), 'shards': len(work),
+               'failed': failed, 'events': events, 'hits': len(hits),
+               'seconds': round(time.monotonic() - started, 3)}
+    logging.info(f"Retro-hunt finished: {summary}")
+    return hits, summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Hunt new or changed Sigma rules over archived history")
+    parser.add_argument("inputs", nargs="*", help="Extra .evtx/JSON files, directories or globs")
+    parser.add_argument("--store", default=os.path.join("evtx", "store"), help="Snapshot archive directory")
+    parser.add_argument("--evtx-dir", default="evtx", help="Directory of loose .evtx exports")
+    parser.add_argument("--exports", action="append", help="Glob of the agent's JSON exports (repeatable; "
+                        "default security_logs_*.json and json/*.json)")
+    parser.add_argument("--manifest", default="retrohunt.json", help="Evaluated-pairs manifest")
+    parser.add_argument("--rules", default="needed", help="Sigma rule directory")
+    parser.add_argument("--mapping", default=os.path.join("mappings", "sigma-event-logs-all.yml"))
+    parser.add_argument("--correlations", default="correlations", help="Correlation rule directory")
+    parser.add_argument("--pack", default="rulepack.bin", help="Rule pack cache")
+    parser.add_argument("-o", "--output", help="Write findings here (Chainsaw JSON)")
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    parser.add_argument("--full", action="store_true", help="On the first run, hunt all history instead of recording a baseline")
+    parser.add_argument("--max-worker-mb", type=int, default=2048, help="Address-space cap per worker process (0 for none)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    pack = rulepack.load(args.rules, args.mapping, args.correlations, args.pack)
+    hits, summary = run(pack, args.pack, args.manifest, args.store, args.evtx_dir, args.inputs, args.workers,
+                        args.full, args.max_worker_mb or None,
+                        args.exports or ["security_logs_*.json", os.path.join("json", "*.json")])
+    output = args.output or f"retrohunt_results_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    if hits:
+        with open(output, 'w') as f:
+            json.dump(hits, f)
+        print(f"Wrote {len(hits)} retroactive findings to {output}")
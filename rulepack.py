@@ -0,0 +1,230 @@
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import marshal
+import mmap
+import os
+import struct
+import sys
+import time
+
+import atomic
+import correlation
+import sigma
+
+# Compiled rule pack. Parsing ~150 YAML rules dominates agent start-up, so the
+# rule directory, correlation rules and mapping file are parsed once into a
+# versioned binary artifact of pre-parsed rule documents and condition trees
+# with interned strings. The EventID index is not stored: SigmaEngine builds it
+# from the compiled rules in the same pass that compiles their predicates (and
+# their regexes), which a load has to do anyway. The artifact is keyed by a
+# SHA-256 over every input file and is rebuilt automatically when any of them
+# changes; loading it is an mmap plus a few marshal.loads calls.
+
+MAGIC = b'EVTXRPK\x00'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<8sI32sI')
+SECTION = struct.Struct('<16sQQ')
+SECTIONS = ('meta', 'mapping', 'rules', 'trees', 'correlations')
+
+
+def input_files(rules_path, mapping_path, correlations_path=None):
+    paths = [mapping_path]
+    for folder in (rules_path, correlations_path):
+        if folder and os.path.isdir(folder):
+            paths.extend(sorted(glob.glob(os.path.join(folder, '**', '*.yml'), recursive=True)))
+    return paths
+
+
+def input_key(rules_path, mapping_path, correlations_path=None):
+    """SHA-256 over the format version and every input file's name and content."""
+    digest = hashlib.sha256(f"rulepack-v{FORMAT_VERSION}".encode('ascii'))
+    for path in input_files(rules_path, mapping_path, correlations_path):
+        with open(path, 'rb') as f:
+            content = f.read()
+        name = os.path.relpath(path, os.path.dirname(os.path.abspath(rules_path)))
+        digest.update(name.replace(os.sep, '/').encode('utf-8') + b'\x00')
+        digest.update(hashlib.sha256(content).digest())
+    return digest.digest()
+
+
+def _portable(value):
+    # Marshal-safe copy with every string interned, so repeated field names,
+    # modifiers and values are written once and come back as shared objects
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        return {_portable(k): _portable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [_portable(v) for v in value]
+        return tuple(items) if isinstance(value, tuple) else items
+    if isinstance(value, (set, frozenset)):
+        return type(value)(_portable(v) for v in value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return sys.intern(value.isoformat())
+    return value
+
+
+def _canonical(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+class RulePack:
+    """Parsed rule set ready to compile into a SigmaEngine without touching YAML."""
+
+    def __init__(self, key, mapping, rules, trees, correlations, meta=None):
+        self.key = key
+        self.mapping = mapping
+        self.rules = rules
+        self.trees = trees
+        self.correlations = correlations
+        self.meta = meta or {}
+
+    @classmethod
+    def build(cls, rules_path, mapping_path, correlations_path=None):
+        key = input_key(rules_path, mapping_path, correlations_path)
+        mapping = sigma.load_mapping(mapping_path)
+        rules = sigma.load_rules(rules_path)
+        correlations = []
+        if correlations_path and os.path.isdir(correlations_path):
+            base_rules, correlations = correlation.load_documents(correlations_path)
+            rules += base_rules
+        base = os.path.dirname(os.path.abspath(rules_path))
+        rules = [(os.path.relpath(path, base), rule) for path, rule in rules]
+        correlations = [(os.path.relpath(path, base), rule) for path, rule in correlations]
+
+        trees = []
+        for path, rule in rules:
+            try:
+                sigma.SigmaRule(rule, mapping, path)
+                trees.append(sigma.rule_condition(rule['detection']['condition']))
+            except Exception as e:
+                # Left unparsed; compiling it at load time reports the error again
+                logging.error(f"Error compiling Sigma rule {path}: {str(e)}")
+                trees.append(None)
+        meta = {
+            'format': FORMAT_VERSION,
+            'built': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'rules': len(rules),
+            'correlations': len(correlations),
+            'inputs': len(input_files(rules_path, mapping_path, correlations_path)),
+        }
+        return cls(key, mapping, rules, trees, correlations, meta)
+
+    def save(self, path):
+        sections = [marshal.dumps(_portable(value), 4) for value in (
+            self.meta, self.mapping, self.rules, self.trees, self.correlations)]
+        table = bytearray()
+        offset = HEADER.size + SECTION.size * len(sections)
+        for name, data in zip(SECTIONS, sections):
+            table += SECTION.pack(name.encode('ascii'), offset, len(data))
+            offset += len(data)
+        with atomic.replacing(path, 'wb', prefix='.rulepack-') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, self.key, len(sections)))
+            f.write(table)
+            for data in sections:
+                f.write(data)
+
+    @staticmethod
+    def read_key(path):
+        """The input key recorded in an artifact, or None if it is missing or foreign."""
+        try:
+            with open(path, 'rb') as f:
+                magic, version, key, _ = HEADER.unpack(f.read(HEADER.size))
+        except (OSError, struct.error):
+            return None
+        if magic != MAGIC or version != FORMAT_VERSION:
+            return None
+        return key
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            magic, version, key, count = HEADER.unpack_from(view, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} rule pack")
+            values = {}
+            for i in range(count):
+                name, offset, length = SECTION.unpack_from(view, HEADER.size + i * SECTION.size)
+                values[name.rstrip(b'\x00').decode('ascii')] = marshal.loads(view[offset:offset + length])
+        rules = [tuple(item) for item in values['rules']]
+        correlations = [tuple(item) for item in values['correlations']]
+        return cls(key, values['mapping'], rules, values['trees'], correlations, values['meta'])
+
+    def rule_hashes(self):
+        """SHA-256 per rule, over the rule document and the mapping it compiles against."""
+        mapping = json.dumps(self.mapping, sort_keys=True, default=_canonical)
+        return [hashlib.sha256((mapping + json.dumps(rule, sort_keys=True, default=_canonical)).encode('utf-8')).hexdigest()
+                for _, rule in self.rules]
+
+    def engine(self, max_groups=50000, only=None):
+        """Compile a SigmaEngine (with its correlator, if the pack has correlations).
+
+        `only` restricts the engine to the rules at those pack positions, without
+        correlations.
+        """
+        if only is not None:
+            positions = sorted(only)
+            return sigma.SigmaEngine.from_documents([self.rules[p] for p in positions], self.mapping,
+                                                    [self.trees[p] for p in positions])
+        engine = sigma.SigmaEngine.from_documents(self.rules, self.mapping, self.trees)
+        if self.correlations:
+            engine.correlator = correlation.Correlator.from_documents(self.correlations, self.mapping, max_groups)
+        return engine
+
+
+def load(rules_path, mapping_path, correlations_path=None, cache_path=None):
+    """The rule pack for these inputs, from `cache_path` when it is current, else rebuilt."""
+    started = time.perf_counter()
+    key = input_key(rules_path, mapping_path, correlations_path)
+    if cache_path and RulePack.read_key(cache_path) == key:
+        try:
+            pack = RulePack.open(cache_path)
+            logging.info(f"Loaded rule pack {cache_path} in {(time.perf_counter() - started) * 1000:.1f} ms")
+            return pack
+        except Exception as e:
+            logging.error(f"Error reading rule pack {cache_path}: {str(e)}")
+    pack = RulePack.build(rules_path, mapping_path, correlations_path)
+    if cache_path:
+        try:
+            pack.save(cache_path)
+        except Exception as e:
+            logging.error(f"Error writing rule pack {cache_path}: {str(e)}")
+    logging.info(f"Built rule pack from {pack.meta['inputs']} files in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return pack
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or inspect the compiled Sigma rule pack")
+    parser.add_argument("command", choices=["build", "info", "bench"])
+    parser.add_argument("--rules", default="needed", help="Sigma rule directory")
+    parser.add_argument("--mapping", default=os.path.join("mappings", "sigma-event-logs-all.yml"))
+    parser.add_argument("--correlations", default="correlations", help="Correlation rule directory")
+    parser.add_argument("--output", default="rulepack.bin", help="Artifact path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.command == "build":
+        pack = RulePack.build(args.rules, args.mapping, args.correlations)
+        pack.save(args.output)
+        print(f"Wrote {args.output} ({os.path.getsize(args.output)} bytes, key {pack.key.hex()[:16]})")
+    elif args.command == "info":
+        pack = RulePack.open(args.output)
+        current = input_key(args.rules, args.mapping, args.correlations) == pack.key
+        print(json.dumps(dict(pack.meta, key=pack.key.hex(), current=current), indent=2))
+    else:
+        logging.getLogger().setLevel(logging.WARNING)
+        start = time.perf_counter()
+        sigma.SigmaEngine.from_paths(args.rules, args.mapping, correlation.load_documents(args.correlations)[0])
+        cold = time.perf_counter() - start
+        load(args.rules, args.mapping, args.correlations, args.output)
+        start = time.perf_counter()
+        load(args.rules, args.mapping, args.correlations, args.output).engine()
+        warm = time.perf_counter() - start
+        print(f"from YAML: {cold * 1000:.1f} ms   from rule pack: {warm * 1000:.1f} ms   x{cold / warm:.1f}")
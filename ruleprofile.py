@@ -0,0 +1,292 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import evtx_parser
+import hunt
+import multimatch
+import rulepack
+import sigma
+
+# Per-rule cost and selectivity of the Sigma pack over a recorded corpus.
+# Every event is matched twice: once against the rules as the engine runs
+# them, timed per rule, and once against a copy whose selections are wrapped
+# with counters, which shows how often each selection is evaluated, how often
+# it holds and which one decides the outcome. Rules that cannot fire at all
+# (excluded by the mapping, failing to compile, or ruled out by a logsource
+# precondition) are reported apart from the ranking.
+
+DEFAULT_INPUTS = ['output', 'security_logs_*.json']
+SORT_KEYS = {
+    'cost': lambda profile: profile.seconds,
+    'matches': lambda profile: profile.matched,
+    'per-event': lambda profile: profile.seconds / profile.examined if profile.examined else 0.0,
+    'examined': lambda profile: profile.examined,
+}
+
+
+class SelectionStats:
+    __slots__ = ('evaluated', 'held', 'seconds', 'decided_true', 'decided_false')
+
+    def __init__(self):
+        self.evaluated = 0
+        self.held = 0
+        self.seconds = 0.0
+        # Evaluations where this selection was the last one the condition needed
+        self.decided_true = 0
+        self.decided_false = 0
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class RuleProfile:
+    """Counters for one rule, plus an instrumented copy of its condition."""
+
+    def __init__(self, rule, body, tree, mapping, patterns):
+        self.rule = rule
+        self.body = body
+        self.examined = 0
+        self.matched = 0
+        self.seconds = 0.0
+        self.rejected_by_precondition = 0
+        self.selections = {}
+        self.last = None
+        self.modifiers = rule_modifiers(body)
+        detection = dict(body['detection'])
+        detection.pop('condition')
+        detection.pop('timeframe', None)
+        wrapped = {name: self._wrap(name, sigma.compile_selection(mapping, selection, patterns))
+                   for name, selection in detection.items()}
+        self.matcher = sigma.compile_condition(tree, wrapped)
+
+    def _wrap(self, name, selection):
+        stats = self.selections[name] = SelectionStats()
+
+        def profiled(document):
+            started = time.perf_counter()
+            held = selection(document)
+            stats.seconds += time.perf_counter() - started
+            stats.evaluated += 1
+            if held:
+                stats.held += 1
+            self.last = stats
+            return held
+        return profiled
+
+    def observe(self, document):
+        self.examined += 1
+        started = time.perf_counter()
+        matched = self.rule.matches(document)
+        self.seconds += time.perf_counter() - started
+        if matched:
+            self.matched += 1
+
+        for precondition in self.rule.preconditions:
+            if not precondition(document):
+                self.rejected_by_precondition += 1
+                return
+        self.last = None
+        if self.matcher(document):
+            decided = 'decided_true'
+        else:
+            decided = 'decided_false'
+        if self.last is not None:
+            setattr(self.last, decided, getattr(self.last, decided) + 1)
+
+    def short_circuit(self):
+        """The selection that most often settles a non-match, with its share of evaluations."""
+        if not self.examined or not self.selections:
+            return None
+        name, stats = max(self.selections.items(), key=lambda item: item[1].decided_false)
+        if not stats.decided_false:
+            return None
+        return name, stats.decided_false / self.examined
+
+    def to_dict(self):
+        return {
+            'title': self.rule.title,
+            'path': self.rule.path,
+            'level': self.rule.level,
+            'event_ids': sorted(self.rule.event_ids) if self.rule.event_ids is not None else None,
+            'modifiers': sorted(self.modifiers),
+            'examined': self.examined,
+            'matched': self.matched,
+            'seconds': self.seconds,
+            'rejected_by_precondition': self.rejected_by_precondition,
+            'selections': {name: stats.to_dict() for name, stats in self.selections.items()},
+        }
+
+
+def rule_modifiers(body):
+    # Field modifiers used anywhere in the detection, e.g. {'re', 'contains', 'all'}
+    found = set()
+
+    def walk(selection):
+        if isinstance(selection, list):
+            for item in selection:
+                walk(item)
+        elif isinstance(selection, dict):
+            for key in selection:
+                found.update(str(key).split('|')[1:])
+    for name, selection in body['detection'].items():
+        if name not in ('condition', 'timeframe'):
+            walk(selection)
+    return found
+
+
+def required_providers(mapping, body):
+    # Providers an applicable precondition insists on, or None when any will do
+    providers = None
+    for precondition in mapping['preconditions']:
+        if not sigma.precondition_applies(precondition, body):
+            continue
+        spec = precondition['filter']
+        branches = spec if isinstance(spec, list) else [spec]
+        if not all('Provider' in branch for branch in branches):
+            continue
+        allowed = set()
+        for branch in branches:
+            values = branch['Provider']
+            allowed.update(str(v).lower() for v in (values if isinstance(values, list) else [values]))
+        providers = allowed if providers is None else providers & allowed
+    return providers
+
+
+def read_corpus(paths):
+    for path in paths:
+        try:
+            if path.lower().endswith(hunt.EVTX_SUFFIXES):
+                yield from evtx_parser.iter_records(path)
+            else:
+                for batch in hunt.read_json_documents(path):
+                    yield from batch
+        except Exception as e:
+            logging.error(f"Error reading {path}: {str(e)}")
+
+
+def profile(pack, documents):
+    """Replay `documents` against `pack`; returns (ranked profiles, unreachable rules, corpus summary)."""
+    mapping = pack.mapping
+    unreachable = []
+    compiled = []
+    for position, (path, body) in enumerate(pack.rules):
+        title = body.get('title', '')
+        if title in mapping['exclusions']:
+            unreachable.append({'title': title, 'path': path, 'reason': "excluded by the mapping file"})
+            continue
+        if pack.trees[position] is None:
+            unreachable.append({'title': title, 'path': path, 'reason': "does not compile"})
+            continue
+        compiled.append((path, body, pack.trees[position]))
+
+    engine_patterns = multimatch.PatternTable()
+    profile_patterns = multimatch.PatternTable()
+    profiles = {}
+    rules = []
+    for path, body, tree in compiled:
+        rule = sigma.SigmaRule(body, mapping, path, tree, engine_patterns)
+        if rule.event_ids is not None and not rule.event_ids:
+            unreachable.append({'title': rule.title, 'path': path,
+                                'reason': "detection EventIDs and logsource precondition EventIDs do not overlap"})
+            continue
+        rules.append(rule)
+        profiles[rule] = RuleProfile(rule, body, tree, mapping, profile_patterns)
+    engine_patterns.build()
+    profile_patterns.build()
+    engine = sigma.SigmaEngine(rules, mapping, engine_patterns)
+
+    events = 0
+    providers = {}
+    event_ids = {}
+    started = time.perf_counter()
+    for document in documents:
+        events += 1
+        provider = str(sigma.resolve(document, ('Event', 'System', 'Provider')) or '').lower()
+        providers[provider] = providers.get(provider, 0) + 1
+        event_id = sigma._as_int(sigma.resolve(document, ('Event', 'System', 'EventID')))
+        event_ids[event_id] = event_ids.get(event_id, 0) + 1
+        for rule in engine.candidates(document):
+            profiles[rule].observe(document)
+    elapsed = time.perf_counter() - started
+
+    ranked = []
+    for rule, result in profiles.items():
+        needed = required_providers(mapping, result.body)
+        if needed is not None and events and not needed & set(providers):
+            unreachable.append({'title': rule.title, 'path': rule.path,
+                                'reason': f"precondition requires Provider {', '.join(sorted(needed))}, absent from the corpus"})
+            continue
+        ranked.append(result)
+    corpus = {'events': events, 'seconds': elapsed, 'providers': providers,
+              'event_ids': {str(k): v for k, v in sorted(event_ids.items(), key=lambda item: -item[1])}}
+    return ranked, unreachable, corpus
+
+
+def _short(text, width):
+    return text if len(text) <= width else text[:width - 1] + '…'
+
+
+def render(ranked, unreachable, corpus, top=None, detail=False):
+    total = sum(profile.seconds for profile in ranked) or 1e-12
+    lines = [f"{corpus['events']} events replayed against {len(ranked)} rules in {corpus['seconds']:.2f}s",
+             '',
+             f"{'#':>3} {'rule':<48} {'examined':>9} {'matched':>8} {'match%':>7} {'total ms':>9} {'us/ev':>7} "
+             f"{'share':>6}  short-circuit"]
+    for rank, profile in enumerate(ranked[:top] if top else ranked, 1):
+        rate = profile.matched / profile.examined if profile.examined else 0.0
+        per_event = profile.seconds / profile.examined * 1e6 if profile.examined else 0.0
+        shortcut = profile.short_circuit()
+        shortcut = f"{shortcut[0]} ({shortcut[1]:.0%})" if shortcut else '-'
+        flags = ''.join(f" [{m}]" for m in ('re', 'all', 'base64offset') if m in profile.modifiers)
+        lines.append(f"{rank:>3} {_short(profile.rule.title + flags, 48):<48} {profile.examined:>9} {profile.matched:>8} "
+                     f"{rate:>7.1%} {profile.seconds * 1000:>9.2f} {per_event:>7.1f} {profile.seconds / total:>6.1%}  {shortcut}")
+        if detail:
+            for name, stats in profile.selections.items():
+                held = stats.held / stats.evaluated if stats.evaluated else 0.0
+                lines.append(f"      {name:<32} evaluated {stats.evaluated:>8}  held {held:>6.1%}  "
+                             f"{stats.seconds * 1000:>8.2f} ms  settled {stats.decided_true} match / {stats.decided_false} no match")
+    idle = [profile for profile in ranked if not profile.examined]
+    if idle:
+        lines += ['', f"{len(idle)} rules examined no events (no corpus event carries their EventIDs)"]
+    if unreachable:
+        lines += ['', f"{len(unreachable)} rules can never fire:"]
+        lines += [f"    {_short(item['title'], 60):<60} {item['reason']}" for item in unreachable]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    base_path = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Rank Sigma rules by evaluation cost and selectivity over a recorded corpus")
+    parser.add_argument("inputs", nargs="*", help="Files, directories or globs of .evtx and JSON exports "
+                                                  f"(default: {' '.join(DEFAULT_INPUTS)})")
+    parser.add_argument("--rules", default=os.path.join(base_path, "needed"), help="Sigma rule directory")
+    parser.add_argument("--mapping", default=os.path.join(base_path, "mappings", "sigma-event-logs-all.yml"))
+    parser.add_argument("--correlations", default=os.path.join(base_path, "correlations"), help="Correlation rule directory")
+    parser.add_argument("--sort", choices=sorted(SORT_KEYS), default="cost", help="Ranking key")
+    parser.add_argument("--top", type=int, help="Show only the first N rules")
+    parser.add_argument("--detail", action="store_true", help="Per-selection breakdown under each rule")
+    parser.add_argument("--json", help="Also write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    paths = hunt.find_inputs(args.inputs or [os.path.join(base_path, p) for p in DEFAULT_INPUTS])
+    if not paths:
+        logging.error("No .evtx or JSON inputs found")
+        return 1
+    pack = rulepack.load(args.rules, args.mapping, args.correlations)
+    ranked, unreachable, corpus = profile(pack, read_corpus(paths))
+    ranked.sort(key=SORT_KEYS[args.sort], reverse=True)
+    print(render(ranked, unreachable, corpus, args.top, args.detail))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'corpus': corpus, 'sort': args.sort, 'rules': [p.to_dict() for p in ranked],
+                       'unreachable': unreachable}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+
+import atomic
+
+# Collection cadence. Windows are contiguous: each starts exactly where the
+# previous one ended (persisted across restarts) and ends on a whole second
+# of the wall clock, so nothing is read twice or skipped. Deadlines advance
+# from the previous deadline on the monotonic clock, never from "now", so
+# ticks do not drift; a cycle that overruns one or more deadlines is
+# coalesced into a single catch-up window instead of a backlog of ticks.
+# The interval follows the observed event rate within fixed bounds. Window
+# bounds are timezone-aware UTC, so the hour repeated when daylight saving
+# time ends is collected like any other.
+
+WINDOW_STATE_VERSION = 2
+
+
+class SystemClock:
+    """Wall and monotonic time plus sleeping, as the scheduler sees them."""
+
+    def now(self):
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    def monotonic(self):
+        return time.monotonic()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+class FakeClock:
+    """Deterministic clock for tests: sleeping advances time instantly.
+
+    `advance()` stands in for time spent working inside a cycle.
+    """
+
+    def __init__(self, start=None):
+        self.wall = start or datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        self.elapsed = 0.0
+        self.sleeps = []
+
+    def now(self):
+        return self.wall + datetime.timedelta(seconds=self.elapsed)
+
+    def monotonic(self):
+        return self.elapsed
+
+    def advance(self, seconds):
+        self.elapsed += seconds
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.advance(max(seconds, 0))
+        await asyncio.sleep(0)
+
+
+class Window:
+    __slots__ = ('start', 'end', 'coalesced')
+
+    def __init__(self, start, end, coalesced=0):
+        self.start = start
+        self.end = end
+        # Deadlines folded into this window because the previous cycle overran
+        self.coalesced = coalesced
+
+    @property
+    def seconds(self):
+        return (self.end - self.start).total_seconds()
+
+    def __repr__(self):
+        return f"Window({self.start} -> {self.end}, coalesced={self.coalesced})"
+
+
+class AdaptiveInterval:
+    """Seconds between collections, sized so a window holds about `target_events`.
+
+    A burst shortens the interval at once; when the rate drops it lengthens by
+    at most `growth` per cycle, and an idle window simply multiplies it by
+    `growth`. The result is always within [minimum, maximum].
+    """
+
+    def __init__(self, minimum=10.0, maximum=600.0, target_events=5000, growth=2.0, initial=None):
+        if not 0 < minimum <= maximum:
+            raise ValueError(f"Invalid interval bounds {minimum}..{maximum}")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_events = target_events
+        self.growth = growth
+        self.interval = self._clamp(initial if initial is not None else minimum)
+
+    def _clamp(self, seconds):
+        return min(self.maximum, max(self.minimum, seconds))
+
+    def update(self, events, seconds):
+        if seconds <= 0:
+            return self.interval
+        if events <= 0:
+            desired = self.interval * self.growth
+        else:
+            desired = self.target_events * seconds / events
+            if desired > self.interval:
+                desired = min(desired, self.interval * self.growth)
+        self.interval = self._clamp(desired)
+        return self.interval
+
+
+class Scheduler:
+    """Contiguous collection windows on drift-free, adaptive deadlines.
+
+    Typical use:
+
+        scheduler = Scheduler(AdaptiveInterval(10, 600), state_path='window.json')
+        while True:
+            window = await scheduler.next_window()
+            events = collect(window.start, window.end)
+            scheduler.complete(window, events)
+
+    Synchronous callers sleep for `wait_time()` and then take `window()`,
+    which is None (and pushes the deadline back a second) when it would be empty.
+    """
+
+    def __init__(self, policy, clock=None, state_path=None, max_catchup=None):
+        self.policy = policy
+        self.clock = clock or SystemClock()
+        self.state_path = state_path
+        # Longest window taken after a long stop; older events are left behind
+        self.max_catchup = max_catchup
+        self.deadline = self.clock.monotonic()
+        self.last_end = self._load()
+        self.coalesced = 0
+        self.pending = 0
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            # Version 1 stored naive local time
+            return datetime.datetime.fromisoformat(state['window_end']).astimezone(datetime.timezone.utc)
+        except Exception as e:
+            logging.error(f"Error reading window state {self.state_path}: {str(e)}")
+            return None
+
+    def _save(self):
+        with atomic.replacing(self.state_path, prefix='.window-') as f:
+            json.dump({'version': WINDOW_STATE_VERSION, 'window_end': self.last_end.isoformat()}, f)
+
+    def wait_time(self):
+        return max(0.0, self.deadline - self.clock.monotonic())
+
+    def window(self):
+        """The window from the previous end up to the current whole second, or None if empty."""
+        end = self.clock.now().replace(microsecond=0)
+        start = self.last_end
+        if start is None:
+            start = end - datetime.timedelta(seconds=self.policy.interval)
+        elif self.max_catchup is not None and (end - start).total_seconds() > self.max_catchup:
+            skipped_to = end - datetime.timedelta(seconds=self.max_catchup)
+            logging.warning(f"Collection gap since {start}; catching up from {skipped_to} only")
+            start = skipped_to
+        if end <= start:
+            # Less than a second since the last window, or the wall clock went back
+            self.deadline = self.clock.monotonic() + 1
+            return None
+        return Window(start, end, self.pending)
+
+    async def next_window(self):
+        while True:
+            await self.clock.sleep(self.wait_time())
+            window = self.window()
+            if window is not None:
+                return window
+
+    def complete(self, window, events):
+        """Record the finished window and schedule the next deadline."""
+        self.last_end = window.end
+        if self.state_path:
+            try:
+                self._save()
+            except Exception as e:
+                logging.error(f"Error saving window state {self.state_path}: {str(e)}")
+        interval = self.policy.update(events, window.seconds)
+        self.deadline += interval
+        now = self.clock.monotonic()
+        self.pending = 0
+        if now > self.deadline:
+            # Overran: run once now rather than once per missed deadline
+            self.pending = int((now - self.deadline) // interval) + 1
+            self.coalesced += self.pending
+            self.deadline = now
+        return interval
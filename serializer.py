@@ -0,0 +1,259 @@
+import json
+import logging
+import time
+import uuid
+import zlib
+
+import metrics
+import zdict
+
+# Streaming upload bodies. Events are encoded one at a time into a multipart
+# request that is gzip-compressed as it is produced and sent with chunked
+# transfer encoding, so no batch is ever held as a tree or a single string.
+# Bodies are capped by event count and uncompressed size; a larger backlog
+# becomes several bounded requests. The JSON and XML file exports use the same
+# per-event encoders, so one pass over a stream of events can feed all three.
+# With a preset dictionary (zdict) the body is raw deflate against it instead
+# of gzip, which is what keeps small, frequent batches small.
+
+FORMATS = {
+    'xml': ('xml_file', 'logs.xml', 'application/xml'),
+    'ndjson': ('ndjson_file', 'logs.ndjson', 'application/x-ndjson'),
+}
+
+CHUNK_SIZE = 64 * 1024
+
+SERIALIZE_SECONDS = metrics.STAGE_SECONDS.labels(stage='serialize')
+
+
+def _escape(text):
+    # Same escaping as ElementTree for element text
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+
+def _xml_data(values):
+    # EventData as in the event's own XML: one <Data Name=...> per value
+    parts = []
+    for name, value in values.items():
+        for item in value if isinstance(value, list) else [value]:
+            text = _escape(str(item))
+            parts.append(f'<Data Name="{name}">{text}</Data>' if text else f'<Data Name="{name}" />')
+    return ''.join(parts)
+
+
+def xml_event(log):
+    """One <Event> element, byte-for-byte what ET.tostring() produced for it."""
+    parts = ['<Event>']
+    for key, value in log.items():
+        if isinstance(value, dict):
+            text = _xml_data(value)
+        else:
+            text = _escape(str(value))
+        parts.append(f"<{key}>{text}</{key}>" if text else f"<{key} />")
+    parts.append('</Event>')
+    return ''.join(parts).encode('utf-8')
+
+
+def ndjson_event(log):
+    return json.dumps(log if isinstance(log, dict) else dict(log.items()), default=str).encode('utf-8') + b'\n'
+
+
+ENCODERS = {'xml': xml_event, 'ndjson': ndjson_event}
+
+
+class _Feed:
+    """Shared event iterator with one encoded event of lookahead."""
+
+    def __init__(self, logs, encode):
+        self.logs = iter(logs)
+        self.encode = encode
+        self.pending = None
+
+    def next(self):
+        if self.pending is not None:
+            item, self.pending = self.pending, None
+            return item
+        for log in self.logs:
+            try:
+                return log, self.encode(log)
+            except Exception as e:
+                logging.error(f"Error serializing event: {str(e)}")
+        return None
+
+    def push_back(self, item):
+        self.pending = item
+
+
+class UploadBody:
+    """One bounded multipart request body, produced lazily.
+
+    Iterating the body streams it. The first pass takes events from the shared
+    feed until a limit is reached; later passes (retries) replay the same events.
+    """
+
+    def __init__(self, feed, fields, fmt, compress, max_events, max_bytes, dictionary=None):
+        self._feed = feed
+        self._filled = False
+        self.fields = fields
+        self.fmt = fmt
+        self.compress = compress
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.dictionary = dictionary if compress else None
+        self.events = []
+        self.size = 0
+        self.wire_bytes = 0
+        self.boundary = uuid.uuid4().hex
+        self.headers = {'Content-Type': f"multipart/form-data; boundary={self.boundary}"}
+        if self.dictionary:
+            self.headers['Content-Encoding'] = zdict.ENCODING
+            self.headers[zdict.ID_HEADER] = self.dictionary.id
+        elif compress:
+            self.headers['Content-Encoding'] = 'gzip'
+
+    def __iter__(self):
+        return self._chunks()
+
+    def _payload(self):
+        if self.fmt == 'xml':
+            yield b'<Events>'
+        if self._filled:
+            encode = ENCODERS[self.fmt]
+            for log in self.events:
+                yield encode(log)
+        else:
+            try:
+                while self.max_events is None or len(self.events) < self.max_events:
+                    item = self._feed.next()
+                    if item is None:
+                        break
+                    log, data = item
+                    if self.events and self.max_bytes and self.size + len(data) > self.max_bytes:
+                        self._feed.push_back(item)
+                        break
+                    self.events.append(log)
+                    self.size += len(data)
+                    yield data
+            finally:
+                # An interrupted send still fixes the body to what was taken
+                self._filled = True
+        if self.fmt == 'xml':
+            yield b'</Events>'
+
+    def _parts(self):
+        dash = f"--{self.boundary}\r\n".encode('ascii')
+        for name, value in self.fields.items():
+            yield dash + f'Content-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+        field, filename, content_type = FORMATS[self.fmt]
+        yield dash + (f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                      f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+        yield from self._payload()
+        yield f"\r\n--{self.boundary}--\r\n".encode('ascii')
+
+    def _chunks(self):
+        self.wire_bytes = 0
+        # Encoding and compression time only, not the time spent sending chunks
+        elapsed = 0.0
+        started = time.perf_counter()
+        if self.dictionary:
+            compressor = self.dictionary.compressobj()
+        else:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if self.compress else None
+        buffer = bytearray()
+        for piece in self._parts():
+            buffer += piece
+            if len(buffer) < CHUNK_SIZE:
+                continue
+            data = compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+            buffer.clear()
+            if data:
+                self.wire_bytes += len(data)
+                elapsed += time.perf_counter() - started
+                yield data
+                started = time.perf_counter()
+        data = bytes(buffer)
+        if compressor:
+            data = compressor.compress(data) + compressor.flush()
+        SERIALIZE_SECONDS.observe(elapsed + time.perf_counter() - started)
+        if data:
+            self.wire_bytes += len(data)
+            yield data
+
+
+def upload_bodies(logs, fields, fmt='xml', compress=True, max_events=5000, max_bytes=8 * 1024 * 1024,
+                  dictionary=None):
+    """Split `logs` into streaming request bodies; each must be sent before the next is taken.
+
+    `dictionary` (a zdict.Dictionary) compresses against a preset dictionary
+    the server also has; otherwise `compress` means gzip.
+    """
+    feed = _Feed(logs, ENCODERS[fmt])
+    while True:
+        item = feed.next()
+        if item is None:
+            return
+        feed.push_back(item)
+        yield UploadBody(feed, fields, fmt, compress, max_events, max_bytes, dictionary)
+
+
+class FileExport:
+    """Writes events to a file as they arrive; use as a context manager."""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'wb')
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.file.write(self._end())
+        finally:
+            self.file.close()
+
+    def write(self, log):
+        self.file.write(self._encode(log))
+        self.count += 1
+
+
+class JsonExport(FileExport):
+    """The same bytes as json.dump(logs, f, indent=4), one event at a time."""
+
+    def _encode(self, log):
+        text = json.dumps(log if isinstance(log, dict) else dict(log.items()), indent=4, default=str)
+        return (b'[\n    ' if not self.count else b',\n    ') + text.replace('\n', '\n    ').encode('utf-8')
+
+    def _end(self):
+        return b'\n]' if self.count else b'[]'
+
+
+class XmlExport(FileExport):
+    """The same bytes as ElementTree(<Events>).write(path), one event at a time."""
+
+    def _encode(self, log):
+        data = xml_event(log).decode('utf-8').encode('us-ascii', 'xmlcharrefreplace')
+        return data if self.count else b'<Events>' + data
+
+    def _end(self):
+        return b'</Events>' if self.count else b'<Events />'
+
+
+def exporting(logs, *exports):
+    """Pass `logs` through, writing each event to every export on the way.
+
+    A failed write is raised rather than skipped: an export missing events or
+    cut short must not be taken as complete.
+    """
+    for log in logs:
+        for export in exports:
+            export.write(log)
+        yield log
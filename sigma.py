@@ -0,0 +1,779 @@
+import base64
+import datetime
+import glob
+import ipaddress
+import logging
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+
+import yaml
+
+import metrics
+import multimatch
+
+# In-process Sigma engine. Rules are parsed and compiled once, then every
+# collected event is matched in memory. Hits are emitted in the same JSON
+# layout as `chainsaw hunt --json` so upload_chainsaw_results() keeps working.
+
+EVENT_NS = "http://schemas.microsoft.com/win/2004/08/events/event"
+
+# Attribute-only System elements and the attribute Chainsaw compares against.
+ATTRIBUTE_VALUES = {
+    'Provider': 'Name',
+    'TimeCreated': 'SystemTime',
+    'Execution': 'ProcessID',
+}
+
+# Chainsaw normalises Sigma levels and statuses to its own vocabulary.
+LEVELS = {'informational': 'info'}
+STATUSES = {'test': 'experimental'}
+
+CONDITION_TOKEN = re.compile(r'\s*(\(|\)|[^\s()]+)')
+CONDITION_KEYWORDS = ('and', 'or', 'not', 'of', '(', ')')
+WILDCARD = re.compile(r'\\\\|\\\*|\\\?|\*|\?')
+DECIMAL = re.compile(r'[-+]?[0-9]+')
+
+# One event in this many has each of its candidate rules timed individually
+RULE_TIMING_SAMPLE = 256
+RULE_SECONDS = metrics.histogram('sigma_rule_eval_seconds', 'Time to evaluate one rule against one event (sampled)', ('rule',))
+
+
+class _RuleLoader(yaml.SafeLoader):
+    pass
+
+
+def _construct_int(loader, node):
+    # Keep hex access masks and the like as written (`AccessMask: 0x10000`).
+    value = loader.construct_scalar(node)
+    if DECIMAL.fullmatch(value):
+        return int(value)
+    return value
+
+
+_RuleLoader.add_constructor('tag:yaml.org,2002:int', _construct_int)
+
+
+def load_yaml(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=_RuleLoader)
+
+
+def load_mapping(path):
+    raw = load_yaml(path)
+    group = raw['groups'][0]
+    fields = {}
+    for field in group.get('fields', []):
+        fields[field['from']] = tuple(field['to'].split('.'))
+    return {
+        'name': group.get('name', 'Sigma'),
+        'exclusions': set(raw.get('exclusions') or []),
+        'preconditions': (raw.get('extensions') or {}).get('preconditions') or [],
+        'fields': fields,
+        'timestamp': tuple(group.get('timestamp', 'Event.System.TimeCreated').split('.')),
+    }
+
+
+def load_rules(rules_path):
+    rules = []
+    paths = sorted(glob.glob(os.path.join(rules_path, '**', '*.yml'), recursive=True))
+    for path in paths:
+        try:
+            rule = load_yaml(path)
+        except Exception as e:
+            logging.error(f"Error loading Sigma rule {path}: {str(e)}")
+            continue
+        if isinstance(rule, dict) and 'detection' in rule:
+            rules.append((path, rule))
+    return rules
+
+
+def resolve(document, path):
+    value = document
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        if key in value:
+            value = value[key]
+            continue
+        attributes = value.get(f"{key}_attributes")
+        if isinstance(attributes, dict):
+            value = attributes.get(ATTRIBUTE_VALUES.get(key, 'Name'))
+            continue
+        return None
+    return value
+
+
+def field_path(mapping, field):
+    path = mapping['fields'].get(field)
+    if path is None:
+        path = ('Event', 'EventData', field)
+    return path
+
+
+def to_text(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+# -- value matching ---------------------------------------------------------
+
+def wildcard_regex(value):
+    # Translate a Sigma wildcard string (`*`, `?`, backslash escapes) to a regex.
+    parts = []
+    position = 0
+    for match in WILDCARD.finditer(value):
+        parts.append(re.escape(value[position:match.start()]))
+        token = match.group()
+        if token == '*':
+            parts.append('.*')
+        elif token == '?':
+            parts.append('.')
+        else:
+            parts.append(re.escape(token[1]))
+        position = match.end()
+    parts.append(re.escape(value[position:]))
+    return ''.join(parts)
+
+
+def has_wildcard(value):
+    return any(token in ('*', '?') for token in WILDCARD.findall(value))
+
+
+def unescape(value):
+    return WILDCARD.sub(lambda m: m.group()[1] if len(m.group()) == 2 else m.group(), value)
+
+
+def base64_offsets(value):
+    data = value.encode('utf-8')
+    variants = []
+    for offset in range(3):
+        encoded = base64.b64encode(b' ' * offset + data).decode('ascii')
+        start = (0, 2, 3)[offset]
+        end = (None, -3, -2)[(len(data) + offset) % 3]
+        variants.append(encoded[start:end])
+    return variants
+
+
+def compile_pattern(value, modifiers):
+    """Return a predicate over one (lower-cased) field string."""
+    if 're' in modifiers:
+        regex = re.compile(value)
+        return lambda text, raw: regex.search(raw) is not None
+
+    if 'cidr' in modifiers:
+        network = ipaddress.ip_network(value, strict=False)
+
+        def match_cidr(text, raw):
+            try:
+                return ipaddress.ip_address(raw) in network
+            except ValueError:
+                return False
+        return match_cidr
+
+    position = 'eq'
+    for modifier in ('contains', 'startswith', 'endswith'):
+        if modifier in modifiers:
+            position = modifier
+
+    if has_wildcard(value):
+        body = wildcard_regex(value)
+        if position == 'contains':
+            regex = re.compile(body, re.IGNORECASE | re.DOTALL)
+            return lambda text, raw: regex.search(raw) is not None
+        if position == 'startswith':
+            regex = re.compile(body, re.IGNORECASE | re.DOTALL)
+            return lambda text, raw: regex.match(raw) is not None
+        if position == 'endswith':
+            regex = re.compile(f"(?:{body})\\Z", re.IGNORECASE | re.DOTALL)
+            return lambda text, raw: regex.search(raw) is not None
+        regex = re.compile(body, re.IGNORECASE | re.DOTALL)
+        return lambda text, raw: regex.fullmatch(raw) is not None
+
+    needle = unescape(value).lower()
+    if position == 'contains':
+        return lambda text, raw: needle in text
+    if position == 'startswith':
+        return lambda text, raw: text.startswith(needle)
+    if position == 'endswith':
+        return lambda text, raw: text.endswith(needle)
+    return lambda text, raw: text == needle
+
+
+def shared_position(modifiers):
+    # The multimatch position a modifier set can be served from, if any
+    if modifiers & {'re', 'cidr'}:
+        return None
+    positions = [p for p in multimatch.POSITIONS if p in modifiers]
+    if len(positions) != 1 or modifiers - {positions[0], 'all', 'base64offset'}:
+        return None
+    return positions[0]
+
+
+def compile_field(mapping, key, values, patterns=None):
+    parts = key.split('|')
+    field, modifiers = parts[0], set(parts[1:])
+    path = field_path(mapping, field)
+    if not isinstance(values, list):
+        values = [values]
+
+    if any(value is None for value in values):
+        others = compile_field(mapping, key, [v for v in values if v is not None], patterns) if len(values) > 1 else None
+
+        def match_null(document):
+            value = resolve(document, path)
+            if value is None or value == '':
+                return True
+            return others(document) if others else False
+        return match_null
+
+    expanded = []
+    for value in values:
+        value = to_text(value)
+        if 'base64offset' in modifiers:
+            expanded.extend(base64_offsets(value))
+        else:
+            expanded.append(value)
+
+    require_all = 'all' in modifiers
+    plain = not (modifiers - {'all'}) and not any(has_wildcard(v) for v in expanded)
+    if plain and not require_all:
+        # Plain equality against a set of values is the common EventID case.
+        choices = frozenset(unescape(v).lower() for v in expanded)
+
+        def match_equal(document):
+            value = resolve(document, path)
+            if value is None:
+                return False
+            if isinstance(value, list):
+                return any(to_text(v).lower() in choices for v in value)
+            return to_text(value).lower() in choices
+        return match_equal
+
+    combine = all if require_all else any
+    position = shared_position(modifiers) if patterns is not None else None
+    if position is None:
+        predicates = [compile_pattern(value, modifiers) for value in expanded]
+
+        def match_patterns(document):
+            value = resolve(document, path)
+            if value is None:
+                return False
+            candidates = value if isinstance(value, list) else [value]
+            for candidate in candidates:
+                raw = to_text(candidate)
+                text = raw.lower()
+                if combine(predicate(text, raw) for predicate in predicates):
+                    return True
+            return False
+        return match_patterns
+
+    # Plain needles are answered by the field's shared pattern set; only
+    # wildcard values still need a predicate of their own
+    shared = patterns.get(path, position)
+    needle_ids = frozenset(shared.add(unescape(v)) for v in expanded if not has_wildcard(v))
+    predicates = [compile_pattern(v, modifiers) for v in expanded if has_wildcard(v)]
+    if not predicates and not require_all:
+        def match_any(document):
+            value = resolve(document, path)
+            if value is None:
+                return False
+            if isinstance(value, list):
+                return any(not needle_ids.isdisjoint(shared.scan(to_text(v))) for v in value)
+            return not needle_ids.isdisjoint(shared.scan(to_text(value)))
+        return match_any
+
+    def match_shared(document):
+        value = resolve(document, path)
+        if value is None:
+            return False
+        candidates = value if isinstance(value, list) else [value]
+        for candidate in candidates:
+            raw = to_text(candidate)
+            found = shared.scan(raw)
+            if require_all:
+                if needle_ids <= found and all(predicate(raw.lower(), raw) for predicate in predicates):
+                    return True
+            elif not needle_ids.isdisjoint(found) or any(predicate(raw.lower(), raw) for predicate in predicates):
+                return True
+        return False
+    return match_shared
+
+
+def compile_keywords(keywords):
+    needles = [unescape(to_text(k)).lower() for k in keywords]
+
+    def match_keywords(document):
+        data = resolve(document, ('Event', 'EventData')) or {}
+        values = data.values() if isinstance(data, dict) else [data]
+        for value in values:
+            text = to_text(value).lower()
+            if any(needle in text for needle in needles):
+                return True
+        return False
+    return match_keywords
+
+
+def compile_selection(mapping, selection, patterns=None):
+    if isinstance(selection, list):
+        if selection and all(not isinstance(item, dict) for item in selection):
+            return compile_keywords(selection)
+        branches = [compile_selection(mapping, item, patterns) for item in selection]
+        return lambda document: any(branch(document) for branch in branches)
+    if isinstance(selection, dict):
+        checks = [compile_field(mapping, key, values, patterns) for key, values in selection.items()]
+        return lambda document: all(check(document) for check in checks)
+    return compile_keywords([selection])
+
+
+def selection_event_ids(selection):
+    # EventIDs a selection can match, or None when it is not constrained.
+    if isinstance(selection, list):
+        if not selection or not all(isinstance(item, dict) for item in selection):
+            return None
+        ids = set()
+        for item in selection:
+            item_ids = selection_event_ids(item)
+            if item_ids is None:
+                return None
+            ids |= item_ids
+        return ids
+    if isinstance(selection, dict) and 'EventID' in selection:
+        values = selection['EventID']
+        values = values if isinstance(values, list) else [values]
+        try:
+            return {int(v) for v in values}
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+# -- condition grammar ------------------------------------------------------
+
+def parse_condition(text):
+    tokens = CONDITION_TOKEN.findall(text)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        token = tokens[position]
+        position += 1
+        return token
+
+    def parse_or():
+        node = parse_and()
+        while peek() == 'or':
+            take()
+            node = ('or', node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_not()
+        while peek() == 'and':
+            take()
+            node = ('and', node, parse_not())
+        return node
+
+    def parse_not():
+        if peek() == 'not':
+            take()
+            return ('not', parse_not())
+        return parse_atom()
+
+    def parse_atom():
+        token = peek()
+        if token is None:
+            raise ValueError(f"Unexpected end of condition: {text}")
+        if token == '(':
+            take()
+            node = parse_or()
+            if peek() != ')':
+                raise ValueError(f"Unbalanced parentheses in condition: {text}")
+            take()
+            return node
+        take()
+        if peek() == 'of':
+            take()
+            quantifier = 'all' if token == 'all' else 'any'
+            if token not in ('1', 'any', 'all'):
+                raise ValueError(f"Unsupported quantifier '{token}' in condition: {text}")
+            return ('of', quantifier, take())
+        if token in CONDITION_KEYWORDS:
+            raise ValueError(f"Unexpected '{token}' in condition: {text}")
+        return ('ref', token)
+
+    node = parse_or()
+    if peek() is not None:
+        raise ValueError(f"Trailing tokens in condition: {text}")
+    return node
+
+
+def expand_names(pattern, names):
+    if pattern == 'them':
+        return [name for name in names if not name.startswith('_')]
+    if pattern.endswith('*'):
+        prefix = pattern[:-1]
+        return [name for name in names if name.startswith(prefix)]
+    return [pattern] if pattern in names else []
+
+
+def compile_condition(node, selections):
+    kind = node[0]
+    if kind == 'ref':
+        if node[1] not in selections:
+            raise ValueError(f"Unknown selection '{node[1]}'")
+        return selections[node[1]]
+    if kind == 'not':
+        inner = compile_condition(node[1], selections)
+        return lambda document: not inner(document)
+    if kind in ('and', 'or'):
+        left = compile_condition(node[1], selections)
+        right = compile_condition(node[2], selections)
+        if kind == 'and':
+            return lambda document: left(document) and right(document)
+        return lambda document: left(document) or right(document)
+    members = [selections[name] for name in expand_names(node[2], selections)]
+    if not members:
+        raise ValueError(f"No selections match '{node[2]}'")
+    if node[1] == 'all':
+        return lambda document: all(member(document) for member in members)
+    return lambda document: any(member(document) for member in members)
+
+
+def condition_event_ids(node, selection_ids):
+    kind = node[0]
+    if kind == 'ref':
+        return selection_ids.get(node[1])
+    if kind == 'not':
+        return None
+    if kind == 'of':
+        sets = [selection_ids.get(name) for name in expand_names(node[2], selection_ids)]
+        kind = 'and' if node[1] == 'all' else 'or'
+    else:
+        sets = [condition_event_ids(node[1], selection_ids), condition_event_ids(node[2], selection_ids)]
+    if kind == 'and':
+        constrained = [ids for ids in sets if ids is not None]
+        if not constrained:
+            return None
+        return set.intersection(*constrained)
+    if any(ids is None for ids in sets):
+        return None
+    return set().union(*sets)
+
+
+# -- preconditions ----------------------------------------------------------
+
+def compile_precondition_filter(mapping, spec):
+    if isinstance(spec, list):
+        branches = [compile_precondition_filter(mapping, item) for item in spec]
+        return lambda document: any(branch(document) for branch in branches)
+    checks = []
+    for key, values in spec.items():
+        cast_int = key.startswith('int(') and key.endswith(')')
+        field = key[4:-1] if cast_int else key
+        path = field_path(mapping, field)
+        values = values if isinstance(values, list) else [values]
+        if '*' in values:
+            checks.append(lambda document, path=path: resolve(document, path) is not None)
+            continue
+        if cast_int:
+            wanted = frozenset(int(v) for v in values)
+            checks.append(lambda document, path=path, wanted=wanted: _as_int(resolve(document, path)) in wanted)
+        else:
+            wanted = frozenset(to_text(v).lower() for v in values)
+            checks.append(lambda document, path=path, wanted=wanted: to_text(resolve(document, path)).lower() in wanted)
+    return lambda document: all(check(document) for check in checks)
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def precondition_applies(precondition, rule):
+    logsource = rule.get('logsource') or {}
+    for key, expected in precondition['for'].items():
+        if key.startswith('logsource.'):
+            actual = logsource.get(key.split('.', 1)[1])
+        else:
+            actual = rule.get(key)
+        if actual is None or str(actual).lower() != str(expected).lower():
+            return False
+    return True
+
+
+def precondition_event_ids(spec):
+    specs = spec if isinstance(spec, list) else [spec]
+    ids = set()
+    for item in specs:
+        values = item.get('int(EventID)')
+        if values is None:
+            return None
+        values = values if isinstance(values, list) else [values]
+        ids |= {int(v) for v in values}
+    return ids
+
+
+# -- rules ------------------------------------------------------------------
+
+def split_authors(author):
+    if not author:
+        return []
+    if isinstance(author, list):
+        return [str(a) for a in author]
+    return [a.strip() for a in str(author).split(',') if a.strip()]
+
+
+def rule_condition(condition):
+    if isinstance(condition, list):
+        condition = ' or '.join(f"({c})" for c in condition)
+    return parse_condition(condition)
+
+
+class SigmaRule:
+    """One compiled Sigma rule: metadata plus a predicate over event documents."""
+
+    def __init__(self, rule, mapping, path=None, tree=None, patterns=None):
+        self.path = path
+        self.id = rule.get('id')
+        self.name = rule.get('name')
+        self.title = rule.get('title', '')
+        self.level = LEVELS.get(rule.get('level'), rule.get('level'))
+        self.status = STATUSES.get(rule.get('status'), rule.get('status'))
+        self.authors = split_authors(rule.get('author'))
+        self.tags = rule.get('tags') or []
+        self.falsepositives = rule.get('falsepositives') or []
+        self.logsource = rule.get('logsource') or {}
+        self.references = rule.get('references')
+
+        detection = dict(rule['detection'])
+        condition = detection.pop('condition')
+        detection.pop('timeframe', None)
+        if tree is None:
+            tree = rule_condition(condition)
+
+        if patterns is None:
+            patterns = multimatch.PatternTable()
+        selections = {name: compile_selection(mapping, body, patterns) for name, body in detection.items()}
+        self.matcher = compile_condition(tree, selections)
+        self.event_ids = condition_event_ids(
+            tree, {name: selection_event_ids(body) for name, body in detection.items()})
+
+        self.preconditions = []
+        for precondition in mapping['preconditions']:
+            if precondition_applies(precondition, rule):
+                spec = precondition['filter']
+                self.preconditions.append(compile_precondition_filter(mapping, spec))
+                ids = precondition_event_ids(spec)
+                if ids is not None:
+                    self.event_ids = ids if self.event_ids is None else self.event_ids & ids
+
+    def matches(self, document):
+        for precondition in self.preconditions:
+            if not precondition(document):
+                return False
+        return self.matcher(document)
+
+    def hit(self, document, path, timestamp):
+        hit = {
+            'group': 'Sigma',
+            'kind': 'individual',
+            'document': {
+                'kind': 'evtx',
+                'path': path,
+                'data': document,
+            },
+            'name': self.title,
+            'timestamp': timestamp,
+            'authors': self.authors,
+            'level': self.level,
+            'source': 'sigma',
+            'status': self.status,
+            'falsepositives': self.falsepositives,
+            'id': self.id,
+            'logsource': self.logsource,
+        }
+        if self.references:
+            hit['references'] = self.references
+        hit['tags'] = self.tags
+        return hit
+
+
+class SigmaEngine:
+    """Rule set compiled once at startup and indexed by EventID."""
+
+    def __init__(self, rules, mapping, patterns=None):
+        self.mapping = mapping
+        self.rules = rules
+        # multimatch.PatternTable the rules were compiled against
+        self.patterns = patterns
+        # Optional correlation.Correlator fed with every event's matches
+        self.correlator = None
+        self.timing_countdown = RULE_TIMING_SAMPLE
+        self.rule_seconds = {}
+        self.by_event_id = {}
+        self.unindexed = []
+        for rule in rules:
+            if rule.event_ids is None:
+                self.unindexed.append(rule)
+            else:
+                for event_id in rule.event_ids:
+                    self.by_event_id.setdefault(event_id, []).append(rule)
+
+    @classmethod
+    def from_paths(cls, rules_path, mapping_path, extra_rules=()):
+        mapping = load_mapping(mapping_path)
+        return cls.from_documents(load_rules(rules_path) + list(extra_rules), mapping)
+
+    @classmethod
+    def from_documents(cls, documents, mapping, trees=None):
+        """Compile (path, rule) pairs; `trees` optionally holds pre-parsed conditions."""
+        compiled = []
+        patterns = multimatch.PatternTable()
+        for position, (path, rule) in enumerate(documents):
+            if rule.get('title') in mapping['exclusions']:
+                logging.debug(f"Skipping excluded Sigma rule: {rule.get('title')}")
+                continue
+            try:
+                compiled.append(SigmaRule(rule, mapping, path, trees[position] if trees else None, patterns))
+            except Exception as e:
+                logging.error(f"Error compiling Sigma rule {path}: {str(e)}")
+        unindexed = sum(1 for rule in compiled if rule.event_ids is None)
+        patterns.build()
+        logging.info(f"Compiled {len(compiled)} Sigma rules ({unindexed} not indexed by EventID, "
+                     f"{patterns.stats()['needles']} needles in {len(patterns.sets)} shared pattern sets)")
+        return cls(compiled, mapping, patterns)
+
+    def candidates(self, document):
+        event_id = _as_int(resolve(document, ('Event', 'System', 'EventID')))
+        indexed = self.by_event_id.get(event_id)
+        if indexed is None:
+            return self.unindexed
+        if not self.unindexed:
+            return indexed
+        return indexed + self.unindexed
+
+    def match(self, document):
+        # An inline countdown rather than a Sampler: this runs for every event
+        self.timing_countdown -= 1
+        if not self.timing_countdown:
+            self.timing_countdown = RULE_TIMING_SAMPLE
+            return self._timed_match(document)
+        return [rule for rule in self.candidates(document) if rule.matches(document)]
+
+    def _timed_match(self, document):
+        matched = []
+        for rule in self.candidates(document):
+            started = time.perf_counter()
+            if rule.matches(document):
+                matched.append(rule)
+            elapsed = time.perf_counter() - started
+            series = self.rule_seconds.get(rule)
+            if series is None:
+                series = self.rule_seconds[rule] = RULE_SECONDS.labels(rule=rule.title)
+            series.observe(elapsed)
+        return matched
+
+    def timestamp(self, document):
+        value = resolve(document, self.mapping['timestamp'])
+        return format_timestamp(value)
+
+    def hunt(self, documents, path=''):
+        hits = []
+        for document in documents:
+            matched = self.match(document)
+            if matched:
+                timestamp = self.timestamp(document)
+                correlated = []
+                if self.correlator:
+                    correlated = self.correlator.observe(document, matched, path, timestamp)
+                    matched = [rule for rule in matched if not self.correlator.is_silent(rule)]
+                hits.extend(rule.hit(document, path, timestamp) for rule in matched)
+                hits.extend(correlated)
+        return hits
+
+
+def format_timestamp(value):
+    if not value:
+        return None
+    text = str(value)
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    # Windows renders 7 fractional digits; datetime only keeps microseconds.
+    text = re.sub(r'(\.\d{6})\d+', r'\1', text)
+    try:
+        return datetime.datetime.fromisoformat(text).isoformat()
+    except ValueError:
+        return str(value)
+
+
+# -- rendered event XML -----------------------------------------------------
+
+def _scalar(text):
+    if text is None:
+        return None
+    if DECIMAL.fullmatch(text) and not (len(text.lstrip('-+')) > 1 and text.lstrip('-+').startswith('0')):
+        return int(text)
+    return text
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _element_to_dict(element, target):
+    name = _local(element.tag)
+    children = list(element)
+    if element.attrib:
+        target[f"{name}_attributes"] = {k: _scalar(v) for k, v in element.attrib.items()}
+    if children:
+        value = {}
+        for child in children:
+            _element_to_dict(child, value)
+    else:
+        value = _scalar(element.text.strip()) if element.text and element.text.strip() else None
+        if element.attrib and value is None:
+            return
+    if name in target:
+        if not isinstance(target[name], list):
+            target[name] = [target[name]]
+        target[name].append(value)
+    else:
+        target[name] = value
+
+
+def parse_event_xml(xml_text):
+    """Convert an EvtRender XML string to the Chainsaw `Event.System/EventData` document."""
+    root = ET.fromstring(xml_text)
+    event = {}
+    for section in root:
+        name = _local(section.tag)
+        if name == 'EventData':
+            data = {}
+            unnamed = []
+            for item in section:
+                value = _scalar(item.text) if item.text is not None else None
+                if 'Name' in item.attrib:
+                    data[item.attrib['Name']] = value
+                else:
+                    unnamed.append(value)
+            if unnamed:
+                data['Data'] = unnamed if len(unnamed) > 1 else unnamed[0]
+            event['EventData'] = data or None
+        elif name == 'System':
+            system = {}
+            for child in section:
+                _element_to_dict(child, system)
+            event['System'] = system
+        else:
+            container = {}
+            _element_to_dict(section, container)
+            event.update(container)
+    return {'Event': event, 'Event_attributes': {'xmlns': EVENT_NS}}
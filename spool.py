@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+
+import atomic
+
+# Durable write-ahead spool for uploads. Records are appended to size-rotated
+# segment files as <length><crc32><payload>; a separately persisted read
+# offset marks what has been delivered. Appends are fsynced in batches, a torn
+# tail left by a crash is truncated on open, and when the spool outgrows its
+# disk cap the oldest segments are dropped first. With a codec (a
+# zdict.Dictionaries) JSON records are stored dictionary-compressed; records
+# written without one, or with an older dictionary version, still read back.
+
+HEADER = struct.Struct('<II')
+SEGMENT_SUFFIX = '.seg'
+OFFSET_FILE = 'offset.json'
+
+
+class Spool:
+    """Append-only segment spool with an acknowledged read offset.
+
+    Typical use:
+
+        spool.append_json(record)          # producer
+        spool.flush()                      # end of a producer batch
+        for payload, position in spool.read():
+            deliver(payload)
+            spool.ack(position)            # consumer, after delivery
+    """
+
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, max_bytes=512 * 1024 * 1024,
+                 sync_records=512, sync_interval=1.0, codec=None):
+        self.directory = directory
+        self.codec = codec
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.sync_records = sync_records
+        self.sync_interval = sync_interval
+        self.stats = {'appended': 0, 'acked': 0, 'syncs': 0, 'evicted_segments': 0,
+                      'evicted_bytes': 0, 'corrupt': 0, 'truncated_bytes': 0}
+        os.makedirs(directory, exist_ok=True)
+        self.segments = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                               if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+        if not self.segments:
+            self.segments = [1]
+            open(self._path(1), 'ab').close()
+        self._recover(self.segments[-1])
+        self.position = self._load_offset()
+        self.file = open(self._path(self.segments[-1]), 'ab')
+        self.size = self.file.tell()
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:020d}{SEGMENT_SUFFIX}")
+
+    def _scan(self, segment, offset=0):
+        """Yield (payload, end) for each valid record; stops at the first bad one."""
+        with open(self._path(segment), 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return
+                length, crc = HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    raise ValueError(f"bad record at offset {offset} in segment {segment}")
+                offset += HEADER.size + length
+                yield payload, offset
+
+    def _recover(self, segment):
+        # Cut a partially written record off the tail of the active segment
+        path = self._path(segment)
+        valid = 0
+        try:
+            for _, valid in self._scan(segment):
+                pass
+        except ValueError:
+            pass
+        size = os.path.getsize(path)
+        if size > valid:
+            logging.warning(f"Spool segment {segment} has a torn tail; truncating {size - valid} bytes")
+            self.stats['truncated_bytes'] += size - valid
+            with open(path, 'r+b') as f:
+                f.truncate(valid)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _load_offset(self):
+        path = os.path.join(self.directory, OFFSET_FILE)
+        position = (self.segments[0], 0)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    state = json.load(f)
+                position = (state['segment'], state['offset'])
+            except Exception as e:
+                logging.error(f"Error reading spool offset {path}: {str(e)}")
+        if position[0] < self.segments[0]:
+            # The segment was evicted or removed while we were down
+            position = (self.segments[0], 0)
+        return position
+
+    def _save_offset(self):
+        with atomic.replacing(os.path.join(self.directory, OFFSET_FILE), prefix='.offset-') as f:
+            json.dump({'segment': self.position[0], 'offset': self.position[1]}, f)
+
+    def append(self, payload):
+        self.file.write(HEADER.pack(len(payload), zlib.crc32(payload)))
+        self.file.write(payload)
+        self.size += HEADER.size + len(payload)
+        self.unsynced += 1
+        self.stats['appended'] += 1
+        if self.size >= self.segment_bytes:
+            self._rotate()
+        elif self.unsynced >= self.sync_records or time.monotonic() - self.last_sync >= self.sync_interval:
+            self.flush()
+
+    def append_json(self, record):
+        payload = json.dumps(record, separators=(',', ':'), default=str).encode('utf-8')
+        self.append(self.codec.encode(payload) if self.codec else payload)
+
+    def flush(self):
+        """Make every appended record durable."""
+        if self.unsynced:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+            self.stats['syncs'] += 1
+        self.last_sync = time.monotonic()
+
+    def _rotate(self):
+        self.flush()
+        self.file.close()
+        segment = self.segments[-1] + 1
+        self.segments.append(segment)
+        self.file = open(self._path(segment), 'ab')
+        self.size = 0
+        self._enforce_cap()
+
+    def _enforce_cap(self):
+        total = sum(os.path.getsize(self._path(segment)) for segment in self.segments)
+        while total > self.max_bytes and len(self.segments) > 1:
+            oldest = self.segments.pop(0)
+            size = os.path.getsize(self._path(oldest))
+            os.remove(self._path(oldest))
+            total -= size
+            self.stats['evicted_segments'] += 1
+            self.stats['evicted_bytes'] += size
+            logging.warning(f"Spool over its {self.max_bytes} byte cap; dropped segment {oldest} ({size} bytes)")
+            if self.position[0] <= oldest:
+                self.position = (self.segments[0], 0)
+                self._save_offset()
+
+    def read(self, max_records=5000, max_bytes=8 * 1024 * 1024):
+        """Return up to `max_records` undelivered (payload, position) pairs in order."""
+        self.file.flush()
+        records = []
+        size = 0
+        segment, offset = self.position
+        for segment in [s for s in self.segments if s >= segment]:
+            try:
+                for payload, end in self._scan(segment, offset):
+                    records.append((payload, (segment, end)))
+                    size += len(payload)
+                    if len(records) >= max_records or size >= max_bytes:
+                        return records
+            except ValueError as e:
+                # Only a crash can leave a bad record and that is cut on open,
+                # so this is corruption; skip the rest of the segment
+                self.stats['corrupt'] += 1
+                logging.error(f"Spool corruption, skipping rest of segment: {str(e)}")
+                if segment == self.segments[-1]:
+                    return records
+                if not records:
+                    self.ack((segment + 1, 0))
+            offset = 0
+        return records
+
+    def read_json(self, max_records=5000, max_bytes=8 * 1024 * 1024):
+        records = self.read(max_records, max_bytes)
+        if self.codec is not None:
+            return [(json.loads(self.codec.decode(payload)), position) for payload, position in records]
+        return [(json.loads(payload), position) for payload, position in records]
+
+    def ack(self, position):
+        """Mark everything up to `position` as delivered and drop finished segments."""
+        if position <= self.position:
+            return
+        self.position = position
+        self.stats['acked'] += 1
+        while len(self.segments) > 1 and self.segments[0] < self.position[0]:
+            os.remove(self._path(self.segments.pop(0)))
+        self._save_offset()
+
+    def pending_bytes(self):
+        segment, offset = self.position
+        total = -offset
+        for s in self.segments:
+            if s >= segment:
+                total += self.size if s == self.segments[-1] else os.path.getsize(self._path(s))
+        return max(total, 0)
+
+    def close(self):
+        self.flush()
+        self.file.close()
@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+import atomic
+
+
+def test_write_replaces_the_file(tmp_path):
+    path = tmp_path / 'state.json'
+    atomic.write(str(path), '{"a": 1}')
+    atomic.write(str(path), b'{"a": 2}')
+    assert path.read_bytes() == b'{"a": 2}'
+    assert os.listdir(tmp_path) == ['state.json']
+
+
+def test_failed_write_keeps_the_old_file(tmp_path):
+    path = tmp_path / 'state.json'
+    atomic.write(str(path), 'old')
+    with pytest.raises(RuntimeError):
+        with atomic.replacing(str(path), prefix='.state-') as f:
+            f.write('new')
+            raise RuntimeError("interrupted")
+    assert path.read_text() == 'old'
+    assert os.listdir(tmp_path) == ['state.json']
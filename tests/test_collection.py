@@ -0,0 +1,114 @@
+import json
+
+import collection
+
+
+class StrictSource(collection.FileEventSource):
+    """Raises on a read past the newest record, as EVENTLOG_SEEK_READ can."""
+
+    def read_forward(self, start, limit):
+        _, newest = self.bounds()
+        if newest is None or start > newest:
+            raise OSError(f"seek to record {start} past the end of the log")
+        return super().read_forward(start, limit)
+
+
+def write_log(path, numbers):
+    with open(path, 'w') as f:
+        for number in numbers:
+            f.write(json.dumps({'RecordNumber': number, 'EventID': 4624}) + "\n")
+
+
+def collect(collector):
+    numbers = [record['RecordNumber'] for batch in collector.batches() for record in batch]
+    collector.commit()
+    return numbers
+
+
+def make_collector(tmp_path, start_at='oldest', batch_size=3):
+    source = StrictSource(str(tmp_path / 'Security.ndjson'))
+    cursors = collection.CursorStore(str(tmp_path / 'cursors.json'))
+    return collection.IncrementalCollector(source, cursors, batch_size, start_at)
+
+
+def test_backfill_then_append(tmp_path):
+    write_log(tmp_path / 'Security.ndjson', range(1, 8))
+    collector = make_collector(tmp_path)
+    assert collect(collector) == list(range(1, 8))
+    assert collector.first == 1 and collector.position == 7
+
+    write_log(tmp_path / 'Security.ndjson', range(1, 11))
+    assert collect(collector) == [8, 9, 10]
+    assert collector.cursors.get('Security') == 10
+
+
+def test_caught_up_reads_nothing(tmp_path):
+    write_log(tmp_path / 'Security.ndjson', range(1, 7))
+    collector = make_collector(tmp_path)
+    # Six records in batches of three end exactly on the newest record
+    assert collect(collector) == list(range(1, 7))
+    assert collect(collector) == []
+    assert collector.position is None
+
+
+def test_first_run_starts_at_end(tmp_path):
+    write_log(tmp_path / 'Security.ndjson', range(1, 6))
+    collector = make_collector(tmp_path, start_at='end')
+    assert collect(collector) == []
+    assert collector.cursors.get('Security') == 5
+
+    write_log(tmp_path / 'Security.ndjson', range(1, 8))
+    assert collect(collector) == [6, 7]
+
+
+def test_cursor_survives_restart(tmp_path):
+    write_log(tmp_path / 'Security.ndjson', range(1, 5))
+    assert collect(make_collector(tmp_path)) == [1, 2, 3, 4]
+    write_log(tmp_path / 'Security.ndjson', range(1, 7))
+    assert collect(make_collector(tmp_path)) == [5, 6]
+
+
+def test_uncommitted_batch_is_read_again(tmp_path):
+    write_log(tmp_path / 'Security.ndjson', range(1, 5))
+    collector = make_collector(tmp_path)
+    assert [record['RecordNumber'] for batch in collector.batches() for record in batch] == [1, 2, 3, 4]
+    assert collect(collector) == [1, 2, 3, 4]
+
+
+def test_clear_restarts_at_oldest(tmp_path):
+    write_log(tmp_path / 'Security.ndjson', range(1, 10))
+    collector = make_collector(tmp_path)
+    assert collect(collector) == list(range(1, 10))
+
+    # Cleared: numbering starts over below the cursor
+    write_log(tmp_path / 'Security.ndjson', range(1, 4))
+    assert collect(collector) == [1, 2, 3]
+    assert collector.lost == 0
+
+
+def test_wrap_counts_overwritten_records(tmp_path):
+    write_log(tmp_path / 'Security.ndjson', range(1, 5))
+    collector = make_collector(tmp_path)
+    assert collect(collector) == [1, 2, 3, 4]
+
+    # Records 5-9 were written and overwritten before the next run
+    write_log(tmp_path / 'Security.ndjson', range(10, 14))
+    assert collect(collector) == [10, 11, 12, 13]
+    assert collector.lost == 5
+
+
+def test_wrap_without_loss_continues(tmp_path):
+    write_log(tmp_path / 'Security.ndjson', range(1, 5))
+    collector = make_collector(tmp_path)
+    assert collect(collector) == [1, 2, 3, 4]
+
+    # The head was overwritten, but only records already collected
+    write_log(tmp_path / 'Security.ndjson', range(4, 9))
+    assert collect(collector) == [5, 6, 7, 8]
+    assert collector.lost == 0
+
+
+def test_empty_log(tmp_path):
+    collector = make_collector(tmp_path)
+    assert collect(collector) == []
+    assert collector.cursors.get('Security') is None
@@ -0,0 +1,46 @@
+import marshal
+import zlib
+
+import eventstore
+
+
+def make_logs(count, account='jdoe'):
+    return [{'TimeGenerated': f'2025-01-01 10:00:{second:02d}', 'EventID': 4625, 'SourceName': 'Security',
+             'EventType': 'Audit Failure', 'EventCategory': 12544,
+             'Message': f'Account Name:\t{account}\nSource Network Address:\t203.0.113.7'}
+            for second in range(count)]
+
+
+def test_blocks_round_trip(tmp_path):
+    store = eventstore.EventStore(str(tmp_path))
+    assert store.append(make_logs(5)) == 5
+    store.flush()
+    events = list(store.query(account='JDoe', address='203.0.113.7'))
+    assert [e['TimeGenerated'] for e in events] == [f'2025-01-01 10:00:{s:02d}' for s in range(5)]
+    assert events[0]['EventCategory'] == 12544
+
+
+def test_channel_names_are_normalised(tmp_path):
+    store = eventstore.EventStore(str(tmp_path))
+    # As taken from the prefix of security_logs_*.json
+    store.append(make_logs(2), 'security')
+    store.append(make_logs(1), 'Microsoft-Windows-Sysmon/Operational')
+    store.flush()
+    assert store.channels() == ['Microsoft-Windows-Sysmon%4Operational', 'Security']
+    assert len(list(store.query())) == 2
+    assert len(list(store.query(channel='SECURITY'))) == 2
+    assert len(list(store.query(channel='Microsoft-Windows-Sysmon/Operational'))) == 1
+
+
+def test_marshal_blocks_are_still_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(eventstore, 'MAGIC', eventstore.LEGACY_MAGIC)
+    monkeypatch.setattr(eventstore, 'encode_block', lambda items: zlib.compress(marshal.dumps(items), 6))
+    store = eventstore.EventStore(str(tmp_path))
+    store.append(make_logs(3))
+    store.flush()
+    monkeypatch.undo()
+
+    store.append(make_logs(2, account='asmith'))
+    store.flush()
+    assert len(list(store.query())) == 5
+    assert len(list(store.query(account='asmith'))) == 2
@@ -0,0 +1,145 @@
+import asyncio
+import datetime
+import json
+import time
+
+import pytest
+
+import scheduler
+
+UTC = datetime.timezone.utc
+
+
+def make_scheduler(clock, tmp_path=None, interval=10.0, **kwargs):
+    policy = scheduler.AdaptiveInterval(interval, interval)
+    state_path = str(tmp_path / 'window.json') if tmp_path else None
+    return scheduler.Scheduler(policy, clock=clock, state_path=state_path, **kwargs)
+
+
+def run_cycles(schedule, clock, work):
+    """Takes one window per entry of `work`, spending that many seconds in each."""
+    async def cycles():
+        windows = []
+        for seconds in work:
+            window = await schedule.next_window()
+            clock.advance(seconds)
+            schedule.complete(window, 0)
+            windows.append(window)
+        return windows
+    return asyncio.run(cycles())
+
+
+def test_windows_are_contiguous_on_drift_free_deadlines():
+    clock = scheduler.FakeClock()
+    schedule = make_scheduler(clock)
+    windows = run_cycles(schedule, clock, [2, 3, 4, 1])
+
+    assert windows[0].start == clock.wall - datetime.timedelta(seconds=10)
+    for previous, window in zip(windows, windows[1:]):
+        assert window.start == previous.end
+    # Work time is absorbed by the sleep; deadlines stay on the 10 s grid
+    assert [w.end for w in windows] == [clock.wall + datetime.timedelta(seconds=s) for s in (0, 10, 20, 30)]
+    assert clock.sleeps == [0.0, 8.0, 7.0, 6.0]
+    assert all(w.coalesced == 0 for w in windows)
+
+
+def test_overrun_is_coalesced_into_one_window():
+    clock = scheduler.FakeClock()
+    schedule = make_scheduler(clock)
+    windows = run_cycles(schedule, clock, [35, 1])
+
+    assert windows[1].coalesced == 3
+    assert windows[1].start == windows[0].end
+    assert windows[1].seconds == 35
+    assert schedule.coalesced == 3
+
+
+def test_window_end_persists_as_utc(tmp_path):
+    clock = scheduler.FakeClock()
+    first = run_cycles(make_scheduler(clock, tmp_path), clock, [1])[0]
+
+    with open(tmp_path / 'window.json') as f:
+        state = json.load(f)
+    assert state['version'] == scheduler.WINDOW_STATE_VERSION
+    assert datetime.datetime.fromisoformat(state['window_end']) == first.end
+
+    clock.advance(100)
+    restarted = make_scheduler(clock, tmp_path)
+    assert restarted.last_end.tzinfo is not None
+    window = run_cycles(restarted, clock, [0])[0]
+    assert window.start == first.end
+    assert window.seconds == 101
+
+
+def test_naive_version_1_state_is_read_as_local_time(tmp_path):
+    with open(tmp_path / 'window.json', 'w') as f:
+        json.dump({'version': 1, 'window_end': '2025-01-01T00:00:00'}, f)
+    schedule = make_scheduler(scheduler.FakeClock(), tmp_path)
+    assert schedule.last_end == datetime.datetime(2025, 1, 1).astimezone(UTC)
+    assert schedule.last_end.tzinfo is not None
+
+
+def test_max_catchup_limits_the_first_window_after_a_stop(tmp_path):
+    clock = scheduler.FakeClock()
+    run_cycles(make_scheduler(clock, tmp_path), clock, [0])
+    clock.advance(3600)
+    window = run_cycles(make_scheduler(clock, tmp_path, max_catchup=600), clock, [0])[0]
+    assert window.seconds == 600
+    assert window.end == clock.wall + datetime.timedelta(seconds=3600)
+
+
+def test_empty_window_pushes_the_deadline_back():
+    clock = scheduler.FakeClock()
+    schedule = make_scheduler(clock)
+    run_cycles(schedule, clock, [0])
+    schedule.deadline = clock.monotonic()
+    assert schedule.window() is None
+    assert schedule.wait_time() == 1
+
+
+@pytest.fixture
+def new_york(monkeypatch):
+    # POSIX rule, so no tz database is needed: clocks go back at 02:00 on 2 November 2025
+    monkeypatch.setenv('TZ', 'EST5EDT,M3.2.0,M11.1.0')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_repeated_hour_is_collected_when_dst_ends(new_york):
+    # 00:30 EDT, an hour and a half before the clocks go back
+    clock = scheduler.FakeClock(datetime.datetime(2025, 11, 2, 4, 30, tzinfo=UTC))
+    schedule = make_scheduler(clock, interval=600)
+    windows = run_cycles(schedule, clock, [0] * 20)
+
+    for previous, window in zip(windows, windows[1:]):
+        assert window.start == previous.end
+        assert window.seconds == 600
+    local_hours = [w.end.astimezone().hour for w in windows]
+    assert local_hours.count(1) == 12
+
+
+def test_generated_time_resolves_the_repeated_hour(new_york):
+    evtx = pytest.importorskip('evtx')
+    # Read newest first: 01:10 EST, 01:50 EDT, 01:10 EDT, 00:50 EDT
+    generated = [datetime.datetime(2025, 11, 2, 1, 10), datetime.datetime(2025, 11, 2, 1, 50),
+                 datetime.datetime(2025, 11, 2, 1, 10), datetime.datetime(2025, 11, 2, 0, 50)]
+    newer = None
+    resolved = []
+    for local in generated:
+        newer = evtx.generated_utc(local, newer)
+        resolved.append(newer.strftime('%H:%M'))
+    assert resolved == ['06:10', '05:50', '05:10', '04:50']
+
+
+def test_adaptive_interval_stays_in_bounds():
+    policy = scheduler.AdaptiveInterval(10, 600, target_events=100)
+    assert policy.update(10000, 60) == 10
+    assert policy.update(0, 10) == 20
+    assert policy.update(1, 20) == 40
+    for _ in range(10):
+        policy.update(0, 600)
+    assert policy.interval == 600
+    with pytest.raises(ValueError):
+        scheduler.AdaptiveInterval(0, 10)
@@ -0,0 +1,173 @@
+import asyncio
+import concurrent.futures
+import logging
+import random
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# Asynchronous uploads. Requests go through one pooled keep-alive session on a
+# small thread pool so they never block the event loop; collectors hand work
+# to a bounded queue and wait when it is full, which slows collection down to
+# what the backend can absorb. Failed requests are retried with exponential
+# backoff and full jitter.
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+REQUEST_SECONDS = metrics.histogram('evtx_http_request_seconds', 'Upload request latency, including streaming the body', ('endpoint',))
+REQUESTS = metrics.counter('evtx_http_requests_total', 'Upload requests by response status', ('endpoint', 'status'))
+RETRIES = metrics.counter('evtx_http_retries_total', 'Upload requests retried after a failure', ('endpoint',))
+UPLOAD_BYTES = metrics.counter('evtx_upload_bytes_total', 'Request body bytes sent on the wire', ('endpoint',))
+
+
+def _counted(chunks, counter):
+    for chunk in chunks:
+        counter.inc(len(chunk))
+        yield chunk
+
+
+class UploadError(Exception):
+    pass
+
+
+class Uploader:
+    """Pooled HTTP client plus a bounded work queue drained by async workers.
+
+    Typical use:
+
+        uploader = Uploader()
+        await uploader.start()
+        await uploader.submit(upload_to_api, logs, access_key)   # waits while the queue is full
+        ...
+        await uploader.close()                                   # drains the queue
+
+    Jobs are coroutine functions; they send their requests with `post()`.
+    """
+
+    def __init__(self, workers=4, queue_size=16, retries=4, backoff=0.5, max_backoff=30.0, timeout=60.0, seed=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+        self.queue = None
+        self.tasks = []
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'jobs': 0, 'job_errors': 0,
+                      'queue_peak': 0, 'blocked_seconds': 0.0}
+
+    def delay(self, attempt):
+        return self.random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _send(self, url, kwargs):
+        kwargs = dict(kwargs)
+        endpoint = urlsplit(url).path or '/'
+        sent = UPLOAD_BYTES.labels(endpoint=endpoint)
+        # A callable body is a replayable stream; take a fresh iterator per attempt
+        if callable(kwargs.get('data')):
+            kwargs['data'] = _counted(kwargs['data'](), sent)
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+        try:
+            response = self.session.post(url, **kwargs)
+        except requests.RequestException:
+            REQUESTS.labels(endpoint=endpoint, status='error').inc()
+            raise
+        finally:
+            REQUEST_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - started)
+        REQUESTS.labels(endpoint=endpoint, status=response.status_code).inc()
+        # Streamed bodies were counted chunk by chunk; json= and form bodies are prepared whole
+        body = response.request.body
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if isinstance(body, bytes):
+            sent.inc(len(body))
+        return response
+
+    async def post(self, url, **kwargs):
+        """POST with retries; returns the last response or raises UploadError."""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            self.stats['requests'] += 1
+            try:
+                response = await loop.run_in_executor(self.executor, self._send, url, kwargs)
+                if response.status_code not in RETRY_STATUS:
+                    return response
+                error = f"status {response.status_code}"
+            except requests.RequestException as e:
+                response = None
+                error = str(e)
+            if attempt == self.retries:
+                break
+            delay = self.delay(attempt)
+            self.stats['retries'] += 1
+            RETRIES.labels(endpoint=urlsplit(url).path or '/').inc()
+            logging.warning(f"Upload to {url} failed ({error}); retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        self.stats['failures'] += 1
+        if response is not None:
+            return response
+        raise UploadError(f"Upload to {url} failed after {self.retries + 1} attempts: {error}")
+
+    async def start(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.queue_size)
+            self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return self
+
+    async def submit(self, job, *args):
+        """Queue `job(*args)`; waits while the queue is full. Returns a future for its result."""
+        if self.queue is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        await self.queue.put((job, args, future))
+        self.stats['blocked_seconds'] += time.perf_counter() - started
+        self.stats['queue_peak'] = max(self.stats['queue_peak'], self.queue.qsize())
+        return future
+
+    async def _worker(self):
+        while True:
+            job, args, future = await self.queue.get()
+            try:
+                result = await job(*args)
+                if not future.cancelled():
+                    future.set_result(result)
+            except Exception as e:
+                self.stats['job_errors'] += 1
+                logging.error(f"Upload job {getattr(job, '__name__', job)} failed: {str(e)}")
+                if not future.cancelled():
+                    future.set_exception(e)
+                    # Nobody may be waiting on it; don't warn about an unretrieved exception
+                    future.exception()
+            finally:
+                self.stats['jobs'] += 1
+                self.queue.task_done()
+
+    @property
+    def depth(self):
+        return self.queue.qsize() if self.queue else 0
+
+    async def join(self):
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def close(self):
+        await self.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.queue = None
+        self.executor.shutdown(wait=True)
+        self.session.close()
@@ -0,0 +1,273 @@
+import collections
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import struct
+import zlib
+
+import atomic
+
+# Preset-dictionary deflate for small event payloads. Rendered Security
+# messages, SIDs, privilege lists and field names repeat across nearly every
+# record, but a small batch is compressed on its own, so gzip has to spell
+# them out once per batch. A dictionary trained on sample records (deflate's
+# 32 KB window) gives every batch that history up front. Loading a dictionary
+# into a compressor costs more than compressing a small batch, so each
+# Dictionary primes one compressor and hands out copies of it. Dictionaries
+# are versioned files named by content digest; the newest compresses and any
+# known version decompresses, so stored records and agents on an older version
+# stay readable.
+
+DICTIONARY_SIZE = 32 * 1024
+LEVEL = 6
+# Upload bodies: Content-Encoding plus the id of the dictionary they need
+ENCODING = 'x-deflate-dictionary'
+ID_HEADER = 'X-Dictionary-Id'
+# Stored records: magic and the first 4 bytes of the dictionary digest, then raw deflate
+FRAME = struct.Struct('<2s4s')
+FRAME_MAGIC = b'\xddZ'
+FILE_NAME = re.compile(r'^events-v(\d+)-([0-9a-f]{8})\.zdict$')
+
+# Training: records are cut at line and field boundaries, both as they are
+# rendered ("\r\n", tabs) and as JSON escapes them ("\\r\\n", "\\t")
+LINES = re.compile(rb'(?<=\r\n)|(?<=\\r\\n)|(?<=>)(?=<)|(?<=",)|(?<=\},)')
+FIELDS = re.compile(rb'(?<=\t)(?!\t)|(?<=\\t)(?!\\t)|(?<=":)|(?<=">)')
+MIN_PIECE = 6
+
+
+class Dictionary:
+    def __init__(self, data, version=0):
+        self.data = bytes(data[-DICTIONARY_SIZE:])
+        self.version = version
+        self.digest = hashlib.sha256(self.data).digest()[:4]
+        self.id = self.digest.hex()
+        self._primed = {}
+
+    @property
+    def filename(self):
+        return f"events-v{self.version}-{self.id}.zdict"
+
+    def compressobj(self, level=LEVEL):
+        primed = self._primed.get(level)
+        if primed is None:
+            primed = self._primed[level] = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=self.data)
+        # The primed compressor is never written to, so copies can be taken from any thread
+        return primed.copy()
+
+    def decompressobj(self):
+        return zlib.decompressobj(-15, zdict=self.data)
+
+    def compress(self, payload, level=LEVEL):
+        compressor = self.compressobj(level)
+        return compressor.compress(payload) + compressor.flush()
+
+    def decompress(self, data):
+        decompressor = self.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    def __repr__(self):
+        return f"Dictionary(v{self.version}, {self.id}, {len(self.data)} bytes)"
+
+
+def is_framed(data):
+    return data[:2] == FRAME_MAGIC
+
+
+class Dictionaries:
+    """Every dictionary version in a folder.
+
+    Typical use:
+
+        dictionaries = Dictionaries('dictionaries')
+        stored = dictionaries.encode(payload)      # framed, newest version
+        payload = dictionaries.decode(stored)      # any version; unframed data passes through
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.by_id = {}
+        self.current = None
+        for path in sorted(glob.glob(os.path.join(folder, '*.zdict'))):
+            match = FILE_NAME.match(os.path.basename(path))
+            if not match:
+                continue
+            with open(path, 'rb') as f:
+                dictionary = Dictionary(f.read(), int(match.group(1)))
+            if dictionary.id != match.group(2):
+                logging.error(f"Skipping dictionary {path}: content does not match its name")
+                continue
+            self.by_id[dictionary.id] = dictionary
+            if self.current is None or dictionary.version > self.current.version:
+                self.current = dictionary
+
+    def __bool__(self):
+        return self.current is not None
+
+    def get(self, dictionary_id):
+        dictionary = self.by_id.get(dictionary_id)
+        if dictionary is None:
+            raise ValueError(f"Unknown compression dictionary {dictionary_id}")
+        return dictionary
+
+    def encode(self, payload):
+        return FRAME.pack(FRAME_MAGIC, self.current.digest) + self.current.compress(payload)
+
+    def decode(self, data):
+        if not is_framed(data):
+            return data
+        _, digest = FRAME.unpack_from(data)
+        return self.get(digest.hex()).decompress(data[FRAME.size:])
+
+    def add(self, data):
+        """Store `data` as the next version and make it current."""
+        version = max((d.version for d in self.by_id.values()), default=0) + 1
+        dictionary = Dictionary(data, version)
+        os.makedirs(self.folder, exist_ok=True)
+        atomic.write(os.path.join(self.folder, dictionary.filename), dictionary.data, prefix='.zdict-')
+        self.by_id[dictionary.id] = dictionary
+        self.current = dictionary
+        return dictionary
+
+
+def _compact_json(value):
+    # As Spool.append_json() stores it
+    return json.dumps(value, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def record_payloads(record):
+    """(kind, bytes) for each form a record is sent and spooled in.
+
+    Events are sent as XML or NDJSON and spooled as JSON; detections are
+    spooled as compact records.
+    """
+    import serializer
+
+    if isinstance(record.get('event'), dict):
+        # Lines stored by the ingest server
+        record = record['event']
+    elif isinstance(record.get('hit'), dict):
+        record = record['hit']
+    if 'Message' in record and 'EventID' in record:
+        return [('xml', serializer.xml_event(record)), ('ndjson', serializer.ndjson_event(record)),
+                ('spool', _compact_json(['log', record]))]
+    if 'document' in record:
+        import results
+
+        record = results.compact(record)
+    return [('detection', _compact_json(['chainsaw', {'hits': [record]}]))]
+
+
+def iter_samples(paths):
+    """Training samples from JSON exports, NDJSON files, Chainsaw results and ingest server files."""
+    import eventstore
+
+    for path in paths:
+        try:
+            for record in eventstore.read_exports(path):
+                if isinstance(record, dict):
+                    yield from record_payloads(record)
+        except Exception as e:
+            logging.error(f"Error reading samples from {path}: {str(e)}")
+
+
+def train(samples, size=DICTIONARY_SIZE):
+    """A preset dictionary of the pieces that save the most bytes across `samples`.
+
+    `samples` are (kind, bytes) pairs. Pieces are the lines and fields of each
+    sample; a piece scores its length times the share of samples of each kind
+    it occurs in, so a kind with few samples (detections) still gets its
+    share of the dictionary. The best pieces go last, where deflate reaches
+    them with the shortest distances.
+    """
+    counts = collections.defaultdict(collections.Counter)
+    totals = collections.Counter()
+    for kind, sample in samples:
+        totals[kind] += 1
+        pieces = set()
+        for line in LINES.split(sample):
+            if len(line) >= MIN_PIECE:
+                pieces.add(line)
+            pieces.update(piece for piece in FIELDS.split(line) if len(piece) >= MIN_PIECE)
+        counts[kind].update(pieces)
+    scores = collections.Counter()
+    for kind, kind_counts in counts.items():
+        for piece, count in kind_counts.items():
+            if count > 1:
+                scores[piece] += count / totals[kind] * (len(piece) - 3)
+    ranked = sorted(((score, piece) for piece, score in scores.items()), reverse=True)
+    chosen = []
+    used = 0
+    joined = b''
+    for _, piece in ranked:
+        if used + len(piece) > size:
+            continue
+        if piece in joined:
+            continue
+        chosen.append(piece)
+        used += len(piece)
+        if len(chosen) % 64 == 0:
+            joined = b''.join(chosen)
+        else:
+            joined += piece
+    logging.info(f"Trained a {used}-byte dictionary from {sum(totals.values())} samples ({len(chosen)} pieces)")
+    return b''.join(reversed(chosen))
+
+
+def ratio(dictionary, samples, batch):
+    """Compressed/raw size of `samples` in batches of `batch`, with and without the dictionary."""
+    raw = plain = preset = 0
+    for start in range(0, len(samples), batch):
+        payload = b''.join(sample for _, sample in samples[start:start + batch])
+        raw += len(payload)
+        plain += len(zlib.compress(payload, LEVEL))
+        preset += len(dictionary.compress(payload))
+    return plain / raw, preset / raw
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train, list and distribute the event compression dictionaries")
+    parser.add_argument("--folder", default="dictionaries", help="Dictionary folder")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train_parser = commands.add_parser("train", help="Train the next dictionary version from sample files")
+    train_parser.add_argument("files", nargs="+", help="security_logs_*.json, json/*.json, output/*.json, *.ndjson")
+    train_parser.add_argument("--size", type=int, default=DICTIONARY_SIZE)
+    train_parser.add_argument("--replay", type=int, default=0,
+                              help="Also train on this many events of the benchmark replay profile")
+    commands.add_parser("list", help="Known versions, newest last")
+    publish = commands.add_parser("publish", help="Copy every version to another folder (e.g. the ingest server's)")
+    publish.add_argument("target")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    dictionaries = Dictionaries(args.folder)
+    if args.command == "train":
+        paths = sorted(path for pattern in args.files for path in glob.glob(pattern))
+        samples = list(iter_samples(paths))
+        if args.replay:
+            import itertools
+
+            from benchmarks.replay import service_noise
+
+            for flat, _ in itertools.islice(service_noise(args.replay), args.replay):
+                samples.extend(record_payloads(flat))
+        if not samples:
+            raise SystemExit("No samples found")
+        dictionary = dictionaries.add(train(samples, args.size))
+        plain, preset = ratio(dictionary, samples, 10)
+        logging.info(f"Wrote {os.path.join(args.folder, dictionary.filename)}; on the training samples in "
+                     f"batches of 10: deflate {plain:.1%}, with the dictionary {preset:.1%} of raw size")
+    elif args.command == "list":
+        for dictionary in sorted(dictionaries.by_id.values(), key=lambda d: d.version):
+            print(f"v{dictionary.version}\t{dictionary.id}\t{len(dictionary.data)} bytes"
+                  f"{' (current)' if dictionary is dictionaries.current else ''}")
+    elif args.command == "publish":
+        os.makedirs(args.target, exist_ok=True)
+        for dictionary in dictionaries.by_id.values():
+            shutil.copy2(os.path.join(args.folder, dictionary.filename), os.path.join(args.target, dictionary.filename))
+        logging.info(f"Published {len(dictionaries.by_id)} dictionaries to {args.target}")